@@ -0,0 +1,176 @@
+"""Running per-string and per-system aggregates.
+
+PanelService feeds every reading through AggregateTracker.update with the
+panel's previous watts and energy, so totals move by deltas instead of being
+re-summed over all panels. Clients get the result as the ``aggregates``
+section of WebSocket frames and from /api/aggregates:
+
+    {"strings": {"A": {"watts": 4210.5, "kwh_today": 12.431, "peak": "A7",
+                       "peak_watts": 318.0, "panels": 14, "reporting": 14}},
+     "systems": {"primary": {...}}}
+
+``kwh_today`` sums increases of each panel's cumulative ``energy`` counter
+since local midnight (or since the first reading after startup). A counter
+that goes backwards is treated as reset and its new value counted as energy.
+"""
+
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from .panel_state import PanelRecord
+
+GROUP_KINDS = ("strings", "systems")
+
+
+class GroupAggregate:
+    """Totals for one string or system, plus its member records for peak lookups."""
+
+    __slots__ = ("members", "watts", "kwh_today", "peak_label", "peak_watts", "reporting")
+
+    def __init__(self):
+        self.members: list[PanelRecord] = []
+        self.watts = 0.0
+        self.kwh_today = 0.0
+        self.peak_label: Optional[str] = None
+        self.peak_watts: Optional[float] = None
+        self.reporting = 0
+
+    def find_peak(self) -> None:
+        """Rescan members for the highest current watts (only when the peak panel drops)."""
+        self.peak_label = None
+        self.peak_watts = None
+        for record in self.members:
+            if record.watts is not None and (self.peak_watts is None or record.watts > self.peak_watts):
+                self.peak_label = record.display_label
+                self.peak_watts = record.watts
+
+    def to_dict(self) -> dict:
+        return {
+            "watts": round(self.watts, 1),
+            "kwh_today": round(self.kwh_today, 3),
+            "peak": self.peak_label,
+            "peak_watts": self.peak_watts,
+            "panels": len(self.members),
+            "reporting": self.reporting,
+        }
+
+
+class AggregateTracker:
+    """Incrementally maintained string and system totals with a cached summary."""
+
+    def __init__(self):
+        self.groups: dict[str, dict[str, GroupAggregate]] = {kind: {} for kind in GROUP_KINDS}
+        # Energy produced today per panel, kept across config reloads
+        self.panel_kwh_today: dict[str, float] = {}
+        self._day: Optional[date] = None
+        self._dirty: set[tuple[str, str]] = set()
+        self._cache: Optional[dict] = None
+
+    def _groups_for(self, record: PanelRecord) -> tuple[GroupAggregate, ...]:
+        return tuple(
+            group for group in (
+                self.groups["strings"].get(record.string),
+                self.groups["systems"].get(record.system),
+            ) if group is not None
+        )
+
+    def _mark_dirty(self, record: PanelRecord) -> None:
+        self._dirty.add(("strings", record.string))
+        self._dirty.add(("systems", record.system))
+        self._cache = None
+
+    def rebuild(self, records: Iterable[PanelRecord]) -> None:
+        """Recompute every group from scratch, e.g. after a config reload."""
+        self.groups = {kind: {} for kind in GROUP_KINDS}
+        records = list(records)
+        for record in records:
+            self.groups["strings"].setdefault(record.string, GroupAggregate()).members.append(record)
+            self.groups["systems"].setdefault(record.system, GroupAggregate()).members.append(record)
+        labels = {record.display_label for record in records}
+        self.panel_kwh_today = {
+            label: kwh for label, kwh in self.panel_kwh_today.items() if label in labels
+        }
+        for kind in GROUP_KINDS:
+            for group in self.groups[kind].values():
+                reporting = [r for r in group.members if r.watts is not None]
+                group.watts = sum(r.watts for r in reporting)
+                group.reporting = len(reporting)
+                group.kwh_today = sum(
+                    self.panel_kwh_today.get(r.display_label, 0.0) for r in group.members
+                )
+                group.find_peak()
+        self._dirty.clear()
+        self._cache = None
+
+    def roll_day(self, now: datetime) -> None:
+        """Reset kWh-today totals when the local date changes."""
+        today = now.astimezone().date()
+        if today == self._day:
+            return
+        if self._day is not None:
+            self.panel_kwh_today.clear()
+            for kind in GROUP_KINDS:
+                for name, group in self.groups[kind].items():
+                    group.kwh_today = 0.0
+                    self._dirty.add((kind, name))
+            self._cache = None
+        self._day = today
+
+    def update(
+        self,
+        record: PanelRecord,
+        old_watts: Optional[float],
+        old_energy: Optional[float],
+        now: datetime,
+    ) -> None:
+        """Apply one panel's change in watts and energy to its string and system."""
+        self.roll_day(now)
+
+        watts_delta = (record.watts or 0.0) - (old_watts or 0.0)
+        reporting_delta = (record.watts is not None) - (old_watts is not None)
+        energy_delta = 0.0
+        if record.energy is not None and old_energy is not None:
+            energy_delta = record.energy - old_energy
+            if energy_delta < 0:
+                # Counter reset (e.g. daily energy rolled over at the source)
+                energy_delta = record.energy
+        if energy_delta:
+            label = record.display_label
+            self.panel_kwh_today[label] = self.panel_kwh_today.get(label, 0.0) + energy_delta
+
+        if not (watts_delta or reporting_delta or energy_delta):
+            return
+
+        for group in self._groups_for(record):
+            group.watts += watts_delta
+            group.reporting += reporting_delta
+            group.kwh_today += energy_delta
+            if record.watts is not None and (group.peak_watts is None or record.watts >= group.peak_watts):
+                group.peak_label = record.display_label
+                group.peak_watts = record.watts
+            elif group.peak_label == record.display_label:
+                group.find_peak()
+        self._mark_dirty(record)
+
+    def snapshot(self, now: Optional[datetime] = None) -> dict:
+        """All aggregates, cached until the next change."""
+        if now is not None:
+            self.roll_day(now)
+        if self._cache is None:
+            self._cache = {
+                kind: {name: group.to_dict() for name, group in self.groups[kind].items()}
+                for kind in GROUP_KINDS
+            }
+        return self._cache
+
+    def drain_changes(self) -> Optional[dict]:
+        """Aggregates for groups changed since the last call, or None if nothing changed."""
+        if not self._dirty:
+            return None
+        changed: dict[str, dict] = {}
+        for kind, name in self._dirty:
+            group = self.groups[kind].get(name)
+            if group is not None:
+                changed.setdefault(kind, {})[name] = group.to_dict()
+        self._dirty.clear()
+        return changed or None
@@ -0,0 +1,86 @@
+"""Drop repeated node readings before they reach PanelService.
+
+taptap-mqtt republishes the full ``nodes`` map of a CCA on every update
+interval, and most nodes repeat the reading they sent last time (always at
+night, and after a reconnect when retained state is re-sent). NodeChangeFilter
+fingerprints each node's reading - its timestamp plus every value PanelService
+applies - and drops it if the fingerprint matches the last one passed for
+that node, so exact repeats cost neither a panel update nor a broadcast.
+
+A repeat is still let through once ``refresh_seconds`` have passed since the
+node last got through, so a CCA that keeps publishing the same reading does
+not see its panels flip to stale (FR-2.6).
+"""
+
+import time
+from typing import Optional
+
+# Node fields that PanelService.apply_state reads
+FINGERPRINT_FIELDS = (
+    "timestamp", "power", "voltage_in", "voltage_out", "current_in", "current_out",
+    "temperature", "duty_cycle", "rssi", "energy", "state_online", "node_id",
+)
+
+
+class SystemCounts:
+    """Per-CCA totals of node readings seen and dropped as duplicates."""
+
+    __slots__ = ("received", "duplicates")
+
+    def __init__(self):
+        self.received = 0
+        self.duplicates = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "duplicate_ratio": round(self.duplicates / self.received, 3) if self.received else 0.0,
+        }
+
+
+class NodeChangeFilter:
+    """Remember the last passed fingerprint per (system, serial) and drop exact repeats."""
+
+    def __init__(self, refresh_seconds: float = 150.0):
+        self.refresh_seconds = refresh_seconds
+        # (system, node_serial) -> (fingerprint, monotonic time it last passed)
+        self._last: dict[tuple[Optional[str], str], tuple[tuple, float]] = {}
+        self.counts: dict[str, SystemCounts] = {}
+
+    def filter(self, nodes: dict, system: Optional[str], now: Optional[float] = None) -> dict:
+        """Return the subset of a state payload's ``nodes`` that changed.
+
+        Entries without a ``node_serial`` (or that aren't dicts) are passed
+        through untouched for the downstream validation to handle.
+        """
+        now = time.monotonic() if now is None else now
+        counts = self.counts.get(system or "unknown")
+        if counts is None:
+            counts = self.counts[system or "unknown"] = SystemCounts()
+
+        changed = {}
+        last = self._last
+        for label, node in nodes.items():
+            counts.received += 1
+            serial = node.get("node_serial") if isinstance(node, dict) else None
+            if not serial:
+                changed[label] = node
+                continue
+            fingerprint = tuple(node.get(name) for name in FINGERPRINT_FIELDS)
+            key = (system, serial)
+            previous = last.get(key)
+            if previous is not None and previous[0] == fingerprint and now - previous[1] < self.refresh_seconds:
+                counts.duplicates += 1
+                continue
+            last[key] = (fingerprint, now)
+            changed[label] = node
+        return changed
+
+    def reset(self) -> None:
+        """Forget every fingerprint so the next reading of each node passes (e.g. after a config reload)."""
+        self._last.clear()
+
+    def stats(self) -> dict:
+        """Duplicate counts per CCA."""
+        return {system: counts.to_dict() for system, counts in self.counts.items()}
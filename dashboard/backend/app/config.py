@@ -11,6 +11,9 @@ class Settings(BaseSettings):
     mqtt_topic_prefix: str = "taptap"
     mqtt_username: str | None = None
     mqtt_password: str | None = None
+    mqtt_payload_decoder: str = "auto"  # auto (orjson if installed), orjson or json
+    mqtt_ingest_queue_size: int = 64  # Unprocessed messages held before the oldest is dropped
+    mqtt_change_filter_enabled: bool = True  # Drop node readings that exactly repeat the last one
 
     # Application Configuration
     log_level: str = "INFO"
@@ -19,6 +22,50 @@ class Settings(BaseSettings):
     # WebSocket Configuration
     ws_heartbeat_interval: int = 30  # FR-3.4: Ping/pong every 30 seconds
     ws_batch_interval_ms: int = 500  # FR-3.2: Batch updates for 500ms
+    ws_send_timeout_seconds: float = 5.0  # Drop clients that can't take a frame in time
+    ws_client_queue_size: int = 32  # Outbound frames buffered per client before coalescing
+    ws_slow_client_timeout_seconds: float = 30.0  # Evict clients behind for longer than this
+
+    # Config Hot-Reload
+    config_watch_mode: str = "auto"  # auto, inotify or poll (use poll on NAS/network mounts)
+    config_poll_interval_seconds: float = 2.0  # How often poll mode stats the config files
+    config_reload_debounce_ms: int = 500  # Wait for writes to settle before reloading
+
+    # Telemetry History
+    history_enabled: bool = True
+    history_dir: str = "data/history"  # One directory of per-panel segments per UTC day
+    history_retention_days: int = 30  # Day directories older than this are deleted
+    history_flush_interval_seconds: float = 10.0  # How often buffered readings hit disk
+    # Days of rollups kept per resolution under <history_dir>/rollups
+    history_rollup_1m_retention_days: int = 7
+    history_rollup_15m_retention_days: int = 90
+    history_rollup_1h_retention_days: int = 730
+    history_rollup_1d_retention_days: int = 3650
+
+    # Multi-Site Mode
+    sites: str = ""  # Extra installations served by this process: name[:topic_prefix],...
+    sites_config_dir: str = "config/sites"  # One config directory per extra site, named after it
+
+    # Horizontal Fan-Out (see fanout.py)
+    fanout_role: str = "off"  # off, publish (ingest also feeds edges) or edge (serve /ws/panels only)
+    fanout_topic: str = "tigo-dashboard/fanout"  # Internal topic tree for frames, snapshots and resyncs
+    fanout_snapshot_interval_seconds: float = 30.0  # Refresh the retained snapshot this often while panels change
+    fanout_edge_id: str | None = None  # Name this edge uses in resync requests (default: hostname)
+
+    # Multi-Worker Shared State (see shared_state.py)
+    shared_state_enabled: bool = False  # Set with uvicorn --workers N: one worker ingests, the rest read shared memory
+    shared_state_name: str = "tigo-dashboard"  # Shared-memory region and election lock file name
+    shared_state_max_panels: int = 2048  # Panels the fixed-size region can hold
+    shared_state_stale_seconds: float = 5.0  # Heartbeat age after which serving workers consider the ingest worker gone
+
+    # Hot-Path Tracing (see tracing.py; also toggled at runtime via /api/debug/tracing)
+    trace_enabled: bool = False  # Record per-stage timestamps for every MQTT message
+    trace_buffer_size: int = 1024  # Finished traces kept in the ring buffer
+
+    # Event Loop Monitoring (see loop_monitor.py)
+    loop_lag_interval_ms: int = 100  # Loop-lag sampler period; 0 disables it
+    loop_block_detect_enabled: bool = False  # Log the stack of whatever blocks the loop past the threshold
+    loop_block_threshold_ms: int = 100  # Stall length that gets logged
 
     # Staleness Configuration
     staleness_threshold_seconds: int = 300  # 5 minutes to match Tigo reporting interval
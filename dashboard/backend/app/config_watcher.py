@@ -0,0 +1,163 @@
+"""Background watcher that hot-reloads the panel configuration.
+
+Reload detection used to run inside PanelService.get_all_panels, so every
+MQTT message, /api/panels request and WebSocket connect stat()ed the config
+files. ConfigWatcher moves that work off the read path: it waits for
+filesystem events (inotify via watchfiles) or polls on an interval, debounces
+bursts of writes, parses the new config in a worker thread and then swaps it
+into PanelService in a single step on the event loop.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+try:
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+from .metrics import get_metrics
+from .panel_service import PanelService
+
+logger = logging.getLogger(__name__)
+
+WATCH_MODES = ("auto", "inotify", "poll")
+
+
+class ConfigWatcher:
+    """Detect config file changes and reload PanelService in the background.
+
+    Modes:
+        auto: filesystem events when watchfiles is installed and the config
+            directory exists, polling otherwise
+        inotify: always use filesystem events (requires watchfiles)
+        poll: stat the config files every ``poll_interval`` seconds; use this
+            on NAS/network mounts where inotify events are not delivered
+    """
+
+    def __init__(
+        self,
+        panel_service: PanelService,
+        on_reload: Optional[Callable[[], Awaitable[None]]] = None,
+        mode: str = "auto",
+        poll_interval: float = 2.0,
+        debounce_ms: int = 500,
+    ):
+        if mode not in WATCH_MODES:
+            raise ValueError(f"Unknown config watch mode '{mode}', expected one of {WATCH_MODES}")
+        self.panel_service = panel_service
+        self.on_reload = on_reload
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.debounce = debounce_ms / 1000.0
+        self.reload_count = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def _use_events(self) -> bool:
+        """Decide between filesystem events and polling for this mode."""
+        if self.mode == "poll":
+            return False
+        if watchfiles is None:
+            if self.mode == "inotify":
+                logger.warning("watchfiles not installed, falling back to polling config files")
+            return False
+        if not self._watch_dir().is_dir():
+            logger.info(f"Config directory {self._watch_dir()} missing, polling config files")
+            return False
+        return True
+
+    def _watch_dir(self):
+        return self.panel_service.yaml_path.parent
+
+    def start(self) -> None:
+        """Start the watcher task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the watcher task."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        if self._use_events():
+            logger.info(f"Watching {self._watch_dir()} for config changes")
+            await self._event_loop()
+        else:
+            logger.info(f"Polling config files every {self.poll_interval}s")
+            await self._poll_loop()
+
+    async def _event_loop(self) -> None:
+        """Wait for filesystem events on the config files, then reload."""
+        names = {self.panel_service.yaml_path.name, self.panel_service.config_path.name}
+        dirs = {
+            str(path.parent)
+            for path in (self.panel_service.yaml_path, self.panel_service.config_path)
+            if path.parent.is_dir()
+        }
+
+        def is_config_file(change, path: str) -> bool:
+            return path.rsplit("/", 1)[-1] in names
+
+        async for _changes in watchfiles.awatch(
+            *dirs,
+            watch_filter=is_config_file,
+            debounce=int(self.debounce * 1000),
+            recursive=False,
+        ):
+            await self.check_now()
+
+    async def _poll_loop(self) -> None:
+        """Stat the config files on an interval, then reload on change."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            change = await asyncio.to_thread(self.panel_service.detect_config_change)
+            if change is None:
+                continue
+            # Let editors and config_router finish writing before reading
+            await asyncio.sleep(self.debounce)
+            await self.check_now()
+
+    async def check_now(self) -> bool:
+        """Reload the config if it changed on disk. Returns True if state was swapped.
+
+        Disk access and parsing happen in a worker thread; the new state is
+        installed on the event loop so readers never see a partial config.
+        A config that fails to parse is logged and the current state is kept.
+        """
+        change = await asyncio.to_thread(self.panel_service.detect_config_change)
+        if change is None:
+            return False
+
+        metrics = get_metrics()
+        started = time.perf_counter()
+        if change == "clear":
+            swapped = self.panel_service.clear_config()
+        else:
+            logger.info("Config file changed, reloading...")
+            try:
+                loaded = await asyncio.to_thread(self.panel_service.read_config)
+            except Exception as e:
+                logger.error(f"Failed to reload panel configuration, keeping current config: {e}")
+                metrics.config_reloads.labels("failed").inc()
+                return False
+            if loaded is None:
+                swapped = self.panel_service.clear_config()
+            else:
+                self.panel_service.install_config(loaded)
+                swapped = True
+
+        if swapped:
+            self.reload_count += 1
+            metrics.config_reloads.labels("ok").inc()
+            metrics.config_reload_seconds.observe(time.perf_counter() - started)
+            if self.on_reload:
+                await self.on_reload()
+        return swapped
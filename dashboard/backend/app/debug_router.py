@@ -0,0 +1,178 @@
+"""Debug API endpoints for finding slow stages and leaks in the live process.
+
+Provides:
+- GET /api/debug/traces - Slowest buffered message traces and a per-stage breakdown
+- DELETE /api/debug/traces - Empty the trace ring buffer
+- POST /api/debug/tracing - Turn tracing on or off at runtime
+- POST /api/debug/profile - CPU profile of the live process, as a download
+- POST /api/debug/tracemalloc/snapshot - Snapshot traced allocations
+- GET /api/debug/tracemalloc/diff - Allocation sites that grew between two snapshots
+- GET /api/debug/tracemalloc - Tracing state and stored snapshots
+- DELETE /api/debug/tracemalloc - Stop tracing allocations
+- GET /api/debug/loop - Event loop lag and recent stalls with the stack that caused them
+
+Profiles and snapshots never run concurrently; a request made while one is
+running gets 409.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Response
+from pydantic import BaseModel
+
+from .loop_monitor import get_loop_monitor
+from .profiler import PROFILE_MODES, SNAPSHOT_GROUPINGS, ProfilerBusyError, get_profiler
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/debug", tags=["debug"])
+
+
+def error_response(
+    status_code: int,
+    error_code: str,
+    message: str,
+    details: list[str] | None = None
+) -> HTTPException:
+    """Create an HTTPException with standard error format."""
+    return HTTPException(
+        status_code=status_code,
+        detail={
+            "success": False,
+            "error": error_code,
+            "message": message,
+            "details": details or []
+        }
+    )
+
+
+class TracingRequest(BaseModel):
+    """Request to enable or disable tracing."""
+    enabled: bool
+
+
+@router.get("/traces")
+async def get_traces(limit: int = Query(20, ge=1, le=1000)):
+    """The ``limit`` slowest traces in the ring buffer and where their time went.
+
+    Each trace lists its stages in order with the milliseconds spent in
+    each; ``breakdown`` aggregates every buffered trace per stage.
+    """
+    tracer = get_tracer()
+    return {
+        "tracing": tracer.get_stats(),
+        "slowest": [trace.to_dict() for trace in tracer.slowest(limit)],
+        "breakdown": tracer.breakdown(),
+    }
+
+
+@router.delete("/traces")
+async def clear_traces():
+    """Drop every buffered trace."""
+    get_tracer().clear()
+    return {"success": True, "message": "Traces cleared"}
+
+
+@router.post("/tracing")
+async def set_tracing(request: TracingRequest):
+    """Enable or disable tracing of new MQTT messages."""
+    tracer = get_tracer()
+    tracer.enabled = request.enabled
+    logger.info(f"Hot-path tracing {'enabled' if request.enabled else 'disabled'}")
+    return {"success": True, "tracing": tracer.get_stats()}
+
+
+@router.post("/profile")
+async def profile_cpu(
+    seconds: float = Query(10.0, gt=0, le=300),
+    mode: str = Query("sample"),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+):
+    """Profile the event loop for ``seconds`` and return the result as a file.
+
+    ``sample`` returns collapsed stacks (flamegraph.pl, speedscope);
+    ``cprofile`` returns a pstats file for ``python -m pstats``.
+    """
+    if mode not in PROFILE_MODES:
+        raise error_response(400, "invalid_mode", f"mode must be one of {', '.join(PROFILE_MODES)}")
+    try:
+        data = await get_profiler().profile_cpu(seconds, mode, interval_ms / 1000.0)
+    except ProfilerBusyError as e:
+        raise error_response(409, "profiler_busy", str(e))
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    if mode == "sample":
+        filename, media_type = f"profile-{stamp}.collapsed.txt", "text/plain; charset=utf-8"
+    else:
+        filename, media_type = f"profile-{stamp}.prof", "application/octet-stream"
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/tracemalloc/snapshot")
+async def take_allocation_snapshot(
+    nframes: int = Query(1, ge=1, le=64),
+    limit: int = Query(10, ge=1, le=500),
+):
+    """Snapshot traced allocations, starting tracemalloc on first use.
+
+    ``nframes`` only applies when this call starts tracing. Allocations
+    made before tracing started are not seen, so take a baseline snapshot
+    first and compare later ones against it.
+    """
+    try:
+        return await get_profiler().take_snapshot(nframes=nframes, limit=limit)
+    except ProfilerBusyError as e:
+        raise error_response(409, "profiler_busy", str(e))
+
+
+@router.get("/tracemalloc/diff")
+async def diff_allocation_snapshots(
+    base: Optional[int] = None,
+    current: Optional[int] = None,
+    limit: int = Query(25, ge=1, le=500),
+    group_by: str = Query("lineno"),
+):
+    """Allocation sites ordered by growth from ``base`` to ``current`` (default: the last two snapshots)."""
+    if group_by not in SNAPSHOT_GROUPINGS:
+        raise error_response(
+            400, "invalid_grouping", f"group_by must be one of {', '.join(SNAPSHOT_GROUPINGS)}"
+        )
+    try:
+        return await get_profiler().diff(base, current, limit=limit, group_by=group_by)
+    except KeyError as e:
+        raise error_response(404, "snapshot_not_found", str(e.args[0]))
+    except ProfilerBusyError as e:
+        raise error_response(409, "profiler_busy", str(e))
+
+
+@router.get("/tracemalloc")
+async def allocation_status():
+    """Whether allocations are traced, memory traced so far and stored snapshots."""
+    return get_profiler().get_stats()
+
+
+@router.delete("/tracemalloc")
+async def stop_allocation_tracing():
+    """Stop tracemalloc and drop stored snapshots."""
+    try:
+        stopped = get_profiler().stop_tracemalloc()
+    except ProfilerBusyError as e:
+        raise error_response(409, "profiler_busy", str(e))
+    return {"success": True, "stopped": stopped}
+
+
+@router.get("/loop")
+async def event_loop_stats():
+    """Event loop lag so far and the most recent stalls over the block threshold.
+
+    Each stall names the route or background task that was running and the
+    loop thread's stack captured while it was still blocked.
+    """
+    return get_loop_monitor().get_stats()
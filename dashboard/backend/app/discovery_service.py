@@ -5,12 +5,15 @@ as panels are discovered.
 """
 
 import asyncio
-import json
 import logging
 from datetime import datetime, timezone
 from typing import Callable, Awaitable, Optional
 
+from . import json_codec
+from .config import get_settings
 from .config_models import DiscoveredPanel
+from .mqtt_hub import MQTTHub, get_mqtt_hub
+from .mqtt_router import TopicRouter
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +25,7 @@ class DiscoveryService:
         self._discovered_panels: dict[str, DiscoveredPanel] = {}
         self._subscribers: list[Callable[[dict], Awaitable[None]]] = []
         self._mqtt_task: Optional[asyncio.Task] = None
+        self._hub: Optional[MQTTHub] = None  # Set while riding the app's broker connection
         self._running = False
         self._discovery_start_time: Optional[datetime] = None
 
@@ -62,8 +66,10 @@ class DiscoveryService:
     ) -> None:
         """Start MQTT discovery mode (FR-6.1).
 
-        Subscribes to taptap/+/nodes/# wildcard topic and emits
-        panel_discovered events for each unique panel found.
+        Subscribes to taptap/+/state wildcard topic and emits
+        panel_discovered events for each unique panel found. When the wizard
+        points at the broker the app is already connected to, discovery
+        consumes the shared MQTTHub instead of opening a second connection.
         """
         if self._running:
             logger.warning("Discovery already running")
@@ -71,6 +77,17 @@ class DiscoveryService:
 
         self._running = True
         self._discovery_start_time = datetime.now(timezone.utc)
+
+        hub = get_mqtt_hub()
+        if hub.running and hub.serves(mqtt_host, mqtt_port, mqtt_username, topic_prefix):
+            logger.info("Discovery: Sharing the live MQTT connection")
+            self._hub = hub
+            hub.connection_listeners.append(self._on_hub_connection)
+            await hub.add_consumer("+/state", self._process_state_message)  # FR-6.1
+            if hub.connected:
+                await self._on_hub_connection(True, None)
+            return
+
         self._mqtt_task = asyncio.create_task(
             self._discovery_loop(
                 mqtt_host, mqtt_port, mqtt_username, mqtt_password, topic_prefix
@@ -80,6 +97,11 @@ class DiscoveryService:
     async def stop_discovery(self) -> None:
         """Stop MQTT discovery mode."""
         self._running = False
+        if self._hub is not None:
+            self._hub.remove_consumer("+/state", self._process_state_message)
+            if self._on_hub_connection in self._hub.connection_listeners:
+                self._hub.connection_listeners.remove(self._on_hub_connection)
+            self._hub = None
         if self._mqtt_task:
             self._mqtt_task.cancel()
             try:
@@ -92,6 +114,11 @@ class DiscoveryService:
         """Clear all discovered panels (for restart discovery)."""
         self._discovered_panels.clear()
 
+    async def _on_hub_connection(self, connected: bool, reason: Optional[str]) -> None:
+        """Relay shared-connection status to discovery subscribers."""
+        data = {"status": "connected"} if connected else {"status": "disconnected", "reason": reason}
+        await self._emit_event({"type": "connection_status", "data": data})
+
     async def _discovery_loop(
         self,
         mqtt_host: str,
@@ -100,8 +127,12 @@ class DiscoveryService:
         mqtt_password: Optional[str],
         topic_prefix: str
     ) -> None:
-        """MQTT connection loop for discovery mode."""
+        """MQTT connection loop for discovery mode on a broker other than the app's."""
         retry_delay = 1
+        router = TopicRouter(
+            topic_prefix, decoder=json_codec.get_decoder(get_settings().mqtt_payload_decoder)
+        )
+        router.add("+/state", self._process_state_message)  # FR-6.1
 
         while self._running:
             try:
@@ -124,27 +155,16 @@ class DiscoveryService:
                     })
 
                     # Subscribe to state topics with wildcard (FR-6.1)
-                    state_topic = f"{topic_prefix}/+/state"
-                    await client.subscribe(state_topic)
-                    logger.info(f"Discovery: Subscribed to {state_topic}")
+                    for topic in router.subscriptions():
+                        await client.subscribe(topic)
+                        logger.info(f"Discovery: Subscribed to {topic}")
 
                     async for message in client.messages:
                         if not self._running:
                             break
 
                         try:
-                            topic_str = str(message.topic)
-                            payload = json.loads(message.payload.decode())
-
-                            if topic_str.endswith("/state"):
-                                # Extract system from topic
-                                parts = topic_str.split("/")
-                                source_system = parts[1] if len(parts) >= 2 else "unknown"
-
-                                await self._process_state_message(payload, source_system)
-
-                        except json.JSONDecodeError as e:
-                            logger.debug(f"Discovery: Failed to parse message: {e}")
+                            await router.dispatch(str(message.topic), message.payload)
                         except Exception as e:
                             logger.error(f"Discovery: Error processing message: {e}")
 
@@ -0,0 +1,304 @@
+"""Horizontal fan-out: stateless WebSocket edge instances fed over MQTT.
+
+With ``fanout_role=publish`` the ingest process keeps doing everything it
+did before and also republishes every /ws/panels frame it broadcasts to an
+internal topic (``fanout_topic``, default ``tigo-dashboard/fanout``):
+
+    <fanout_topic>/frames    every delta frame, exactly as sent to
+                             WebSocket clients (not retained)
+    <fanout_topic>/snapshot  every snapshot frame, retained so a new edge
+                             starts from the latest one; refreshed every
+                             ``fanout_snapshot_interval_seconds`` while
+                             panels change
+    <fanout_topic>/resync    edges ask for a fresh snapshot here
+
+With ``fanout_role=edge`` an instance of the same app does no ingest at all:
+it subscribes to those topics, mirrors the panel state the frames describe
+and serves only /ws/panels, /api/panels and /api/aggregates from it. Edges
+hold no configuration or history, so any number of replicas can run behind
+a load balancer.
+
+Frames keep the ingest's sequence numbers. The edge consumes both topics
+through a non-coalescing hub lane, so deltas are applied one by one in
+the order they arrive and a burst never merges them. An edge that still
+sees a gap applies the delta anyway, then publishes a resync request. A
+gap means frames were lost: the edge was disconnected from the broker, or
+a burst outran its bounded lane. The ingest answers with a snapshot that
+puts every edge, and their clients, back in step.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from . import json_codec
+from .mqtt_hub import MQTTHub
+from .websocket_manager import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+FANOUT_ROLES = ("off", "publish", "edge")
+# Minimum seconds between resync requests from one edge
+RESYNC_REQUEST_INTERVAL = 1.0
+
+
+class FanoutPublisher:
+    """Republish a ConnectionManager's broadcast frames for edge instances.
+
+    Frames are handed over synchronously by the manager and published by a
+    background task. If publishing falls more than ``max_pending`` frames
+    behind, the queued deltas are dropped and one snapshot is sent instead,
+    the same way a slow WebSocket client is caught up.
+    """
+
+    def __init__(
+        self,
+        hub: MQTTHub,
+        ws_manager: ConnectionManager,
+        topic: str = "tigo-dashboard/fanout",
+        snapshot_interval: float = 30.0,
+        max_pending: int = 32,
+    ):
+        self.hub = hub
+        self.ws_manager = ws_manager
+        self.topic = topic.rstrip("/")
+        self.snapshot_interval = snapshot_interval
+        self.max_pending = max_pending
+        # (frame, snapshot, seq the frame was encoded at)
+        self._pending: deque[tuple[str, bool, int]] = deque()
+        self._needs_snapshot = False
+        self._retained_seq: Optional[int] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.frames_published = 0
+        self.frames_dropped = 0
+        self.snapshots_published = 0
+        self.resync_requests = 0
+
+    async def start(self) -> None:
+        self.ws_manager.frame_listeners.append(self.on_frame)
+        self.hub.connection_listeners.append(self._on_connection)
+        await self.hub.add_consumer("resync", self._on_resync, prefix=self.topic)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.on_frame in self.ws_manager.frame_listeners:
+            self.ws_manager.frame_listeners.remove(self.on_frame)
+        if self._on_connection in self.hub.connection_listeners:
+            self.hub.connection_listeners.remove(self._on_connection)
+        self.hub.remove_consumer("resync", self._on_resync, prefix=self.topic)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def on_frame(self, frame: str, snapshot: bool) -> None:
+        """Frame listener: queue one broadcast frame for publishing."""
+        if snapshot:
+            # A snapshot supersedes everything queued before it
+            self.frames_dropped += len(self._pending)
+            self._pending.clear()
+            self._needs_snapshot = False
+        elif len(self._pending) >= self.max_pending:
+            self.frames_dropped += len(self._pending) + 1
+            self._pending.clear()
+            self._needs_snapshot = True
+            self._wakeup.set()
+            return
+        # Listeners run as the frame is emitted, so this is the frame's own seq
+        self._pending.append((frame, snapshot, self.ws_manager.seq))
+        self._wakeup.set()
+
+    def request_snapshot(self) -> None:
+        """Publish a fresh snapshot at the next opportunity."""
+        self._needs_snapshot = True
+        self._wakeup.set()
+
+    async def _on_resync(self, payload, *params) -> None:
+        self.resync_requests += 1
+        edge = payload.get("edge") if isinstance(payload, dict) else None
+        logger.info(f"Fan-out resync requested by edge {edge or 'unknown'}")
+        self.request_snapshot()
+
+    async def _on_connection(self, connected: bool, reason: Optional[str]) -> None:
+        # Frames published while disconnected were lost
+        if connected:
+            self.request_snapshot()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.snapshot_interval)
+            except asyncio.TimeoutError:
+                # Keep the retained snapshot close to live state for edges that join later
+                if self._retained_seq != self.ws_manager.seq:
+                    self._needs_snapshot = True
+            self._wakeup.clear()
+            try:
+                await self._drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in fan-out publisher: {e}")
+
+    async def _drain(self) -> None:
+        if self._needs_snapshot:
+            self._needs_snapshot = False
+            self._pending.clear()
+            seq = self.ws_manager.seq
+            frame = self.ws_manager.current_snapshot_frame()
+            if frame is not None:
+                await self._publish(frame, True, seq)
+        while self._pending:
+            await self._publish(*self._pending.popleft())
+
+    async def _publish(self, frame: str, snapshot: bool, seq: int) -> None:
+        """Publish one frame; ``seq`` is the sequence number encoded in it."""
+        if snapshot:
+            if not await self.hub.publish(f"{self.topic}/snapshot", frame, retain=True):
+                self.frames_dropped += 1
+                return
+            self.snapshots_published += 1
+            self._retained_seq = seq
+        elif not await self.hub.publish(f"{self.topic}/frames", frame):
+            self.frames_dropped += 1
+            return
+        self.frames_published += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "role": "publish",
+            "topic": self.topic,
+            "pending": len(self._pending),
+            "frames_published": self.frames_published,
+            "frames_dropped": self.frames_dropped,
+            "snapshots_published": self.snapshots_published,
+            "resync_requests": self.resync_requests,
+        }
+
+
+class EdgeMirror:
+    """Rebuild panel state from an ingest instance's frames and relay them to local clients."""
+
+    def __init__(
+        self,
+        hub: MQTTHub,
+        ws_manager: ConnectionManager,
+        topic: str = "tigo-dashboard/fanout",
+        edge_id: str = "edge",
+    ):
+        self.hub = hub
+        self.ws_manager = ws_manager
+        self.topic = topic.rstrip("/")
+        self.edge_id = edge_id
+        # display_label -> panel as it appears in frames
+        self.panels: dict[str, dict] = {}
+        self.aggregates: dict[str, dict] = {}
+        self.seq = 0
+        self.synced = False
+        self._gap_pending = False
+        self._last_resync_request = float("-inf")
+        self.frames_received = 0
+        self.gaps = 0
+        ws_manager.snapshot_frame_provider = self.snapshot_frame
+
+    async def start(self) -> None:
+        # Every frame matters and order matters: never let the hub coalesce them
+        await self.hub.add_consumer("snapshot", self._on_frame, prefix=self.topic, coalesce=False)
+        await self.hub.add_consumer("frames", self._on_frame, prefix=self.topic, coalesce=False)
+        self.hub.connection_listeners.append(self._on_connection)
+
+    async def stop(self) -> None:
+        self.hub.remove_consumer("snapshot", self._on_frame, prefix=self.topic)
+        self.hub.remove_consumer("frames", self._on_frame, prefix=self.topic)
+        if self._on_connection in self.hub.connection_listeners:
+            self.hub.connection_listeners.remove(self._on_connection)
+
+    def get_panels(self) -> list[dict]:
+        return list(self.panels.values())
+
+    def get_aggregates(self) -> dict:
+        return self.aggregates
+
+    def snapshot_frame(self) -> Optional[str]:
+        """Encoded snapshot of the mirrored state, or None before the first snapshot."""
+        if not self.synced:
+            return None
+        frame = {
+            "type": "snapshot",
+            "seq": self.seq,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "panels": self.get_panels(),
+        }
+        if self.aggregates:
+            frame["aggregates"] = self.aggregates
+        return json_codec.dumps(frame)
+
+    async def _on_connection(self, connected: bool, reason: Optional[str]) -> None:
+        # The retained snapshot arrives on (re)subscribe; ask anyway in case it is old
+        if connected:
+            await self._request_resync(force=True)
+
+    async def _on_frame(self, frame, *params) -> None:
+        if not isinstance(frame, dict):
+            return
+        kind = frame.get("type")
+        seq = frame.get("seq")
+        if not isinstance(seq, int):
+            return
+        self.frames_received += 1
+
+        if kind == "snapshot":
+            # Always authoritative: a lower seq means the ingest restarted.
+            # A periodic refresh at the seq clients already have is not relayed.
+            relay = not self.synced or seq != self.seq or self._gap_pending
+            self.panels = {p["display_label"]: p for p in frame.get("panels", ())}
+            self.aggregates = frame.get("aggregates") or {}
+            self.seq = seq
+            self.synced = True
+            self._gap_pending = False
+            if relay:
+                self.ws_manager.relay_frame(json_codec.dumps(frame), seq, snapshot=True)
+            return
+
+        if kind != "delta" or not self.synced or seq <= self.seq:
+            return
+        if seq != self.seq + 1:
+            self.gaps += 1
+            self._gap_pending = True
+            logger.info(f"Fan-out gap: expected seq {self.seq + 1}, got {seq}")
+            await self._request_resync()
+        for panel in frame.get("changed", ()):
+            self.panels[panel["display_label"]] = panel
+        for kind_name, groups in (frame.get("aggregates") or {}).items():
+            self.aggregates.setdefault(kind_name, {}).update(groups)
+        self.seq = seq
+        self.ws_manager.relay_frame(json_codec.dumps(frame), seq)
+
+    async def _request_resync(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_resync_request < RESYNC_REQUEST_INTERVAL:
+            return
+        self._last_resync_request = now
+        await self.hub.publish(
+            f"{self.topic}/resync", json_codec.dumps({"edge": self.edge_id, "seq": self.seq})
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            "role": "edge",
+            "topic": self.topic,
+            "edge_id": self.edge_id,
+            "synced": self.synced,
+            "seq": self.seq,
+            "panels": len(self.panels),
+            "frames_received": self.frames_received,
+            "gaps": self.gaps,
+        }
@@ -0,0 +1,256 @@
+"""Telemetry history API endpoints.
+
+REST endpoints for stored panel readings:
+- GET /api/history/{display_label} - Time series for one panel
+- GET /api/history/string/{string} - Time series for every panel on a string
+- GET /api/history/system/{system} - Aggregate rollups for a CCA system
+
+All accept ``start``/``end`` (ISO 8601, default: the last 24 hours) and
+``fields`` (comma-separated, default: all telemetry fields). Columns are
+returned as parallel arrays keyed by field, each encoded as a base64 string
+of little-endian values (``"encoding": "base64"``): ``t`` is uint32 Unix
+seconds and every other column float32, with NaN where there is no reading.
+Browsers decode them with ``new Float32Array(bytes.buffer)`` instead of
+parsing one JSON number per point.
+
+``resolution`` selects raw readings or a rollup (1m, 15m, 1h, 1d) whose
+columns are ``<field>_min``/``_max``/``_mean``/``_last`` per bucket. With
+``max_points`` and no explicit resolution, the finest resolution that keeps
+the window within the point budget is used.
+
+Panels are looked up through the active panel source: PanelService on the
+ingest instance, the shared-memory region on serving workers (which read the
+same history directory). Fan-out edges keep no history and answer 409.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Response
+
+from . import json_codec
+from .history_store import HISTORY_FIELDS, get_history_store, encode_columns
+from .panel_service import get_panel_service
+from .rollups import RESOLUTIONS, get_rollup_engine, pick_resolution, string_key, system_key
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/history", tags=["history"])
+
+DEFAULT_WINDOW = timedelta(hours=24)
+MAX_RAW_WINDOW = timedelta(days=31)
+MAX_ROLLUP_WINDOW = timedelta(days=366)
+# Nominal seconds between raw readings, used to estimate raw point counts
+RAW_INTERVAL_SECONDS = 10
+
+
+def error_response(
+    status_code: int,
+    error_code: str,
+    message: str,
+    details: list[str] | None = None
+) -> HTTPException:
+    """Create an HTTPException with standard error format."""
+    return HTTPException(
+        status_code=status_code,
+        detail={
+            "success": False,
+            "error": error_code,
+            "message": message,
+            "details": details or []
+        }
+    )
+
+
+def ingest_panels() -> Iterable:
+    """Panels of this instance's own PanelService (the ingest instance)."""
+    return get_panel_service().panel_state.values()
+
+
+_panel_source: Optional[Callable[[], Iterable]] = ingest_panels
+
+
+def set_panel_source(source: Optional[Callable[[], Iterable]]) -> None:
+    """Where panel lookups come from; None on instances that keep no history."""
+    global _panel_source
+    _panel_source = source
+
+
+def served_panels() -> list:
+    """Panels this instance serves history for (anything with label, string and system)."""
+    if _panel_source is None:
+        raise error_response(
+            409, "not_ingest_instance",
+            "This instance keeps no history; query the ingest instance",
+        )
+    return list(_panel_source())
+
+
+def resolve_window(
+    start: Optional[datetime], end: Optional[datetime]
+) -> tuple[datetime, datetime]:
+    """Fill in the default window and treat naive datetimes as UTC."""
+    end = end or datetime.now(timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    start = start or end - DEFAULT_WINDOW
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise error_response(400, "invalid_range", "start must be before end")
+    return start, end
+
+
+def resolve_resolution(
+    resolution: Optional[str],
+    max_points: Optional[int],
+    start: datetime,
+    end: datetime,
+) -> str:
+    """Pick raw or a rollup resolution and check the window it allows."""
+    if resolution is None:
+        resolution = (
+            pick_resolution(start, end, max_points, RAW_INTERVAL_SECONDS)
+            if max_points else "raw"
+        )
+    if resolution != "raw" and resolution not in RESOLUTIONS:
+        raise error_response(
+            400, "unknown_resolution", "Unknown history resolution",
+            details=["raw", *RESOLUTIONS],
+        )
+    limit = MAX_RAW_WINDOW if resolution == "raw" else MAX_ROLLUP_WINDOW
+    if end - start > limit:
+        raise error_response(
+            400, "range_too_large",
+            f"{resolution} history queries are limited to {limit.days} days",
+        )
+    return resolution
+
+
+def parse_fields(fields: Optional[str]) -> list[str]:
+    """Split the ``fields`` query parameter and validate the names."""
+    if not fields:
+        return list(HISTORY_FIELDS)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in HISTORY_FIELDS]
+    if unknown:
+        raise error_response(
+            400, "unknown_field", "Unknown history field", details=unknown
+        )
+    return names
+
+
+def load_response(
+    keys: list[str],
+    resolution: str,
+    start: datetime,
+    end: datetime,
+    fields: list[str],
+    build: Callable[[dict], dict],
+) -> bytes:
+    """Query raw history or rollups and encode the response body (runs in a worker thread).
+
+    ``build`` wraps the encoded columns per key in the endpoint's envelope, so
+    both the query and the JSON encoding stay off the event loop.
+    """
+    if resolution == "raw":
+        series = get_history_store().query_many(keys, start, end, fields)
+    else:
+        series = get_rollup_engine().query_many(keys, resolution, start, end, fields)
+    content = {
+        "resolution": resolution,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "fields": fields,
+        "encoding": "base64",
+        **build({key: encode_columns(columns) for key, columns in series.items()}),
+    }
+    return json_codec.dumps_bytes(content)
+
+
+def json_response(body: bytes) -> Response:
+    """Send a pre-encoded body, skipping FastAPI's jsonable_encoder."""
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/string/{string}")
+async def get_string_history(
+    string: str,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    fields: Optional[str] = Query(None),
+    resolution: Optional[str] = Query(None),
+    max_points: Optional[int] = Query(None, ge=1),
+):
+    """Get history for every panel on a string, keyed by display label.
+
+    Rollup resolutions also include the string's ``aggregate`` series.
+    """
+    start, end = resolve_window(start, end)
+    resolution = resolve_resolution(resolution, max_points, start, end)
+    names = parse_fields(fields)
+    labels = [panel.display_label for panel in served_panels() if panel.string == string]
+    if not labels:
+        raise error_response(404, "not_found", f"No panels on string '{string}'")
+
+    def build(series: dict) -> dict:
+        content = {"string": string, "panels": {label: series[label] for label in labels}}
+        if resolution != "raw":
+            content["aggregate"] = series[string_key(string)]
+        return content
+
+    keys = labels if resolution == "raw" else [*labels, string_key(string)]
+    body = await asyncio.to_thread(load_response, keys, resolution, start, end, names, build)
+    return json_response(body)
+
+
+@router.get("/system/{system}")
+async def get_system_history(
+    system: str,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    fields: Optional[str] = Query(None),
+    resolution: Optional[str] = Query(None),
+    max_points: Optional[int] = Query(None, ge=1),
+):
+    """Get aggregate rollups across every panel on a CCA system."""
+    start, end = resolve_window(start, end)
+    resolution = resolve_resolution(resolution, max_points, start, end)
+    if resolution == "raw":
+        # Systems only have aggregate rollups; use the finest one
+        resolution = next(iter(RESOLUTIONS))
+    names = parse_fields(fields)
+    if not any(panel.system == system for panel in served_panels()):
+        raise error_response(404, "not_found", f"No panels on system '{system}'")
+
+    key = system_key(system)
+    body = await asyncio.to_thread(
+        load_response, [key], resolution, start, end, names,
+        lambda series: {"system": system, **series[key]},
+    )
+    return json_response(body)
+
+
+@router.get("/{display_label}")
+async def get_panel_history(
+    display_label: str,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    fields: Optional[str] = Query(None),
+    resolution: Optional[str] = Query(None),
+    max_points: Optional[int] = Query(None, ge=1),
+):
+    """Get history for one panel."""
+    start, end = resolve_window(start, end)
+    resolution = resolve_resolution(resolution, max_points, start, end)
+    names = parse_fields(fields)
+    if not any(panel.display_label == display_label for panel in served_panels()):
+        raise error_response(404, "not_found", f"Unknown panel '{display_label}'")
+
+    body = await asyncio.to_thread(
+        load_response, [display_label], resolution, start, end, names,
+        lambda series: {"display_label": display_label, **series[display_label]},
+    )
+    return json_response(body)
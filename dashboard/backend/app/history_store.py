@@ -0,0 +1,236 @@
+"""Append-only on-disk time-series store for panel telemetry.
+
+Each panel gets one segment file per UTC day under ``<root>/<YYYY-MM-DD>/``.
+A segment is a flat run of fixed-width little-endian 4-byte records:
+
+    [uint32 Unix seconds, float32 field_1, ..., float32 field_n]
+
+Missing values are stored as NaN. Readings are buffered in memory and
+appended to the segment files by ``flush`` (run off the event loop), and
+queries memory-map the segments and split columns with strided slices, so a
+day of 10-second data for a whole string is read without per-record parsing.
+Whole day directories are deleted once they fall outside the retention window.
+"""
+
+import bisect
+import logging
+import mmap
+import shutil
+import struct
+import threading
+from array import array
+from base64 import b64encode
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+from urllib.parse import quote
+
+from .config import get_settings
+from .panel_state import PanelRecord
+
+logger = logging.getLogger(__name__)
+
+# Telemetry fields kept per reading, in on-disk column order
+HISTORY_FIELDS = (
+    "watts", "voltage_in", "voltage_out", "current_in", "current_out",
+    "temperature", "duty_cycle", "rssi", "energy",
+)
+SEGMENT_SUFFIX = ".f32"
+NAN = float("nan")
+
+
+def _segment_name(key: str) -> str:
+    """Filesystem-safe segment name for a series key (no separators or dot names)."""
+    return quote(key, safe="").replace(".", "%2E") + SEGMENT_SUFFIX
+
+
+def _day_start(day: date) -> float:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+
+
+def _columns(data: bytes) -> tuple[array, array]:
+    """View the same record bytes as uint32 (for the time column) and float32."""
+    times = array("I")
+    times.frombytes(data)
+    values = array("f")
+    values.frombytes(data)
+    return times, values
+
+
+class HistoryStore:
+    """Fixed-width float32 segments per series per day, with time-based retention."""
+
+    def __init__(
+        self,
+        root: Path = Path("data/history"),
+        fields: Sequence[str] = HISTORY_FIELDS,
+        retention_days: int = 30,
+    ):
+        self.root = Path(root)
+        self.fields = tuple(fields)
+        self.retention_days = retention_days
+        self.width = len(self.fields) + 1
+        self._record = struct.Struct(f"<I{self.width - 1}f")
+        self._field_index = {name: i + 1 for i, name in enumerate(self.fields)}
+        # (day, key) -> packed records not yet written to disk
+        self._pending: dict[tuple[date, str], bytearray] = {}
+        self._lock = threading.Lock()
+        self.records_written = 0
+
+    def append(self, key: str, timestamp: float, values: Sequence[Optional[float]]) -> None:
+        """Buffer one record for ``key`` at a Unix ``timestamp``."""
+        day = datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+        packed = self._record.pack(int(timestamp), *(NAN if v is None else v for v in values))
+        with self._lock:
+            buffer = self._pending.get((day, key))
+            if buffer is None:
+                buffer = self._pending[(day, key)] = bytearray()
+            buffer += packed
+
+    def record_panel(self, record: PanelRecord) -> None:
+        """Reading listener for PanelService: store the record's latest telemetry."""
+        if record.last_update is None:
+            return
+        self.append(
+            record.display_label,
+            record.last_update.timestamp(),
+            [getattr(record, name) for name in self.fields],
+        )
+
+    def flush(self) -> int:
+        """Append buffered records to their segment files. Returns records written.
+
+        Blocking; call from a worker thread.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        written = 0
+        for (day, key), buffer in pending.items():
+            day_dir = self.root / day.isoformat()
+            try:
+                day_dir.mkdir(parents=True, exist_ok=True)
+                with open(day_dir / _segment_name(key), "ab") as f:
+                    f.write(buffer)
+            except OSError as e:
+                logger.error(f"Failed to write history for {key}: {e}")
+                continue
+            written += len(buffer) // self._record.size
+        self.records_written += written
+        return written
+
+    def prune(self, today: Optional[date] = None) -> int:
+        """Delete day directories older than the retention window. Returns days removed."""
+        cutoff = (today or datetime.now(timezone.utc).date()) - timedelta(days=self.retention_days)
+        if not self.root.is_dir():
+            return 0
+        removed = 0
+        for day_dir in self.root.iterdir():
+            try:
+                day = date.fromisoformat(day_dir.name)
+            except ValueError:
+                continue
+            if day < cutoff:
+                shutil.rmtree(day_dir, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info(f"Pruned {removed} day(s) of history older than {cutoff}")
+        return removed
+
+    def _read_day(self, day: date, key: str) -> bytes:
+        """Raw records for one series on one day, flushed and pending."""
+        data = b""
+        path = self.root / day.isoformat() / _segment_name(key)
+        try:
+            with open(path, "rb") as f:
+                size = f.seek(0, 2)
+                # Ignore a torn record left by an interrupted write
+                size -= size % self._record.size
+                if size:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+                        data = segment[:size]
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            buffer = self._pending.get((day, key))
+            if buffer:
+                data += buffer
+        return data
+
+    def query(
+        self,
+        key: str,
+        start: datetime,
+        end: datetime,
+        fields: Optional[Iterable[str]] = None,
+    ) -> dict[str, array]:
+        """Return ``{"t": array, field: array}`` columns for ``start <= t < end``.
+
+        ``t`` holds whole Unix seconds (uint32) and fields hold float32 with
+        NaN for missing values. Columns stay as arrays so no per-point Python
+        objects are built; use ``encode_columns`` at the API boundary.
+        Blocking; call from a worker thread.
+        """
+        names = list(fields) if fields is not None else list(self.fields)
+        for name in names:
+            if name not in self._field_index:
+                raise ValueError(f"Unknown history field '{name}'")
+
+        result: dict[str, array] = {"t": array("I")}
+        for name in names:
+            result[name] = array("f")
+
+        start_ts = start.timestamp()
+        end_ts = end.timestamp()
+        day = start.astimezone(timezone.utc).date()
+        while _day_start(day) < end_ts:
+            data = self._read_day(day, key)
+            if data:
+                times, values = _columns(data)
+                stamps = times[0::self.width]
+                lo = bisect.bisect_left(stamps, start_ts)
+                hi = bisect.bisect_left(stamps, end_ts)
+                if lo < hi:
+                    result["t"].extend(stamps[lo:hi])
+                    first = lo * self.width
+                    stop = hi * self.width
+                    for name in names:
+                        result[name].extend(values[first + self._field_index[name]:stop:self.width])
+            day += timedelta(days=1)
+        return result
+
+    def query_many(
+        self,
+        keys: Iterable[str],
+        start: datetime,
+        end: datetime,
+        fields: Optional[Iterable[str]] = None,
+    ) -> dict[str, dict[str, array]]:
+        """Run ``query`` for several series (e.g. every panel on a string)."""
+        names = list(fields) if fields is not None else None
+        return {key: self.query(key, start, end, names) for key in keys}
+
+
+def encode_columns(columns: dict[str, array]) -> dict[str, str]:
+    """Encode query columns as base64 of their raw little-endian bytes.
+
+    ``t`` is uint32 and every other column float32 with NaN for gaps, the same
+    layout as the segment files, so no per-point Python objects are built.
+    """
+    return {name: b64encode(column.tobytes()).decode("ascii") for name, column in columns.items()}
+
+
+# Singleton instance
+_history_store: Optional[HistoryStore] = None
+
+
+def get_history_store() -> HistoryStore:
+    """Get or create the singleton HistoryStore instance."""
+    global _history_store
+    if _history_store is None:
+        settings = get_settings()
+        _history_store = HistoryStore(
+            root=Path(settings.history_dir),
+            retention_days=settings.history_retention_days,
+        )
+    return _history_store
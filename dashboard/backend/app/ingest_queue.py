@@ -0,0 +1,189 @@
+"""Bounded, coalescing hand-off between MQTT receive and panel processing.
+
+The receive stage only classifies a message and puts it here; a separate
+worker drains the queue and runs decoding and the panel/broadcast chain. Each
+entry has a key (the MQTT topic), and a newer message for a
+key that is still waiting replaces the older one in place: a state payload
+carries every node of its CCA, so only the latest one is worth processing.
+When the queue is full and a new key arrives, the oldest waiting entry is
+dropped, so a burst never leaves the dashboard working through stale data.
+
+An IngestLane pairs one queue with its own worker task and metrics. MQTTHub
+runs a lane per CCA so a burst from one system only queues behind itself.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Count, mean, max and most recent duration for one pipeline stage."""
+
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "last_ms": round(self.last * 1000, 3),
+        }
+
+
+class CoalescingQueue:
+    """FIFO of keyed items where re-putting a waiting key replaces its item."""
+
+    def __init__(self, maxsize: int = 64):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        # key -> (item, monotonic time the key started waiting)
+        self._items: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._ready = asyncio.Event()
+        self.put_count = 0
+        self.coalesced_count = 0
+        self.dropped_count = 0
+        self.max_depth = 0
+        self.wait = LatencyStats()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put_nowait(self, key: Hashable, item: Any, now: Optional[float] = None) -> None:
+        """Queue ``item`` under ``key`` without blocking the receive stage.
+
+        A waiting entry for the same key keeps its place in line but takes the
+        new item. Otherwise, if the queue is full, the oldest entry is dropped.
+        """
+        now = time.monotonic() if now is None else now
+        self.put_count += 1
+        existing = self._items.get(key)
+        if existing is not None:
+            self._items[key] = (item, existing[1])
+            self.coalesced_count += 1
+            return
+        if len(self._items) >= self.maxsize:
+            self._items.popitem(last=False)
+            self.dropped_count += 1
+        self._items[key] = (item, now)
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._ready.set()
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait until an entry is waiting, for at most ``timeout`` seconds.
+
+        Returns False if the queue is still empty when the timeout passes.
+        Only the wakeup event is cancelled on timeout, never a removal, so an
+        entry put as the timeout fires stays queued.
+        """
+        try:
+            async with asyncio.timeout(timeout):
+                while not self._items:
+                    self._ready.clear()
+                    await self._ready.wait()
+        except TimeoutError:
+            pass
+        return bool(self._items)
+
+    def get_nowait(self) -> tuple[Hashable, Any]:
+        """Remove the oldest entry, recording how long it waited. Raises KeyError if empty."""
+        key, (item, queued_at) = self._items.popitem(last=False)
+        self.wait.observe(time.monotonic() - queued_at)
+        return key, item
+
+    async def get(self) -> tuple[Hashable, Any]:
+        """Wait for and remove the oldest entry, recording how long it waited."""
+        await self.wait_ready()
+        return self.get_nowait()
+
+    def stats(self) -> dict:
+        """Depth and counters for the stats endpoint."""
+        return {
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "received": self.put_count,
+            "coalesced": self.coalesced_count,
+            "dropped": self.dropped_count,
+            "queue_wait": self.wait.to_dict(),
+        }
+
+
+class IngestLane:
+    """A CoalescingQueue with its own worker task and processing latency.
+
+    The worker calls ``process(item)`` for each entry in order. With an
+    ``idle_timeout``, a worker that finds its queue empty for that long
+    exits and calls ``on_idle(lane)`` so the owner can drop the lane.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process: Callable[[Any], Awaitable[None]],
+        maxsize: int = 64,
+        idle_timeout: Optional[float] = None,
+        on_idle: Optional[Callable[["IngestLane"], None]] = None,
+    ):
+        self.name = name
+        self.process = process
+        self.queue = CoalescingQueue(maxsize=maxsize)
+        self.process_latency = LatencyStats()
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if not await self.queue.wait_ready(self.idle_timeout):
+                # Empty with no await since the check, so nothing can slip in
+                if self.on_idle is not None:
+                    self.on_idle(self)
+                return
+            _, item = self.queue.get_nowait()
+            started = time.monotonic()
+            try:
+                await self.process(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in ingest lane {self.name}: {e}")
+            self.process_latency.observe(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {**self.queue.stats(), "process": self.process_latency.to_dict()}
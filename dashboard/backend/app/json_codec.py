@@ -0,0 +1,52 @@
+"""JSON encoding and decoding helpers for hot paths.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise, so the fast codec stays an optional dependency.
+"""
+
+import json
+import logging
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on installed extras
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(obj: Any) -> str:
+    """Encode an object built from JSON-compatible types to a compact JSON string."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Like ``dumps`` but returns UTF-8 bytes, skipping a decode/encode round trip."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def backend_name() -> str:
+    """Name of the JSON encoder in use (for logs and benchmarks)."""
+    return "orjson" if orjson is not None else "json"
+
+
+# Payload decoders by name; "auto" picks the fastest one installed
+DECODERS: dict[str, Callable[[bytes | str], Any]] = {"json": json.loads}
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+
+
+def get_decoder(name: str = "auto") -> Callable[[bytes | str], Any]:
+    """Return a decoder taking bytes or str; unknown or missing ones fall back to json."""
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    if name not in DECODERS:
+        logger.warning(f"JSON decoder {name!r} not available, using json")
+        return json.loads
+    return DECODERS[name]
+
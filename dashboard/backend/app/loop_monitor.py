@@ -0,0 +1,216 @@
+"""Event-loop lag sampling and detection of callbacks that block the loop.
+
+Everything in this backend - MQTT ingest, panel updates, WebSocket writers
+and every async route - shares one event loop, so any synchronous work in
+an async handler (image decoding, ZIP building, YAML or JSON parsing)
+delays every WebSocket frame behind it.
+
+LoopMonitor runs a task that asks to wake every ``interval`` seconds and
+records how late it actually woke. That lateness is the time the loop
+spent on something else, and it goes into the ``tigo_event_loop_lag_seconds``
+histogram at /metrics.
+
+With ``block_threshold`` set (``loop_block_detect_enabled``), a watchdog
+thread also checks that task's heartbeat. When the loop has not come back
+for longer than the threshold, the watchdog captures the loop thread's
+stack while it is still blocked and logs it together with the task
+responsible. That is a route (``GET /api/backup/export``, labelled by
+TaskLabelMiddleware) or a background task's coroutine
+(``temp_image_cleanup_loop``). The most recent stalls, with their total
+duration once the loop recovers, are kept for /api/debug/loop.
+
+Unlike asyncio's own debug mode (``slow_callback_duration``), this names
+the code that was running rather than only the handle, and does not slow
+down every callback.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from .config import get_settings
+from .ingest_queue import LatencyStats
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Deepest frames kept per captured stack
+STACK_LIMIT = 40
+
+# Task -> what it is serving, e.g. "GET /api/panels"; read by the watchdog thread
+_task_labels: dict[asyncio.Task, str] = {}
+
+
+class TaskLabelMiddleware:
+    """ASGI middleware naming each request's task after its method and path.
+
+    Pure ASGI rather than BaseHTTPMiddleware, so the endpoint runs in the
+    labelled task instead of a child task.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        task = asyncio.current_task() if scope["type"] in ("http", "websocket") else None
+        if task is None:
+            await self.app(scope, receive, send)
+            return
+        method = scope.get("method", "WS")
+        _task_labels[task] = f"{method} {scope.get('path', '')}"
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _task_labels.pop(task, None)
+
+
+def describe_task(task: Optional[asyncio.Task]) -> str:
+    """Route label, or the task's coroutine name, for logs."""
+    if task is None:
+        return "event loop callback (no task)"
+    label = _task_labels.get(task)
+    if label is not None:
+        return label
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or repr(coro)
+    return f"task {task.get_name()} ({name})"
+
+
+class LoopMonitor:
+    """Loop lag sampler plus an optional blocked-loop watchdog."""
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        block_threshold: Optional[float] = None,
+        max_stalls: int = 50,
+    ):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.lag = LatencyStats()
+        self.stalls: deque[dict] = deque(maxlen=max_stalls)
+        self.stall_count = 0
+        self._lag_histogram = get_metrics().event_loop_lag_seconds
+        self._blocked_counter = get_metrics().event_loop_blocked
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Monotonic time the sampler expects to wake next; written by the loop, read by the watchdog
+        self._expected = 0.0
+        self._current_stall: Optional[dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        """Start sampling on the running loop, and the watchdog if a threshold is set."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._expected = time.monotonic() + self.interval
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run(), name="loop-lag-sampler")
+        if self.block_threshold:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+            logger.info(f"Logging event loop stalls longer than {self.block_threshold * 1000:.0f} ms")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._expected)
+            self.lag.observe(lag)
+            self._lag_histogram.observe(lag)
+            stall = self._current_stall
+            if stall is not None:
+                # The watchdog saw this stall begin; it is over now
+                self._current_stall = None
+                stall["duration_ms"] = round(lag * 1000, 1)
+                logger.warning(
+                    f"Event loop was blocked for {stall['duration_ms']:.0f} ms by {stall['culprit']}"
+                )
+
+    def _watch(self) -> None:
+        """Watchdog thread: capture the loop thread's stack while it is blocked."""
+        period = max(self.block_threshold / 4, 0.01)
+        while not self._stop.wait(period):
+            blocked = time.monotonic() - self._expected
+            if blocked < self.block_threshold or self._current_stall is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            culprit = describe_task(asyncio.current_task(self._loop))
+            stack = traceback.format_stack(frame, limit=STACK_LIMIT)
+            stall = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "culprit": culprit,
+                "blocked_ms_at_capture": round(blocked * 1000, 1),
+                "duration_ms": None,  # Filled in when the loop recovers
+                "stack": [line.rstrip() for line in stack],
+            }
+            self._current_stall = stall
+            self.stalls.append(stall)
+            self.stall_count += 1
+            self._blocked_counter.inc()
+            logger.warning(
+                f"Event loop blocked for over {self.block_threshold * 1000:.0f} ms by {culprit}:\n"
+                + "".join(stack)
+            )
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 1),
+            "block_threshold_ms": round(self.block_threshold * 1000, 1) if self.block_threshold else None,
+            "lag": self.lag.to_dict(),
+            "lag_p99_ms": _ms(self._lag_histogram.quantile(0.99)),
+            "stalls_detected": self.stall_count,
+            "stalls": list(self.stalls),
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+# Singleton instance
+_loop_monitor: Optional[LoopMonitor] = None
+
+
+def get_loop_monitor() -> LoopMonitor:
+    """Get or create the singleton LoopMonitor from settings."""
+    global _loop_monitor
+    if _loop_monitor is None:
+        settings = get_settings()
+        _loop_monitor = LoopMonitor(
+            interval=settings.loop_lag_interval_ms / 1000.0,
+            block_threshold=(
+                settings.loop_block_threshold_ms / 1000.0 if settings.loop_block_detect_enabled else None
+            ),
+        )
+    return _loop_monitor
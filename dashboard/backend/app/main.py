@@ -2,25 +2,44 @@ import asyncio
 import json
 import logging
 import os
-from contextlib import asynccontextmanager
-from typing import List
+import socket
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime, timezone
+from typing import IO, List
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
-from . import VERSION
+from . import VERSION, tracing
 from .config import get_settings
-from .panel_service import PanelService
+from .config_watcher import ConfigWatcher
+from .panel_service import get_panel_service
 from .websocket_manager import ConnectionManager
+from .change_filter import NodeChangeFilter
+from .fanout import FANOUT_ROLES, EdgeMirror, FanoutPublisher
 from .mqtt_client import MQTTClient
+from .mqtt_hub import MQTTHub, get_mqtt_hub
 from .backup_router import router as backup_router
 from .backup_service import get_backup_service
 from .config_router import router as config_router
 from .config_service import get_config_service
+from .debug_router import router as debug_router
 from .discovery_router import router as discovery_router
 from .discovery_router import discovery_websocket_router
+from .discovery_service import get_discovery_service
+from .history_router import ingest_panels, router as history_router, set_panel_source
+from .history_store import get_history_store
+from .rollups import get_rollup_engine
 from .layout_router import router as layout_router
+from .loop_monitor import TaskLabelMiddleware, get_loop_monitor
+from .metrics import get_metrics
+from .profiler import get_profiler
+from .shared_state import HEARTBEAT_INTERVAL, SharedPanelReader, SharedPanelWriter, elect_ingest_worker
+from .sites import get_site_registry
+from .sites_router import router as sites_router
+from .sites_router import site_websocket_router
 
 # Configure logging
 settings = get_settings()
@@ -31,43 +50,72 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Global instances
-panel_service = PanelService()
+panel_service = get_panel_service()
 ws_manager = ConnectionManager(
     batch_interval_ms=settings.ws_batch_interval_ms,
     heartbeat_interval=settings.ws_heartbeat_interval,
+    snapshot_provider=panel_service.get_all_panels,
+    aggregates_provider=panel_service.get_aggregates,
+    send_timeout=settings.ws_send_timeout_seconds,
+    client_queue_size=settings.ws_client_queue_size,
+    slow_client_timeout=settings.ws_slow_client_timeout_seconds,
 )
+mqtt_hub: MQTTHub | None = None
 mqtt_client: MQTTClient | None = None
+config_watcher: ConfigWatcher | None = None
+fanout_publisher: FanoutPublisher | None = None
+edge_mirror: EdgeMirror | None = None
+# Multi-worker mode: the ingest worker writes shared memory, the others read it
+shared_writer: SharedPanelWriter | None = None
+shared_reader: SharedPanelReader | None = None
+
+
+def count_ws_clients() -> dict[tuple[str, ...], int]:
+    """Connected WebSocket clients per site, for the tigo_ws_clients gauge."""
+    counts = {("default",): len(ws_manager.active_connections)}
+    for name, site in get_site_registry().sites.items():
+        counts[(name,)] = len(site.ws_manager.active_connections)
+    return counts
+
+
+get_metrics().ws_clients.collect = count_ws_clients
+
+# Long-lived structures that grow with what the installation has seen, for allocation snapshots
+profiler = get_profiler()
+profiler.watch("panel_service.unknown_serials_logged", lambda: panel_service.unknown_serials_logged)
+profiler.watch("panel_service.node_id_to_panel", lambda: panel_service.node_id_to_panel)
+profiler.watch("discovery_service._discovered_panels", lambda: get_discovery_service()._discovered_panels)
+
+
+async def queue_panel_changes() -> None:
+    """Queue panels changed since the last batch for delta broadcast."""
+    changed, resync = panel_service.get_changed_panels()
+    aggregates = panel_service.get_changed_aggregates()
+    tracing.mark("collect")
+    if shared_writer is not None:
+        shared_writer.publish(
+            changed, resync, panel_service.get_all_panels,
+            panel_service.get_aggregates() if aggregates or resync else None,
+        )
+    await ws_manager.queue_update(changed, resync=resync, aggregates=aggregates)
 
 
-async def handle_mqtt_message(data: dict) -> None:
-    """Handle incoming MQTT message and update panel state (FR-7.3)."""
-    node_serial = data.get("node_serial")
-    if not node_serial:
-        return
+async def handle_config_reload() -> None:
+    """Re-seed mock data and push the reloaded panel set to clients."""
+    if mqtt_client and mqtt_client.change_filter:
+        # Newly configured panels must not wait for a changed reading
+        mqtt_client.change_filter.reset()
+    if settings.use_mock_data:
+        panel_service.apply_mock_data()
+    await queue_panel_changes()
 
-    online = data.get("state_online", "online") == "online"
-
-    # Pass all available fields from MQTT to panel service
-    panel_service.update_panel(
-        sn=node_serial,
-        watts=data.get("power"),
-        voltage_in=data.get("voltage_in"),
-        voltage_out=data.get("voltage_out"),
-        current_in=data.get("current_in"),
-        current_out=data.get("current_out"),
-        temperature=data.get("temperature"),
-        duty_cycle=data.get("duty_cycle"),
-        rssi=data.get("rssi"),
-        energy=data.get("energy"),
-        online=online,
-        timestamp=data.get("timestamp"),
-        node_id=data.get("node_id"),
-        actual_system=data.get("source_system"),
-    )
 
-    # Queue update for WebSocket broadcast
-    panels = panel_service.get_all_panels()
-    await ws_manager.queue_update(panels)
+async def handle_mqtt_state(nodes: dict, source_system: str | None) -> None:
+    """Apply a whole MQTT state payload and queue one broadcast for it (FR-7.3)."""
+    updated = panel_service.apply_state(nodes, source_system)
+    tracing.mark("update_panel")
+    if updated:
+        await queue_panel_changes()
 
 
 async def handle_temp_nodes(system: str, node_ids: List[int]) -> None:
@@ -75,8 +123,7 @@ async def handle_temp_nodes(system: str, node_ids: List[int]) -> None:
     panel_service.update_temp_nodes(system, node_ids)
 
     # Queue update for WebSocket broadcast to reflect is_temporary changes
-    panels = panel_service.get_all_panels()
-    await ws_manager.queue_update(panels)
+    await queue_panel_changes()
 
 
 async def handle_node_mappings(system: str, mappings: dict) -> None:
@@ -84,12 +131,14 @@ async def handle_node_mappings(system: str, mappings: dict) -> None:
     panel_service.update_node_mappings(system, mappings)
 
     # Queue update for WebSocket broadcast to reflect node_id changes
-    panels = panel_service.get_all_panels()
-    await ws_manager.queue_update(panels)
+    await queue_panel_changes()
 
 
 mock_panel_tasks: list[asyncio.Task] = []
 temp_image_cleanup_task: asyncio.Task | None = None
+staleness_task: asyncio.Task | None = None
+history_flush_task: asyncio.Task | None = None
+shared_heartbeat_task: asyncio.Task | None = None
 
 # Cleanup interval for temp restore images (10 minutes)
 TEMP_IMAGE_CLEANUP_INTERVAL = 600
@@ -110,6 +159,41 @@ async def temp_image_cleanup_loop():
             logger.error(f"Error in temp image cleanup: {e}")
 
 
+async def history_flush_loop():
+    """Sample string/system totals into rollups, write buffered data to disk and apply retention."""
+    history_store = get_history_store()
+    rollup_engine = get_rollup_engine()
+    last_prune = None
+    while True:
+        try:
+            await asyncio.sleep(settings.history_flush_interval_seconds)
+            now = datetime.now(timezone.utc)
+            rollup_engine.record_groups(panel_service.aggregates, now.timestamp())
+            await asyncio.to_thread(history_store.flush)
+            await asyncio.to_thread(rollup_engine.flush, now.timestamp())
+            if now.date() != last_prune:
+                await asyncio.to_thread(history_store.prune, now.date())
+                await asyncio.to_thread(rollup_engine.prune, now.date())
+                last_prune = now.date()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in history flush loop: {e}")
+
+
+async def staleness_loop():
+    """Flip panels to stale as their deadlines pass and broadcast the flips (FR-2.6)."""
+    while True:
+        try:
+            await asyncio.sleep(panel_service.seconds_until_next_stale())
+            if panel_service.expire_stale():
+                await queue_panel_changes()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in staleness loop: {e}")
+
+
 async def mock_panel_loop(sn: str, string: str):
     """Simulate a single panel updating on its own random interval."""
     import random
@@ -118,18 +202,179 @@ async def mock_panel_loop(sn: str, string: str):
             await asyncio.sleep(random.uniform(7, 15))
             watts, voltage = panel_service.simulator.generate_panel_value(string)
             panel_service.update_panel(sn=sn, watts=watts, voltage_in=voltage, online=True)
-            panels = panel_service.get_all_panels()
-            await ws_manager.queue_update(panels)
+            await queue_panel_changes()
         except asyncio.CancelledError:
             raise
         except Exception as e:
             logger.error(f"Error in mock panel loop for {sn}: {e}")
 
 
+@asynccontextmanager
+async def edge_lifespan():
+    """Edge instance: serve /ws/panels from an ingest instance's frames, no ingest (fanout.py)."""
+    global mqtt_hub, edge_mirror
+    mqtt_hub = get_mqtt_hub()
+    # Snapshots come from the mirrored frames, not from PanelService
+    ws_manager.snapshot_provider = None
+    ws_manager.aggregates_provider = None
+    # History stays on the ingest instance
+    set_panel_source(None)
+    edge_mirror = EdgeMirror(
+        mqtt_hub,
+        ws_manager,
+        topic=settings.fanout_topic,
+        edge_id=settings.fanout_edge_id or socket.gethostname(),
+    )
+    await edge_mirror.start()
+    ws_manager.start_background_tasks()
+    await mqtt_hub.start()
+    logger.info(f"Running as fan-out edge for {settings.fanout_topic}")
+
+    yield
+
+    await ws_manager.stop_background_tasks()
+    await edge_mirror.stop()
+    await mqtt_hub.stop()
+
+
+async def shared_state_heartbeat_loop():
+    """Ingest worker: tell serving workers it is alive."""
+    while True:
+        try:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            shared_writer.beat()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in shared state heartbeat loop: {e}")
+
+
+async def take_over_ingest(lock: IO, takeover: AsyncExitStack) -> None:
+    """Serving worker whose ingest worker is gone: become the ingest worker in place.
+
+    uvicorn does not restart a dead worker, so nobody else would.
+    ``takeover`` closes the ingest lifespan when this worker shuts down.
+    """
+    global shared_reader
+    logger.warning(f"Ingest worker is gone; worker {os.getpid()} takes over ingest")
+    reader, shared_reader = shared_reader, None
+    reader.close()
+    ws_manager.snapshot_provider = panel_service.get_all_panels
+    ws_manager.aggregates_provider = panel_service.get_aggregates
+    set_panel_source(ingest_panels)
+    await takeover.enter_async_context(ingest_lifespan(lock))
+    # This worker's clients move from the old region to PanelService state
+    await ws_manager.queue_update([], resync=True)
+
+
+async def check_shared_writer(takeover: AsyncExitStack) -> bool:
+    """Follow a restarted ingest worker, or take over if it is gone; True once taken over."""
+    if shared_reader.check_writer(settings.shared_state_stale_seconds) != "stale":
+        return False
+    # The ingest worker holds the election lock until its process exits, so
+    # winning it means there is no ingest worker; losing means it is still
+    # starting up or hung
+    lock = elect_ingest_worker(settings.shared_state_name)
+    if lock is None:
+        return False
+    await take_over_ingest(lock, takeover)
+    return True
+
+
+async def shared_state_poll_loop(takeover: AsyncExitStack):
+    """Queue panels the ingest worker changed in shared memory for this worker's clients."""
+    while True:
+        try:
+            await asyncio.sleep(settings.ws_batch_interval_ms / 1000.0)
+            if await check_shared_writer(takeover):
+                return
+            changed, resync = shared_reader.poll()
+            aggregates = shared_reader.poll_aggregates()
+            if changed or resync or aggregates:
+                await ws_manager.queue_update(changed, resync=resync, aggregates=aggregates)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in shared state poll loop: {e}")
+
+
+@asynccontextmanager
+async def shared_reader_lifespan():
+    """Serving worker: no broker connection, panels come from the ingest worker's shared memory."""
+    global shared_reader
+    shared_reader = SharedPanelReader(settings.shared_state_name)
+    ws_manager.snapshot_provider = shared_reader.read_panels
+    ws_manager.aggregates_provider = shared_reader.read_aggregates
+    # History is read from the shared history directory for these panels
+    set_panel_source(shared_reader.read_panels)
+    ws_manager.start_background_tasks()
+    # Holds the ingest lifespan if this worker ever takes over
+    takeover = AsyncExitStack()
+    poll_task = asyncio.create_task(shared_state_poll_loop(takeover))
+    logger.info(f"Worker {os.getpid()} serving panels from shared state '{settings.shared_state_name}'")
+
+    yield
+
+    poll_task.cancel()
+    try:
+        await poll_task
+    except asyncio.CancelledError:
+        pass
+    await takeover.aclose()
+    await ws_manager.stop_background_tasks()
+    if shared_reader:
+        shared_reader.close()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Application lifespan handler."""
-    global mqtt_client, mock_panel_tasks, temp_image_cleanup_task
+    """Application lifespan handler: loop monitoring around the role's own lifespan."""
+    loop_monitor = get_loop_monitor()
+    if settings.loop_lag_interval_ms > 0:
+        loop_monitor.start()
+    try:
+        async with role_lifespan(app):
+            yield
+    finally:
+        await loop_monitor.stop()
+
+
+@asynccontextmanager
+async def role_lifespan(app: FastAPI):
+    """Start ingest, edge or serving-worker mode, whichever this instance runs."""
+    if settings.fanout_role not in FANOUT_ROLES:
+        raise ValueError(f"Unknown fanout role '{settings.fanout_role}', expected one of {FANOUT_ROLES}")
+    if settings.fanout_role == "edge":
+        async with edge_lifespan():
+            yield
+        return
+
+    # With several uvicorn workers only the elected one ingests
+    shared_state_lock = None
+    if settings.shared_state_enabled:
+        shared_state_lock = elect_ingest_worker(settings.shared_state_name)
+        if shared_state_lock is None:
+            async with shared_reader_lifespan():
+                yield
+            return
+        logger.info(f"Worker {os.getpid()} elected as ingest worker")
+
+    async with ingest_lifespan(shared_state_lock):
+        yield
+
+
+@asynccontextmanager
+async def ingest_lifespan(shared_state_lock: IO | None = None):
+    """Ingest MQTT (or mock data) into PanelService and serve clients from it.
+
+    With the election lock, also mirror panel state into shared memory for
+    the other workers.
+    """
+    global mqtt_hub, mqtt_client, config_watcher, mock_panel_tasks, temp_image_cleanup_task, staleness_task
+    global history_flush_task, fanout_publisher, shared_writer, shared_heartbeat_task
+
+    if shared_state_lock is not None:
+        shared_writer = SharedPanelWriter(settings.shared_state_name, settings.shared_state_max_panels)
 
     # Load panel configuration (FR-1.5)
     # Allow startup without config for setup wizard
@@ -144,6 +389,25 @@ async def lifespan(app: FastAPI):
     # Start WebSocket background tasks
     ws_manager.start_background_tasks()
 
+    # Watch config files for hot-reload off the request path
+    config_watcher = ConfigWatcher(
+        panel_service,
+        on_reload=handle_config_reload,
+        mode=settings.config_watch_mode,
+        poll_interval=settings.config_poll_interval_seconds,
+        debounce_ms=settings.config_reload_debounce_ms,
+    )
+    config_watcher.start()
+
+    # Expire stale panels on their deadlines rather than scanning on every read
+    staleness_task = asyncio.create_task(staleness_loop())
+
+    # Record every accepted reading in the telemetry history store
+    if settings.history_enabled:
+        panel_service.reading_listeners.append(get_history_store().record_panel)
+        panel_service.reading_listeners.append(get_rollup_engine().record_panel)
+        history_flush_task = asyncio.create_task(history_flush_loop())
+
     # Apply mock data if enabled (FR-2.3)
     if settings.use_mock_data:
         panel_service.apply_mock_data()
@@ -154,15 +418,49 @@ async def lifespan(app: FastAPI):
                 task = asyncio.create_task(mock_panel_loop(panel.sn, panel.string))
                 mock_panel_tasks.append(task)
     else:
-        # Start MQTT client with state, temp_nodes, and node_mappings handlers
+        # One broker connection shared by live panels and setup-wizard discovery
+        mqtt_hub = get_mqtt_hub()
         mqtt_client = MQTTClient(
-            on_message=handle_mqtt_message,
+            on_state=handle_mqtt_state,
             on_temp_nodes=handle_temp_nodes,
             on_node_mappings=handle_node_mappings,
+            hub=mqtt_hub,
+            change_filter=(
+                NodeChangeFilter(refresh_seconds=settings.staleness_threshold_seconds / 2)
+                if settings.mqtt_change_filter_enabled else None
+            ),
         )
         await mqtt_client.start()
         logger.info("MQTT client started")
 
+    # Additional sites share this process, event loop and broker connection
+    if settings.sites:
+        site_registry = get_site_registry()
+        site_registry.load(settings, hub=mqtt_hub)
+        await site_registry.start()
+        logger.info(f"Serving {len(site_registry.sites)} additional sites")
+
+    # Republish broadcast frames for edge instances (connects even in mock mode)
+    if settings.fanout_role == "publish":
+        if mqtt_hub is None:
+            mqtt_hub = get_mqtt_hub()
+        fanout_publisher = FanoutPublisher(
+            mqtt_hub,
+            ws_manager,
+            topic=settings.fanout_topic,
+            snapshot_interval=settings.fanout_snapshot_interval_seconds,
+        )
+        await fanout_publisher.start()
+        logger.info(f"Publishing panel frames for edges on {settings.fanout_topic}")
+    if mqtt_hub:
+        await mqtt_hub.start()
+
+    # Give serving workers the initial panel set
+    if shared_writer:
+        shared_writer.write_layout(panel_service.get_all_panels())
+        shared_writer.write_aggregates(panel_service.get_aggregates())
+        shared_heartbeat_task = asyncio.create_task(shared_state_heartbeat_loop())
+
     # Start temp image cleanup task (runs in all modes)
     temp_image_cleanup_task = asyncio.create_task(temp_image_cleanup_loop())
     logger.debug("Temp image cleanup task started")
@@ -170,6 +468,7 @@ async def lifespan(app: FastAPI):
     yield
 
     # Cleanup
+    await config_watcher.stop()
     await ws_manager.stop_background_tasks()
     for task in mock_panel_tasks:
         task.cancel()
@@ -179,14 +478,27 @@ async def lifespan(app: FastAPI):
         except asyncio.CancelledError:
             pass
     mock_panel_tasks.clear()
-    if temp_image_cleanup_task:
-        temp_image_cleanup_task.cancel()
-        try:
-            await temp_image_cleanup_task
-        except asyncio.CancelledError:
-            pass
+    for task in (temp_image_cleanup_task, staleness_task, history_flush_task, shared_heartbeat_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    if history_flush_task:
+        await asyncio.to_thread(get_history_store().flush)
+        await asyncio.to_thread(get_rollup_engine().close_all)
+    await get_site_registry().stop()
+    if fanout_publisher:
+        await fanout_publisher.stop()
     if mqtt_client:
         await mqtt_client.stop()
+    if mqtt_hub:
+        await mqtt_hub.stop()
+    if shared_writer:
+        shared_writer.close()
+        shared_writer = None
+        shared_state_lock.close()
 
 
 app = FastAPI(
@@ -205,6 +517,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Name each request's task after its route, for event loop stall reports
+app.add_middleware(TaskLabelMiddleware)
+
 # Include configuration router for multi-user setup
 app.include_router(config_router)
 
@@ -218,6 +533,16 @@ app.include_router(discovery_websocket_router)
 # Include backup/restore router
 app.include_router(backup_router)
 
+# Include telemetry history router
+app.include_router(history_router)
+
+# Include debug router (hot-path traces)
+app.include_router(debug_router)
+
+# Include multi-site router and per-site WebSocket channels
+app.include_router(sites_router)
+app.include_router(site_websocket_router)
+
 # Serve static files (layout image)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -271,8 +596,12 @@ def check_state_file(path: str | None) -> dict:
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy", "mock_mode": settings.use_mock_data}
+    """Health check endpoint; 503 on a serving worker whose ingest worker stopped responding."""
+    health = {"status": "healthy", "mock_mode": settings.use_mock_data, "fanout_role": settings.fanout_role}
+    if shared_reader is not None and not shared_reader.writer_live:
+        health.update(status="unhealthy", reason="ingest worker not responding")
+        return JSONResponse(status_code=503, content=health)
+    return health
 
 
 @app.get("/api/system-status")
@@ -325,13 +654,29 @@ async def system_status():
 
 @app.post("/api/reload")
 async def reload_config():
-    """Force reload config and broadcast to all clients."""
+    """Force a config reload and push it to clients like the config watcher does.
+
+    Only the instance that ingests holds the panel state (and writes the
+    shared layout); a serving worker or an edge would reload a PanelService
+    nobody reads.
+    """
+    if shared_reader is not None or edge_mirror is not None:
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "success": False,
+                "error": "not_ingest_instance",
+                "message": (
+                    "This instance serves panel state from the ingest instance; "
+                    "send the reload to the ingest instance"
+                ),
+                "details": [],
+            },
+        )
     panel_service.load_config()
-    if settings.use_mock_data:
-        panel_service.apply_mock_data()
-    panels = panel_service.get_all_panels()
-    await ws_manager.broadcast(panels)
-    return {"status": "reloaded", "panels": len(panels)}
+    # Same path as a watched reload: shared layout first, then one snapshot
+    await handle_config_reload()
+    return {"status": "reloaded", "panels": len(panel_service.panel_state)}
 
 
 @app.get("/api/panels")
@@ -341,25 +686,97 @@ async def get_panels():
     Uses by_alias=True for backward compatibility during migration (FR-M.5).
     This outputs 'voltage' instead of 'voltage_in'.
     """
-    panels = panel_service.get_all_panels()
+    if edge_mirror is not None:
+        return {"panels": edge_mirror.get_panels()}
+    panels = shared_reader.read_panels() if shared_reader else panel_service.get_all_panels()
     return {"panels": [p.model_dump(by_alias=True) for p in panels]}
 
 
+@app.get("/api/aggregates")
+async def get_aggregates():
+    """Get per-string and per-system totals: watts, kWh today and peak panel."""
+    if edge_mirror is not None:
+        return edge_mirror.get_aggregates()
+    if shared_reader is not None:
+        return shared_reader.read_aggregates()
+    return panel_service.get_aggregates()
+
+
+@app.get("/api/websocket/stats")
+async def websocket_stats():
+    """Per-client outbound queue depths, drop counts and evictions."""
+    return ws_manager.get_stats()
+
+
+@app.get("/api/mqtt/stats")
+async def mqtt_stats():
+    """MQTT ingest queue depth, coalesced/dropped counts, per-stage latency and duplicates per CCA."""
+    if mqtt_hub is None:
+        return {"running": False, "mock_mode": settings.use_mock_data}
+    stats = mqtt_hub.get_stats()
+    if mqtt_client and mqtt_client.change_filter:
+        stats["change_filter"] = mqtt_client.change_filter.stats()
+    return stats
+
+
+@app.get("/api/fanout/stats")
+async def fanout_stats():
+    """Frames published for edges (publish role) or mirrored from the ingest (edge role)."""
+    if fanout_publisher is not None:
+        return fanout_publisher.get_stats()
+    if edge_mirror is not None:
+        return edge_mirror.get_stats()
+    return {"role": settings.fanout_role}
+
+
+@app.get("/api/shared-state/stats")
+async def shared_state_stats():
+    """This worker's role in multi-worker mode and the shared region's version counters."""
+    if shared_writer is not None:
+        return {"pid": os.getpid(), **shared_writer.get_stats()}
+    if shared_reader is not None:
+        return {"pid": os.getpid(), **shared_reader.get_stats()}
+    return {"enabled": False}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Pipeline metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(
+        get_metrics().render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/metrics")
+async def json_metrics():
+    """Pipeline metrics as JSON, with counter rates since the previous request."""
+    return get_metrics().to_dict()
+
+
 @app.websocket("/ws/panels")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time panel updates (FR-3.1)."""
+    """WebSocket endpoint for real-time panel updates (FR-3.1).
+
+    The joining client gets a full snapshot; everyone else keeps receiving
+    deltas. Clients may send {"type": "resync"} after detecting a sequence gap,
+    and {"type": "subscribe", ...} to receive only some CCAs, strings, panels
+    or a layout rectangle (see subscriptions.py).
+    """
     await ws_manager.connect(websocket)
 
-    # Send initial state immediately
-    panels = panel_service.get_all_panels()
-    await ws_manager.broadcast(panels)
+    # Send initial state to the new client only
+    if edge_mirror is not None:
+        await ws_manager.send_current_snapshot(websocket)
+    else:
+        panels = shared_reader.read_panels() if shared_reader else panel_service.get_all_panels()
+        await ws_manager.send_snapshot(websocket, panels)
 
     try:
         while True:
-            # Wait for any client messages (e.g., pong responses)
+            # Wait for client messages (pong responses, resync and subscription requests)
             data = await websocket.receive_text()
-            # Client might send pong or other messages - we just acknowledge
             logger.debug(f"Received from client: {data}")
+            await ws_manager.handle_client_message(websocket, data)
     except WebSocketDisconnect:
         ws_manager.disconnect(websocket)
     except Exception as e:
@@ -0,0 +1,294 @@
+"""Process-wide operational metrics for the ingest-to-browser pipeline.
+
+One PipelineMetrics registry (``get_metrics()``) holds every metric the
+backend records, from MQTT receive to WebSocket broadcast:
+
+    tigo_mqtt_messages_total{topic,system}   messages received per topic
+                                             type and CCA lane
+    tigo_mqtt_decode_seconds                 payload JSON decode time
+    tigo_mqtt_decode_errors_total            payloads that were not JSON
+    tigo_mqtt_reconnects_total               broker connection failures
+                                             retried by the hub's backoff
+    tigo_panel_update_seconds                PanelService.update_panel time
+                                             per node reading
+    tigo_ws_batch_panels                     panels per broadcast batch
+    tigo_ws_broadcast_seconds                time to encode and queue one
+                                             batch for every client
+    tigo_ws_clients{site}                    connected WebSocket clients
+    tigo_config_reloads_total{result}        config reloads (ok / failed)
+    tigo_config_reload_seconds               read, parse and swap time
+    tigo_event_loop_lag_seconds              how late the loop-lag sampler
+                                             woke (loop_monitor.py)
+    tigo_event_loop_blocked_total            stalls over the block threshold
+
+Recording sits on the hot path, so counters and histograms are plain
+``__slots__`` objects updated in place: a histogram has fixed bucket bounds
+and a preallocated count per bucket, and callers keep a reference to the
+labelled child they update instead of looking it up per message. Gauges
+are computed by a callback when metrics are collected.
+
+``render_prometheus`` produces the Prometheus text exposition format served
+at /metrics; ``to_dict`` is the JSON variant at /api/metrics, which also
+reports per-second counter rates over the time since the previous JSON
+collection (or since start).
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable, Optional
+
+# Seconds; covers sub-millisecond decodes up to multi-second reloads
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+# Panels per broadcast batch
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+# Shortest window the JSON variant computes counter rates over
+MIN_RATE_WINDOW = 1.0
+
+
+class Counter:
+    """A monotonically increasing value."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Histogram:
+    """Observation counts in fixed buckets, plus their count and sum.
+
+    ``counts[i]`` is the number of observations in ``(bounds[i-1], bounds[i]]``;
+    the last slot holds everything above the largest bound.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[int]:
+        """Counts of observations <= each bound, then the total (Prometheus ``le``)."""
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (None if empty or above all bounds)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in zip(self.bounds, self.cumulative()):
+            if total >= rank:
+                return bound
+        return None
+
+
+class MetricFamily:
+    """A named metric and its children, one per combination of label values."""
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.children: dict[tuple[str, ...], Counter | Histogram] = {}
+        # Gauges only: returns {label values: value} when metrics are collected
+        self.collect: Optional[Callable[[], dict[tuple[str, ...], float]]] = None
+
+    def labels(self, *values: str) -> Counter | Histogram:
+        """The child for these label values, created on first use.
+
+        Hot paths call this once and keep the child.
+        """
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = Counter() if self.kind == "counter" else Histogram(self.buckets)
+            self.children[values] = child
+        return child
+
+    def samples(self) -> dict[tuple[str, ...], float]:
+        """Current gauge values by label values."""
+        if self.collect is None:
+            return {}
+        return self.collect()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PipelineMetrics:
+    """Every metric the backend records, with Prometheus and JSON output."""
+
+    def __init__(self):
+        self.families: list[MetricFamily] = []
+        self.started = time.monotonic()
+        # (monotonic time, {(family name, label values): counter value}) at the last JSON collection
+        self._rate_base: Optional[tuple[float, dict]] = None
+
+        self.mqtt_messages = self.counter(
+            "tigo_mqtt_messages_total", "MQTT messages received", ("topic", "system")
+        )
+        self.mqtt_decode_seconds = self.histogram(
+            "tigo_mqtt_decode_seconds", "MQTT payload JSON decode time"
+        ).labels()
+        self.mqtt_decode_errors = self.counter(
+            "tigo_mqtt_decode_errors_total", "MQTT payloads that failed to decode"
+        ).labels()
+        self.mqtt_reconnects = self.counter(
+            "tigo_mqtt_reconnects_total", "MQTT broker connection failures retried with backoff"
+        ).labels()
+        self.panel_update_seconds = self.histogram(
+            "tigo_panel_update_seconds", "PanelService.update_panel time per node reading"
+        ).labels()
+        self.ws_batch_panels = self.histogram(
+            "tigo_ws_batch_panels", "Changed panels per WebSocket broadcast batch", buckets=SIZE_BUCKETS
+        ).labels()
+        self.ws_broadcast_seconds = self.histogram(
+            "tigo_ws_broadcast_seconds", "Time to encode and queue one broadcast batch for every client"
+        ).labels()
+        self.ws_clients = self.gauge("tigo_ws_clients", "Connected WebSocket clients", ("site",))
+        self.config_reloads = self.counter(
+            "tigo_config_reloads_total", "Panel configuration reloads", ("result",)
+        )
+        self.config_reload_seconds = self.histogram(
+            "tigo_config_reload_seconds", "Time to read, parse and install a changed panel configuration"
+        ).labels()
+        self.event_loop_lag_seconds = self.histogram(
+            "tigo_event_loop_lag_seconds", "Event loop lag: how late a periodic sampler task woke up"
+        ).labels()
+        self.event_loop_blocked = self.counter(
+            "tigo_event_loop_blocked_total", "Event loop stalls longer than the block threshold"
+        ).labels()
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> MetricFamily:
+        return self._add(MetricFamily("counter", name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> MetricFamily:
+        return self._add(MetricFamily("histogram", name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> MetricFamily:
+        return self._add(MetricFamily("gauge", name, help, labelnames))
+
+    def _add(self, family: MetricFamily) -> MetricFamily:
+        self.families.append(family)
+        return family
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for family in self.families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            if family.kind == "gauge":
+                for values, value in family.samples().items():
+                    lines.append(f"{family.name}{_label_text(family.labelnames, values)} {_number(value)}")
+                continue
+            for values, child in list(family.children.items()):
+                labels = _label_text(family.labelnames, values)
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{labels} {child.value}")
+                    continue
+                for bound, total in zip(family.buckets + (float("inf"),), child.cumulative()):
+                    le = _label_text(family.labelnames, values, f'le="{_number(bound)}"')
+                    lines.append(f"{family.name}_bucket{le} {total}")
+                lines.append(f"{family.name}_sum{labels} {_number(child.sum)}")
+                lines.append(f"{family.name}_count{labels} {child.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        """All metrics as JSON: counters with rates, histograms with percentiles, gauges."""
+        now = time.monotonic()
+        base_time, base_values = self._rate_base or (self.started, {})
+        elapsed = now - base_time
+        current: dict[tuple[str, tuple[str, ...]], int] = {}
+        result: dict = {"uptime_seconds": round(now - self.started, 3)}
+
+        for family in self.families:
+            entries = []
+            if family.kind == "gauge":
+                for values, value in family.samples().items():
+                    entries.append({"labels": dict(zip(family.labelnames, values)), "value": value})
+            for values, child in list(family.children.items()):
+                entry: dict = {"labels": dict(zip(family.labelnames, values))}
+                if family.kind == "counter":
+                    current[(family.name, values)] = child.value
+                    delta = child.value - base_values.get((family.name, values), 0)
+                    entry["value"] = child.value
+                    entry["per_second"] = round(delta / elapsed, 3) if elapsed > 0 else 0.0
+                else:
+                    entry.update(
+                        count=child.count,
+                        sum=round(child.sum, 6),
+                        mean=round(child.sum / child.count, 6) if child.count else None,
+                        p50=child.quantile(0.5),
+                        p99=child.quantile(0.99),
+                        buckets={
+                            _number(bound): total
+                            for bound, total in zip(family.buckets + (float("inf"),), child.cumulative())
+                        },
+                    )
+                entries.append(entry)
+            result[family.name] = {"type": family.kind, "help": family.help, "values": entries}
+
+        if elapsed >= MIN_RATE_WINDOW:
+            self._rate_base = (now, current)
+        return result
+
+
+# Singleton instance
+_metrics: Optional[PipelineMetrics] = None
+
+
+def get_metrics() -> PipelineMetrics:
+    """Get or create the process-wide PipelineMetrics."""
+    global _metrics
+    if _metrics is None:
+        _metrics = PipelineMetrics()
+    return _metrics
@@ -63,8 +63,34 @@ class PanelData(BaseModel):
 
 
 class WebSocketMessage(BaseModel):
+    """Full panel snapshot frame on /ws/panels.
+
+    Sent when a client connects, when it asks for a resync, and after a
+    config reload. ``seq`` is the broadcast sequence number the snapshot
+    is current as of; subsequent deltas continue from ``seq + 1``.
+    """
+    type: str = "snapshot"
+    seq: int = 0
     timestamp: str
     panels: list[PanelData]
+    # Per-string and per-system totals (see aggregates.py); omitted when unavailable
+    aggregates: Optional[dict] = None
+    # Echo of the client's subscription on snapshots of a subset (see subscriptions.py)
+    subscription: Optional[dict] = None
+
+
+class WebSocketDelta(BaseModel):
+    """Incremental frame on /ws/panels carrying only panels changed since the previous batch.
+
+    Uses a separate ``changed`` key so clients that only understand full
+    ``panels`` frames ignore deltas instead of dropping unchanged panels.
+    """
+    type: str = "delta"
+    seq: int
+    timestamp: str
+    changed: list[PanelData]
+    # Totals for strings/systems changed in this batch only; omitted when none changed
+    aggregates: Optional[dict] = None
 
 
 class MQTTNodeData(BaseModel):
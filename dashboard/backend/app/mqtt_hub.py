@@ -0,0 +1,373 @@
+"""Single shared broker connection fanning taptap messages out to consumers.
+
+The app lifespan owns one MQTTHub. Consumers (live panels, setup-wizard
+discovery, future sinks) register a handler per topic pattern; the hub
+subscribes once per pattern, decodes each message once and calls every
+consumer of that pattern with the same decoded payload.
+
+Receiving and processing run as separate tasks joined by coalescing queues,
+so slow consumers never back up the broker connection: an unprocessed
+message is replaced by a newer one for the same topic (FR-2.7 backoff on
+connection errors is unchanged). Processing is split into one IngestLane
+per CCA - the first topic wildcard, e.g. ``primary`` in
+``taptap/primary/state`` - each with its own queue, worker and latency
+metrics, so a burst from one system never queues another system's
+messages behind it. Lanes are created on a system's first message and
+retired after ``lane_idle_seconds`` without one.
+
+Consumers added with ``coalesce=False`` opt out of coalescing: every
+message on their topics is queued in arrival order, for streams where
+each message matters (fan-out deltas, see fanout.py).
+
+In multi-site mode each site registers its consumers under its own topic
+prefix on the same connection; lanes for those topics are named
+``<prefix>/<system>``.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from . import json_codec, tracing
+from .config import get_settings
+from .ingest_queue import IngestLane, LatencyStats
+from .metrics import Counter, get_metrics
+from .mqtt_router import Handler, RouteMatch, TopicRouter
+
+logger = logging.getLogger(__name__)
+
+ConnectionListener = Callable[[bool, Optional[str]], Awaitable[None]]
+
+
+class MQTTHub:
+    """One aiomqtt connection, one subscription and one decode per topic."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 1883,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        topic_prefix: str = "taptap",
+        decoder: str = "auto",
+        queue_size: int = 64,
+        lane_idle_seconds: Optional[float] = 600.0,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.topic_prefix = topic_prefix
+        self.router = TopicRouter(topic_prefix, decoder=json_codec.get_decoder(decoder))
+        # Topic pattern -> consumers, in registration order
+        self._consumers: dict[str, list[Handler]] = {}
+        # Subscription filters whose messages are queued in order instead of
+        # coalesced, and the counter that gives each such message its own key
+        self._fifo_topics: set[str] = set()
+        self._fifo_keys = itertools.count()
+        # Called with (connected, reason) whenever the broker connection changes
+        self.connection_listeners: list[ConnectionListener] = []
+        self.connected = False
+        self._client = None  # Live aiomqtt.Client while connected, for late subscriptions
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self.queue_size = queue_size
+        self.lane_idle_seconds = lane_idle_seconds
+        # Lane name (CCA system) -> its queue and worker
+        self.lanes: dict[str, IngestLane] = {}
+        # Counters carried over from retired lanes so totals never go backwards
+        self._retired = {"received": 0, "coalesced": 0, "dropped": 0, "lanes": 0}
+        self.receive_latency = LatencyStats()
+        self.process_latency = LatencyStats()
+        self.ignored_count = 0
+        self.reconnect_count = 0
+        self._metrics = get_metrics()
+        self._tracer = tracing.get_tracer()
+        # Lane name -> subscription filter -> its tigo_mqtt_messages_total child,
+        # so counting a message needs no lookup by labels
+        self._message_counters: dict[str, dict[str, Counter]] = {}
+        self._retry_delay = 1  # Initial retry delay in seconds
+        self._max_retry_delay = 60  # Max retry delay (FR-2.7)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def serves(self, host: str, port: int, username: Optional[str], topic_prefix: str) -> bool:
+        """Whether a connection with these settings would see the same messages."""
+        return (
+            host.strip().lower() == self.host.strip().lower()
+            and port == self.port
+            and (username or None) == (self.username or None)
+            and topic_prefix.rstrip("/") == self.router.prefix
+        )
+
+    def _consumer_key(self, pattern: str, prefix: Optional[str]) -> str:
+        """Key for a pattern: bare under the hub's prefix, else the full filter."""
+        if prefix is None or prefix.rstrip("/") == self.router.prefix:
+            return pattern
+        return f"{prefix.rstrip('/')}/{pattern}"
+
+    async def add_consumer(
+        self,
+        pattern: str,
+        handler: Handler,
+        prefix: Optional[str] = None,
+        coalesce: bool = True,
+    ) -> None:
+        """Deliver messages matching ``<prefix>/<pattern>`` to ``handler``.
+
+        The handler is called as ``handler(payload, *wildcards)``. ``prefix``
+        defaults to the hub's topic prefix; multi-site mode passes each
+        site's own. A pattern seen for the first time is subscribed
+        immediately if connected. With ``coalesce=False`` no message on the
+        pattern is ever replaced by a newer one; they are delivered in
+        arrival order (only a full lane still drops its oldest entry).
+        """
+        key = self._consumer_key(pattern, prefix)
+        consumers = self._consumers.get(key)
+        if consumers is None:
+            consumers = self._consumers[key] = []
+            route = self.router.add(
+                pattern,
+                lambda payload, *params: self._fan_out(consumers, payload, params),
+                prefix=prefix,
+            )
+            if not coalesce:
+                self._fifo_topics.add(route.topic)
+            if self._client is not None:
+                await self._client.subscribe(route.topic)
+                logger.info(f"Subscribed to topic: {route.topic}")
+        if handler not in consumers:
+            consumers.append(handler)
+
+    def remove_consumer(self, pattern: str, handler: Handler, prefix: Optional[str] = None) -> None:
+        """Stop delivering to ``handler``; the broker subscription is kept."""
+        consumers = self._consumers.get(self._consumer_key(pattern, prefix))
+        if consumers and handler in consumers:
+            consumers.remove(handler)
+
+    async def publish(self, topic: str, payload: bytes | str, retain: bool = False) -> bool:
+        """Publish on the shared connection; returns False if not connected."""
+        client = self._client
+        if client is None:
+            return False
+        try:
+            await client.publish(topic, payload, retain=retain)
+        except Exception as e:
+            logger.warning(f"Failed to publish to {topic}: {e}")
+            return False
+        return True
+
+    async def _fan_out(self, consumers: list[Handler], payload, params: tuple) -> None:
+        for handler in list(consumers):
+            try:
+                await handler(payload, *params)
+            except Exception as e:
+                logger.error(f"Error in MQTT consumer {getattr(handler, '__qualname__', handler)}: {e}")
+
+    async def _notify_connection(self, connected: bool, reason: Optional[str] = None) -> None:
+        self.connected = connected
+        for listener in list(self.connection_listeners):
+            try:
+                await listener(connected, reason)
+            except Exception as e:
+                logger.error(f"Error in MQTT connection listener: {e}")
+
+    async def start(self, connect: bool = True) -> None:
+        """Start receiving and processing with reconnection logic.
+
+        With ``connect=False`` only the processing lanes run, and messages
+        are fed in through ``enqueue`` (benchmarks and tests).
+        """
+        self._running = True
+        for lane in self.lanes.values():
+            lane.start()
+        if connect:
+            self._task = asyncio.create_task(self._connect_loop())
+
+    async def stop(self) -> None:
+        """Disconnect and stop every lane."""
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for lane in list(self.lanes.values()):
+            await lane.stop()
+        self._client = None
+        self.connected = False
+
+    def pending(self) -> int:
+        """Messages waiting across all lanes."""
+        return sum(len(lane.queue) for lane in self.lanes.values())
+
+    def get_stats(self) -> dict:
+        """Ingest totals and per-stage latency, plus per-lane queues and latency, and consumers."""
+        lanes = {name: lane.stats() for name, lane in self.lanes.items()}
+        totals = {
+            key: self._retired[key] + sum(lane[key] for lane in lanes.values())
+            for key in ("received", "coalesced", "dropped")
+        }
+        return {
+            "connected": self.connected,
+            "depth": sum(lane["depth"] for lane in lanes.values()),
+            **totals,
+            "ignored": self.ignored_count,
+            "reconnects": self.reconnect_count,
+            "receive": self.receive_latency.to_dict(),
+            "process": self.process_latency.to_dict(),
+            "lanes": lanes,
+            "lanes_retired": self._retired["lanes"],
+            "consumers": {pattern: len(handlers) for pattern, handlers in self._consumers.items()},
+        }
+
+    async def _connect_loop(self) -> None:
+        """Connection loop with exponential backoff (FR-2.7)."""
+        while self._running:
+            try:
+                import aiomqtt
+
+                logger.info(f"Connecting to MQTT broker at {self.host}:{self.port}")
+
+                async with aiomqtt.Client(
+                    hostname=self.host,
+                    port=self.port,
+                    username=self.username,
+                    password=self.password,
+                ) as client:
+                    # Reset retry delay on successful connection
+                    self._retry_delay = 1
+                    logger.info("Connected to MQTT broker")
+
+                    # One subscription per registered pattern, shared by its consumers
+                    for topic in self.router.subscriptions():
+                        await client.subscribe(topic)
+                        logger.info(f"Subscribed to topic: {topic}")
+                    self._client = client
+                    await self._notify_connection(True)
+
+                    async for message in client.messages:
+                        if not self._running:
+                            break
+                        self.enqueue(str(message.topic), message.payload)
+
+            except asyncio.CancelledError:
+                logger.info("MQTT hub task cancelled")
+                break
+            except Exception as e:
+                logger.error(f"MQTT connection error: {e}")
+                self.reconnect_count += 1
+                self._metrics.mqtt_reconnects.inc()
+                await self._notify_connection(False, str(e))
+
+                if self._running:
+                    logger.info(f"Reconnecting in {self._retry_delay} seconds...")
+                    await asyncio.sleep(self._retry_delay)
+                    # Exponential backoff (FR-2.7)
+                    self._retry_delay = min(self._retry_delay * 2, self._max_retry_delay)
+            finally:
+                self._client = None
+
+    def enqueue(self, topic: str, payload: bytes | str) -> None:
+        """Receive stage: match the topic and queue the still-encoded payload on its lane."""
+        started = time.monotonic()
+        matched = self.router.match(topic)
+        if matched is None:
+            self.ignored_count += 1
+            logger.debug(f"Ignoring message from unknown topic: {topic}")
+            return
+        name = matched.params[0] if matched.params else ""
+        if matched.route.prefix != self.router.prefix:
+            # Another site's CCA of the same name gets its own lane
+            name = f"{matched.route.prefix}/{name}"
+        lane = self.lanes.get(name)
+        if lane is None:
+            lane = self._open_lane(name)
+        counters = self._message_counters.get(name)
+        if counters is None:
+            counters = self._message_counters[name] = {}
+        counter = counters.get(matched.route.topic)
+        if counter is None:
+            topic_type = matched.route.name.rsplit("/", 1)[-1]
+            counter = counters[matched.route.topic] = self._metrics.mqtt_messages.labels(topic_type, name)
+        counter.inc()
+        trace = self._tracer.start(topic, name, started) if self._tracer.enabled else None
+        # A newer message on the same topic supersedes an unprocessed one,
+        # except on FIFO topics where every message gets a key of its own
+        key = next(self._fifo_keys) if matched.route.topic in self._fifo_topics else topic
+        lane.queue.put_nowait(key, (matched, payload, trace), now=started)
+        if trace is not None:
+            trace.mark("receive")
+        self.receive_latency.observe(time.monotonic() - started)
+
+    def _open_lane(self, name: str) -> IngestLane:
+        lane = IngestLane(
+            name,
+            self._handle_message,
+            maxsize=self.queue_size,
+            idle_timeout=self.lane_idle_seconds,
+            on_idle=self._retire_lane,
+        )
+        self.lanes[name] = lane
+        if self._running:
+            lane.start()
+        logger.info(f"Opened MQTT ingest lane for {name or 'untagged topics'}")
+        return lane
+
+    def _retire_lane(self, lane: IngestLane) -> None:
+        """Drop a lane whose system stopped publishing, keeping its counters in the totals."""
+        if self.lanes.get(lane.name) is not lane:
+            return
+        del self.lanes[lane.name]
+        stats = lane.queue.stats()
+        for key in ("received", "coalesced", "dropped"):
+            self._retired[key] += stats[key]
+        self._retired["lanes"] += 1
+        logger.info(f"Retired idle MQTT ingest lane for {lane.name or 'untagged topics'}")
+
+    async def _handle_message(
+        self, item: tuple[RouteMatch, bytes | str, Optional[tracing.Trace]]
+    ) -> None:
+        """Decode one message and pass it to its route's consumers."""
+        matched, payload, trace = item
+        started = time.monotonic()
+        token = None
+        if trace is not None:
+            trace.mark("queue_wait")
+            token = tracing.activate(trace)
+        try:
+            await self.router.deliver(matched, payload)
+        except Exception as e:
+            logger.error(f"Error processing MQTT message: {e}")
+        finally:
+            if token is not None:
+                tracing.deactivate(token)
+        self.process_latency.observe(time.monotonic() - started)
+        if trace is not None and not trace.held:
+            self._tracer.finish(trace)
+
+
+# Singleton instance
+_mqtt_hub: Optional[MQTTHub] = None
+
+
+def get_mqtt_hub() -> MQTTHub:
+    """Get or create the singleton MQTTHub for the configured broker."""
+    global _mqtt_hub
+    if _mqtt_hub is None:
+        settings = get_settings()
+        _mqtt_hub = MQTTHub(
+            host=settings.mqtt_broker_host,
+            port=settings.mqtt_broker_port,
+            username=settings.mqtt_username,
+            password=settings.mqtt_password,
+            topic_prefix=settings.mqtt_topic_prefix,
+            decoder=settings.mqtt_payload_decoder,
+            queue_size=settings.mqtt_ingest_queue_size,
+        )
+    return _mqtt_hub
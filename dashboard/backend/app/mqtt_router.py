@@ -0,0 +1,114 @@
+"""Table-driven routing of taptap MQTT topics to handlers.
+
+Patterns are written relative to ``mqtt_topic_prefix`` using MQTT's
+single-level ``+`` wildcard (e.g. ``"+/state"``) and compiled once. Each
+wildcard's value is passed to the handler after the decoded payload, so a
+``+/state`` handler is called as ``handler(payload, system)``:
+
+    router = TopicRouter("taptap")
+    router.add("+/state", on_state)
+    await router.dispatch("taptap/primary/state", b'{"nodes": {}}')
+
+The payload decoder is pluggable (see json_codec.get_decoder) and defaults
+to orjson when installed, with the standard library as fallback.
+"""
+
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from . import json_codec, tracing
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class Route(NamedTuple):
+    """One compiled topic pattern and the handler it maps to."""
+
+    name: str  # Pattern relative to the prefix, e.g. "+/state"
+    topic: str  # Full subscription filter, e.g. "taptap/+/state"
+    regex: re.Pattern
+    handler: Handler
+    prefix: str = ""  # Prefix the pattern was added under
+
+
+class RouteMatch(NamedTuple):
+    """A route matched against a concrete topic, with its wildcard values."""
+
+    route: Route
+    params: tuple[str, ...]
+
+
+def compile_topic(topic: str) -> re.Pattern:
+    """Compile an MQTT filter with ``+`` wildcards to a full-match regex."""
+    parts = [
+        "([^/]+)" if level == "+" else re.escape(level)
+        for level in topic.split("/")
+    ]
+    return re.compile("/".join(parts))
+
+
+class TopicRouter:
+    """Match topics against a table of compiled patterns and dispatch payloads."""
+
+    def __init__(self, prefix: str, decoder: Optional[Callable[[bytes | str], Any]] = None):
+        self.prefix = prefix.rstrip("/")
+        self.decode = decoder or json_codec.get_decoder()
+        self.routes: list[Route] = []
+        metrics = get_metrics()
+        self._decode_seconds = metrics.mqtt_decode_seconds
+        self._decode_errors = metrics.mqtt_decode_errors
+
+    def add(self, pattern: str, handler: Handler, prefix: Optional[str] = None) -> Route:
+        """Map ``<prefix>/<pattern>`` to ``handler``; earlier routes win on overlap.
+
+        ``prefix`` overrides the router's prefix for this route (e.g. another
+        site's topics on the same broker).
+        """
+        prefix = self.prefix if prefix is None else prefix.rstrip("/")
+        topic = f"{prefix}/{pattern}" if prefix else pattern
+        route = Route(pattern, topic, compile_topic(topic), handler, prefix)
+        self.routes.append(route)
+        return route
+
+    def subscriptions(self) -> list[str]:
+        """Topic filters to subscribe to, one per route."""
+        return [route.topic for route in self.routes]
+
+    def match(self, topic: str) -> Optional[RouteMatch]:
+        """Find the route for a topic, or None if nothing handles it."""
+        for route in self.routes:
+            found = route.regex.fullmatch(topic)
+            if found is not None:
+                return RouteMatch(route, found.groups())
+        return None
+
+    async def deliver(self, matched: RouteMatch, payload: bytes | str) -> bool:
+        """Decode a payload for an already-matched topic and call its handler.
+
+        Returns False without calling the handler if the payload is not valid
+        JSON. Handler exceptions propagate to the caller.
+        """
+        started = time.perf_counter()
+        try:
+            data = self.decode(payload)
+        except ValueError as e:
+            self._decode_errors.inc()
+            logger.warning(f"Failed to parse MQTT payload on {matched.route.topic}: {e}")
+            return False
+        self._decode_seconds.observe(time.perf_counter() - started)
+        tracing.mark("decode")
+        await matched.route.handler(data, *matched.params)
+        return True
+
+    async def dispatch(self, topic: str, payload: bytes | str) -> bool:
+        """Route one message; returns False if the topic is unknown or undecodable."""
+        matched = self.match(topic)
+        if matched is None:
+            logger.debug(f"Ignoring message from unknown topic: {topic}")
+            return False
+        return await self.deliver(matched, payload)
@@ -1,13 +1,18 @@
+import heapq
 import json
 import logging
 import random
+import time
 from pathlib import Path
 from datetime import datetime, timezone
-from typing import Optional, List, Set
+from typing import Callable, NamedTuple, Optional, List, Set
 
 import yaml
 
+from .aggregates import AggregateTracker
+from .metrics import get_metrics
 from .models import PanelMapping, PanelConfig, PanelData, Position
+from .panel_state import PanelRecord, as_float
 from .config import get_settings
 
 logger = logging.getLogger(__name__)
@@ -30,27 +35,52 @@ class MockSimulator:
         return watts, voltage
 
 
+class LoadedConfig(NamedTuple):
+    """Panel configuration read from disk, ready to install into PanelService."""
+    mapping: PanelMapping
+    mtime: float
+    using_yaml: bool
+
+
 # Config paths for multi-user setup
 YAML_PANELS_PATH = Path("config/panels.yaml")
 LEGACY_JSON_PATH = Path("config/panel_mapping.json")
 
 
 class PanelService:
-    def __init__(self, config_path: str = "config/panel_mapping.json"):
+    def __init__(
+        self,
+        config_path: str = "config/panel_mapping.json",
+        yaml_path: Optional[str] = None,
+    ):
         self.config_path = Path(config_path)
-        self.yaml_path = YAML_PANELS_PATH
+        self.yaml_path = Path(yaml_path) if yaml_path else YAML_PANELS_PATH
         self.panel_mapping: Optional[PanelMapping] = None
         self._using_yaml = False
         self.panels_by_sn: dict[str, PanelConfig] = {}
-        self.panel_state: dict[str, PanelData] = {}
+        # Mutable per-panel records; PanelData is only built at the API boundary
+        self.panel_state: dict[str, PanelRecord] = {}
         self.last_update: dict[str, datetime] = {}
+        # Staleness deadlines (FR-2.6): min-heap of (expiry timestamp, display_label)
+        # with at most one entry per panel; entries are re-checked against
+        # last_update when they come due, so updates never touch the heap.
+        self.staleness_threshold = get_settings().staleness_threshold_seconds
+        self._stale_heap: list[tuple[float, str]] = []
+        self._stale_scheduled: set[str] = set()
         self.unknown_serials_logged: set[str] = set()
+        # Running string/system totals updated from per-reading deltas
+        self.aggregates = AggregateTracker()
+        # Called with the updated record after every accepted reading (e.g. history)
+        self.reading_listeners: list[Callable[[PanelRecord], None]] = []
         self._config_mtime: float = 0
         # Temporary ID tracking (FR-5.4)
         self.temp_nodes: dict[str, Set[int]] = {}  # system -> set of temp node IDs
         self.node_id_to_panel: dict[str, str] = {}  # node_id -> display_label
         # Node mappings from sidecar: system -> {node_id: serial}
         self.node_mappings: dict[str, dict[str, str]] = {}
+        # Change tracking for delta WebSocket broadcasts
+        self._changed_labels: set[str] = set()
+        self._resync_required: bool = False
 
     def load_config(self) -> None:
         """Load and validate panel mapping configuration (FR-1.5).
@@ -59,22 +89,61 @@ class PanelService:
         1. If YAML files exist, use YAML (ignore JSON)
         2. If only JSON exists, use JSON
         """
+        loaded = self.read_config()
+        if loaded is None:
+            raise FileNotFoundError(
+                f"No configuration found. Expected YAML at {self.yaml_path} "
+                f"or JSON at {self.config_path}"
+            )
+        self.install_config(loaded)
+
+    def read_config(self) -> Optional[LoadedConfig]:
+        """Read and validate the config from disk without touching live state.
+
+        Safe to run in a worker thread; returns None if no config file exists.
+        """
         # Check for YAML config first (Phase 1 multi-user format)
         if self.yaml_path.exists():
-            self._load_yaml_config()
-            return
+            return self._read_yaml_config()
 
         # Fall back to legacy JSON format
         if not self.config_path.exists():
-            raise FileNotFoundError(
-                f"No configuration found. Expected YAML at {self.yaml_path} "
-                f"or JSON at {self.config_path}"
-            )
+            return None
+
+        return self._read_legacy_json_config()
+
+    def install_config(self, loaded: LoadedConfig) -> None:
+        """Swap in a config returned by read_config in one step."""
+        self.panel_mapping = loaded.mapping
+        self._config_mtime = loaded.mtime
+        self._using_yaml = loaded.using_yaml
+
+        # Build lookup by serial number
+        self.panels_by_sn = {p.sn: p for p in self.panel_mapping.panels}
+
+        self._rebuild_panel_state()
+
+        source = "YAML config" if loaded.using_yaml else "config"
+        logger.info(f"Loaded {len(self.panel_mapping.panels)} panels from {source}")
 
-        self._load_legacy_json_config()
+    def clear_config(self) -> bool:
+        """Drop all panels after the config file was removed (e.g. reset).
+
+        Returns True if there was state to clear.
+        """
+        if not self.panel_state:
+            return False
+        logger.info("Config file removed, clearing panel state")
+        self.panel_state = {}
+        self.panels_by_sn = {}
+        self.panel_mapping = PanelMapping(panels=[], translations={})
+        self.aggregates.rebuild([])
+        self._changed_labels.clear()
+        self._resync_required = True
+        return True
 
-    def _load_yaml_config(self) -> None:
-        """Load configuration from YAML format (Phase 1)."""
+    def _read_yaml_config(self) -> LoadedConfig:
+        """Read configuration from YAML format (Phase 1)."""
         logger.info(f"Loading YAML config from {self.yaml_path}")
 
         with open(self.yaml_path, "r") as f:
@@ -130,106 +199,49 @@ class PanelService:
                     ),
                 )
 
-        self.panel_mapping = PanelMapping(
+        mapping = PanelMapping(
             panels=panels,
             translations=data.get("translations", {})
         )
-        self._config_mtime = self.yaml_path.stat().st_mtime
-        self._using_yaml = True
-
-        # Build lookup by serial number
-        self.panels_by_sn = {p.sn: p for p in self.panel_mapping.panels}
-
-        # Preserve existing watts/voltage/online state when reloading
-        old_state = {k: v for k, v in self.panel_state.items()}
-
-        # Build new panel state, preserving existing values where display_label matches
-        new_panel_state: dict[str, PanelData] = {}
-        for panel in self.panel_mapping.panels:
-            old = old_state.get(panel.display_label)
-            new_panel_state[panel.display_label] = PanelData(
-                display_label=panel.display_label,
-                tigo_label=panel.tigo_label,
-                string=panel.string,
-                system=panel.system,
-                sn=panel.sn,
-                node_id=old.node_id if old else None,
-                watts=old.watts if old else None,
-                voltage_in=old.voltage_in if old else None,
-                voltage_out=old.voltage_out if old else None,
-                current_in=old.current_in if old else None,
-                current_out=old.current_out if old else None,
-                temperature=old.temperature if old else None,
-                duty_cycle=old.duty_cycle if old else None,
-                rssi=old.rssi if old else None,
-                energy=old.energy if old else None,
-                online=old.online if old else True,
-                stale=old.stale if old else False,
-                is_temporary=old.is_temporary if old else False,
-                last_update=old.last_update if old else None,
-                position=panel.position,
-            )
-
-        # Replace panel_state entirely to remove stale entries from old config
-        self.panel_state = new_panel_state
+        return LoadedConfig(mapping, self.yaml_path.stat().st_mtime, using_yaml=True)
 
-        logger.info(f"Loaded {len(self.panel_mapping.panels)} panels from YAML config")
-
-    def _load_legacy_json_config(self) -> None:
-        """Load configuration from legacy JSON format."""
+    def _read_legacy_json_config(self) -> LoadedConfig:
+        """Read configuration from legacy JSON format."""
         logger.info(f"Loading legacy JSON config from {self.config_path}")
 
         with open(self.config_path, "r") as f:
             data = json.load(f)
 
         # Pydantic validation handles FR-1.5 requirements
-        self.panel_mapping = PanelMapping(**data)
-        self._config_mtime = self.config_path.stat().st_mtime
-        self._using_yaml = False
-
-        # Build lookup by serial number
-        self.panels_by_sn = {p.sn: p for p in self.panel_mapping.panels}
-
-        # Preserve existing watts/voltage/online state when reloading
-        old_state = {k: v for k, v in self.panel_state.items()}
+        mapping = PanelMapping(**data)
+        return LoadedConfig(mapping, self.config_path.stat().st_mtime, using_yaml=False)
 
-        # Build new panel state, preserving existing values where display_label matches
-        new_panel_state: dict[str, PanelData] = {}
+    def _rebuild_panel_state(self) -> None:
+        """Build records for the loaded config, preserving readings where display_label matches."""
+        old_state = self.panel_state
+        new_panel_state: dict[str, PanelRecord] = {}
         for panel in self.panel_mapping.panels:
+            record = PanelRecord(panel)
             old = old_state.get(panel.display_label)
-            new_panel_state[panel.display_label] = PanelData(
-                display_label=panel.display_label,
-                tigo_label=panel.tigo_label,
-                string=panel.string,
-                system=panel.system,
-                sn=panel.sn,
-                node_id=old.node_id if old else None,
-                watts=old.watts if old else None,
-                voltage_in=old.voltage_in if old else None,
-                voltage_out=old.voltage_out if old else None,
-                current_in=old.current_in if old else None,
-                current_out=old.current_out if old else None,
-                temperature=old.temperature if old else None,
-                duty_cycle=old.duty_cycle if old else None,
-                rssi=old.rssi if old else None,
-                energy=old.energy if old else None,
-                online=old.online if old else True,
-                stale=old.stale if old else False,
-                is_temporary=old.is_temporary if old else False,
-                last_update=old.last_update if old else None,
-                position=panel.position,
-            )
+            if old is not None:
+                record.copy_readings_from(old)
+            new_panel_state[panel.display_label] = record
 
         # Replace panel_state entirely to remove stale entries from old config
         self.panel_state = new_panel_state
-
-        logger.info(f"Loaded {len(self.panel_mapping.panels)} panels from config")
-
-    def check_and_reload_config(self) -> bool:
-        """Check if config file has changed and reload if necessary.
-
-        Uses a 2-second tolerance to avoid spurious reloads on NAS mounts
-        where mtime can fluctuate due to network timing issues.
+        self.aggregates.rebuild(new_panel_state.values())
+        # Panel set may have changed, so clients need a full snapshot
+        self._changed_labels.clear()
+        self._resync_required = True
+
+    def detect_config_change(self) -> Optional[str]:
+        """Stat the config files and report what a reload needs to do.
+
+        Returns "reload" if the config (or a newly added YAML config) should be
+        re-read, "clear" if the config file was removed, otherwise None. Uses a
+        2-second tolerance to avoid spurious reloads on NAS mounts where mtime
+        can fluctuate due to network timing issues. Only touches the disk, so it
+        can run in a worker thread.
         """
         # Determine which config file to check
         if self._using_yaml:
@@ -240,28 +252,36 @@ class PanelService:
         if not config_file.exists():
             # Check if YAML was added (upgrade from JSON)
             if self.yaml_path.exists() and not self._using_yaml:
-                logger.info("YAML config detected, switching from JSON...")
-                self.load_config()
-                return True
+                return "reload"
             # Config file was deleted (e.g. reset) - clear in-memory state
-            if self.panel_state:
-                logger.info("Config file removed, clearing panel state")
-                self.panel_state = {}
-                self.panels_by_sn = {}
-                self.panel_mapping = PanelMapping(panels=[], translations={})
-            return False
+            return "clear" if self.panel_state else None
 
         current_mtime = config_file.stat().st_mtime
         # Require at least 2 seconds difference to avoid NAS timing jitter
         if current_mtime > self._config_mtime + 2.0:
-            logger.info("Config file changed, reloading...")
-            self.load_config()
-            settings = get_settings()
-            if settings.use_mock_data:
-                self._init_simulator()
-                self.apply_mock_data()
-            return True
-        return False
+            return "reload"
+        return None
+
+    def check_and_reload_config(self) -> bool:
+        """Check if config file has changed and reload if necessary.
+
+        Blocking convenience for callers outside the event loop; the running
+        app detects changes with ConfigWatcher instead so reads never stat the
+        config files.
+        """
+        change = self.detect_config_change()
+        if change == "clear":
+            self.clear_config()
+            return False
+        if change != "reload":
+            return False
+        logger.info("Config file changed, reloading...")
+        self.load_config()
+        settings = get_settings()
+        if settings.use_mock_data:
+            self._init_simulator()
+            self.apply_mock_data()
+        return True
 
     def get_panel_by_sn(self, sn: str) -> Optional[PanelConfig]:
         """Look up panel by serial number (FR-2.4)."""
@@ -283,8 +303,13 @@ class PanelService:
         timestamp: Optional[str] = None,
         node_id: Optional[str] = None,
         actual_system: Optional[str] = None,
+        received_at: Optional[datetime] = None,
     ) -> bool:
-        """Update panel data from MQTT message (FR-2.4, FR-2.5, FR-7.3)."""
+        """Update panel data from MQTT message (FR-2.4, FR-2.5, FR-7.3).
+
+        ``received_at`` lets batch callers stamp every node in one state
+        message with the same time instead of reading the clock per node.
+        """
         panel_config = self.get_panel_by_sn(sn)
 
         if panel_config is None:
@@ -295,11 +320,20 @@ class PanelService:
             return False
 
         display_label = panel_config.display_label
-        self.last_update[display_label] = datetime.now(timezone.utc)
+        received_at = received_at or datetime.now(timezone.utc)
+        self.last_update[display_label] = received_at
+        if display_label not in self._stale_scheduled:
+            self._stale_scheduled.add(display_label)
+            heapq.heappush(
+                self._stale_heap, (received_at.timestamp() + self.staleness_threshold, display_label)
+            )
+
+        record = self.panel_state.get(display_label)
+        if record is None:
+            return False
 
         # Preserve existing node_id if not provided (node_id comes from sidecar, not MQTT)
-        existing = self.panel_state.get(display_label)
-        effective_node_id = node_id if node_id is not None else (existing.node_id if existing else None)
+        effective_node_id = str(node_id) if node_id is not None else record.node_id
 
         # Track node_id → display_label mapping for temp ID detection (FR-5.4)
         if effective_node_id:
@@ -315,48 +349,162 @@ class PanelService:
             except (ValueError, TypeError):
                 pass
 
-        self.panel_state[display_label] = PanelData(
-            display_label=display_label,
-            tigo_label=panel_config.tigo_label,
-            string=panel_config.string,
-            system=panel_config.system,
-            sn=panel_config.sn,
-            node_id=effective_node_id,
-            watts=watts,
-            voltage_in=voltage_in,
-            voltage_out=voltage_out,
-            current_in=current_in,
-            current_out=current_out,
-            temperature=temperature,
-            duty_cycle=duty_cycle,
-            rssi=rssi,
-            energy=energy,
-            online=online,
-            stale=False,
-            is_temporary=is_temporary,
-            actual_system=actual_system,
-            last_update=self.last_update.get(display_label),
-            position=panel_config.position,
-        )
+        old_watts = record.watts
+        old_energy = record.energy
+        record.node_id = effective_node_id
+        record.watts = as_float(watts)
+        record.voltage_in = as_float(voltage_in)
+        record.voltage_out = as_float(voltage_out)
+        record.current_in = as_float(current_in)
+        record.current_out = as_float(current_out)
+        record.temperature = as_float(temperature)
+        record.duty_cycle = as_float(duty_cycle)
+        record.rssi = as_float(rssi)
+        record.energy = as_float(energy)
+        record.online = bool(online)
+        record.stale = False
+        record.is_temporary = is_temporary
+        record.actual_system = actual_system
+        record.last_update = self.last_update[display_label]
+        self._changed_labels.add(display_label)
+        self.aggregates.update(record, old_watts, old_energy, received_at)
+        for listener in self.reading_listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                logger.error(f"Reading listener failed for {display_label}: {e}")
         return True
 
+    def apply_state(self, nodes: dict, source_system: Optional[str] = None) -> int:
+        """Apply every node reading from one taptap state payload (FR-2.2, FR-7.3).
+
+        Args:
+            nodes: The payload's ``nodes`` dict, keyed by Tigo label
+            source_system: CCA the payload was published by
+
+        Returns:
+            Number of configured panels that were updated
+        """
+        received_at = datetime.now(timezone.utc)
+        updated = 0
+        update_seconds = get_metrics().panel_update_seconds
+
+        for node_data in nodes.values():
+            if not isinstance(node_data, dict):
+                continue
+
+            node_serial = node_data.get("node_serial")
+            if not node_serial:
+                continue
+
+            started = time.perf_counter()
+            applied = self.update_panel(
+                sn=node_serial,
+                watts=node_data.get("power"),
+                voltage_in=node_data.get("voltage_in"),
+                voltage_out=node_data.get("voltage_out"),
+                current_in=node_data.get("current_in"),
+                current_out=node_data.get("current_out"),
+                temperature=node_data.get("temperature"),
+                duty_cycle=node_data.get("duty_cycle"),
+                rssi=node_data.get("rssi"),
+                energy=node_data.get("energy"),
+                online=node_data.get("state_online", "online") == "online",
+                timestamp=node_data.get("timestamp"),
+                node_id=node_data.get("node_id"),
+                actual_system=source_system,
+                received_at=received_at,
+            )
+            update_seconds.observe(time.perf_counter() - started)
+            if applied:
+                updated += 1
+
+        return updated
+
     def check_staleness(self) -> None:
-        """Mark stale panels based on last update time (FR-2.6)."""
-        settings = get_settings()
-        threshold = settings.staleness_threshold_seconds
+        """Mark stale panels based on last update time (FR-2.6).
+
+        Full sweep over every panel. The running app relies on expire_stale
+        instead; this remains for one-off checks such as after a clock jump.
+        """
+        threshold = self.staleness_threshold
         now = datetime.now(timezone.utc)
 
-        for display_label, panel_data in self.panel_state.items():
+        for display_label, record in self.panel_state.items():
             last = self.last_update.get(display_label)
             if last is not None:
                 age_seconds = (now - last).total_seconds()
-                panel_data.stale = age_seconds > threshold
+                stale = age_seconds > threshold
+                if stale != record.stale:
+                    record.stale = stale
+                    self._changed_labels.add(display_label)
+
+    def seconds_until_next_stale(self) -> float:
+        """Time until the earliest scheduled staleness deadline (FR-2.6).
+
+        With nothing scheduled, any panel updated from now on expires no
+        sooner than one full threshold away.
+        """
+        if not self._stale_heap:
+            return float(self.staleness_threshold)
+        deadline = self._stale_heap[0][0]
+        return max(0.0, deadline - datetime.now(timezone.utc).timestamp())
+
+    def expire_stale(self, now: Optional[datetime] = None) -> list[str]:
+        """Flip panels whose staleness deadline has passed (FR-2.6).
+
+        Pops only deadlines that are due. A panel updated since its entry was
+        pushed is re-scheduled at its real deadline instead of being flipped.
+        Returns the display labels that became stale; they are also marked
+        changed so the next delta carries them.
+        """
+        now_ts = (now or datetime.now(timezone.utc)).timestamp()
+        expired = []
+        while self._stale_heap and self._stale_heap[0][0] <= now_ts:
+            _, display_label = heapq.heappop(self._stale_heap)
+            last = self.last_update.get(display_label)
+            record = self.panel_state.get(display_label)
+            if last is None or record is None:
+                self._stale_scheduled.discard(display_label)
+                continue
+            deadline = last.timestamp() + self.staleness_threshold
+            if deadline > now_ts:
+                heapq.heappush(self._stale_heap, (deadline, display_label))
+                continue
+            self._stale_scheduled.discard(display_label)
+            if not record.stale:
+                record.stale = True
+                self._changed_labels.add(display_label)
+                expired.append(display_label)
+        return expired
 
     def get_all_panels(self) -> list[PanelData]:
         """Get current state of all panels."""
-        self.check_and_reload_config()  # Hot-reload if config changed
-        self.check_staleness()
-        return list(self.panel_state.values())
+        return [record.to_model() for record in self.panel_state.values()]
+
+    def get_changed_panels(self) -> tuple[list[PanelData], bool]:
+        """Return panels changed since the last call and whether a full resync is needed.
+
+        The second element is True after a config reload, when the panel set
+        itself may differ and a delta cannot describe the change.
+        """
+        resync = self._resync_required
+        changed = [
+            self.panel_state[label].to_model()
+            for label in self._changed_labels
+            if label in self.panel_state
+        ]
+        self._changed_labels.clear()
+        self._resync_required = False
+        return changed, resync
+
+    def get_aggregates(self) -> dict:
+        """Current per-string and per-system totals (cached between changes)."""
+        return self.aggregates.snapshot(datetime.now(timezone.utc))
+
+    def get_changed_aggregates(self) -> Optional[dict]:
+        """Totals for strings and systems changed since the last call, or None."""
+        return self.aggregates.drain_changes()
 
     def apply_mock_data(self) -> None:
         """Apply initial mock data to all panels using simulator (FR-2.3)."""
@@ -396,17 +544,20 @@ class PanelService:
         logger.info(f"Updated temp_nodes for {system}: {node_ids}")
 
         # Update is_temporary for all panels in this system that have a node_id
-        for display_label, panel_data in self.panel_state.items():
-            if panel_data.system != system:
+        for display_label, record in self.panel_state.items():
+            if record.system != system:
                 continue
-            if not panel_data.node_id:
+            if not record.node_id:
                 continue
 
             try:
-                node_id_int = int(panel_data.node_id)
-                panel_data.is_temporary = node_id_int in self.temp_nodes[system]
+                node_id_int = int(record.node_id)
+                is_temporary = node_id_int in self.temp_nodes[system]
             except (ValueError, TypeError):
-                pass
+                continue
+            if is_temporary != record.is_temporary:
+                record.is_temporary = is_temporary
+                self._changed_labels.add(display_label)
 
     def update_node_mappings(self, system: str, mappings: dict[str, str]) -> None:
         """Update node_id → serial mappings from the sidecar.
@@ -431,26 +582,43 @@ class PanelService:
 
         # Update node_id for all panels in this system
         matched_count = 0
-        for display_label, panel_data in self.panel_state.items():
-            if panel_data.system != system:
+        for display_label, record in self.panel_state.items():
+            if record.system != system:
                 continue
 
             # Look up node_id by serial number
-            node_id = serial_to_node_id.get(panel_data.sn)
+            node_id = serial_to_node_id.get(record.sn)
             if node_id:
-                panel_data.node_id = node_id
+                if node_id != record.node_id:
+                    record.node_id = node_id
+                    self._changed_labels.add(display_label)
                 matched_count += 1
 
                 # Also update is_temporary based on new node_id
                 try:
                     node_id_int = int(node_id)
                     temp_node_ids = self.temp_nodes.get(system, set())
-                    panel_data.is_temporary = node_id_int in temp_node_ids
+                    is_temporary = node_id_int in temp_node_ids
+                    if is_temporary != record.is_temporary:
+                        record.is_temporary = is_temporary
+                        self._changed_labels.add(display_label)
                 except (ValueError, TypeError):
                     pass
             else:
                 # Debug: log first few unmatched panels
                 if matched_count == 0:
-                    logger.debug(f"No match for panel {display_label} (sn={panel_data.sn})")
+                    logger.debug(f"No match for panel {display_label} (sn={record.sn})")
 
         logger.info(f"Matched {matched_count} panels with node_ids for {system}")
+
+
+# Singleton instance
+_panel_service: Optional[PanelService] = None
+
+
+def get_panel_service() -> PanelService:
+    """Get or create the singleton PanelService instance."""
+    global _panel_service
+    if _panel_service is None:
+        _panel_service = PanelService()
+    return _panel_service
@@ -0,0 +1,93 @@
+"""Mutable per-panel state records.
+
+PanelService keeps one PanelRecord per configured panel and mutates it in
+place on every reading. Pydantic PanelData models are only built at the
+API and WebSocket boundary via ``to_model``.
+"""
+
+from datetime import datetime
+from typing import Any, Optional
+
+from .models import PanelConfig, PanelData, Position
+
+# Reading fields copied across config reloads and written by update_panel
+READING_FIELDS = (
+    "node_id", "watts", "voltage_in", "voltage_out", "current_in", "current_out",
+    "temperature", "duty_cycle", "rssi", "energy", "online", "stale",
+    "is_temporary", "actual_system", "last_update",
+)
+
+
+def as_float(value: Any) -> Optional[float]:
+    """Coerce an MQTT reading to float, mapping missing or malformed values to None."""
+    if value is None or type(value) is float:
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PanelRecord:
+    """Live state of one panel: static config fields plus the latest reading."""
+
+    __slots__ = (
+        "display_label", "tigo_label", "string", "system", "sn", "position",
+    ) + READING_FIELDS
+
+    def __init__(self, config: PanelConfig):
+        self.display_label: str = config.display_label
+        self.tigo_label: Optional[str] = config.tigo_label
+        self.string: str = config.string
+        self.system: str = config.system
+        self.sn: str = config.sn
+        self.position: Position = config.position
+        self.node_id: Optional[str] = None
+        self.watts: Optional[float] = None
+        self.voltage_in: Optional[float] = None
+        self.voltage_out: Optional[float] = None
+        self.current_in: Optional[float] = None
+        self.current_out: Optional[float] = None
+        self.temperature: Optional[float] = None
+        self.duty_cycle: Optional[float] = None
+        self.rssi: Optional[float] = None
+        self.energy: Optional[float] = None
+        self.online: bool = True
+        self.stale: bool = False
+        self.is_temporary: bool = False
+        self.actual_system: Optional[str] = None
+        self.last_update: Optional[datetime] = None
+
+    def copy_readings_from(self, other: "PanelRecord") -> None:
+        """Carry the latest reading over from a record built for a previous config."""
+        for field in READING_FIELDS:
+            setattr(self, field, getattr(other, field))
+
+    def to_model(self) -> PanelData:
+        """Materialize a PanelData for serialization.
+
+        Values are normalized when written, so validation is skipped here.
+        """
+        return PanelData.model_construct(
+            display_label=self.display_label,
+            tigo_label=self.tigo_label,
+            string=self.string,
+            system=self.system,
+            sn=self.sn,
+            node_id=self.node_id,
+            watts=self.watts,
+            voltage_in=self.voltage_in,
+            voltage_out=self.voltage_out,
+            current_in=self.current_in,
+            current_out=self.current_out,
+            temperature=self.temperature,
+            duty_cycle=self.duty_cycle,
+            rssi=self.rssi,
+            energy=self.energy,
+            online=self.online,
+            stale=self.stale,
+            is_temporary=self.is_temporary,
+            actual_system=self.actual_system,
+            last_update=self.last_update,
+            position=self.position,
+        )
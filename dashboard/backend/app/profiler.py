@@ -0,0 +1,288 @@
+"""On-demand CPU profiles and allocation snapshots of the live process.
+
+Both tools use only the standard library, so they are available on any
+deployment without reinstalling:
+
+CPU profiles (``Profiler.profile_cpu``) run for a given number of seconds
+while the app keeps serving, in one of two modes:
+
+    sample   a background thread samples the event loop thread's stack
+             every ``interval`` seconds and counts identical stacks. The
+             output is the collapsed-stack text format read by
+             flamegraph.pl, speedscope and similar tools. Overhead does
+             not depend on how much Python code runs.
+    cprofile cProfile on the event loop thread, returned as a pstats file
+             (``python -m pstats profile.prof``). Exact call counts, but
+             every function call gets slower while it runs.
+
+Work handed to worker threads (config parsing, history flushes) is not in
+either profile.
+
+Allocation snapshots (``Profiler.take_snapshot``) start tracemalloc on
+first use and keep the last ``max_snapshots``; ``diff`` compares two of
+them by allocation site. Each snapshot also records the size of
+registered long-lived structures (``watch``), so growth in e.g. the
+unknown-serial set shows up next to the allocation sites that caused it.
+Call ``stop_tracemalloc`` afterwards: tracing slows every allocation.
+
+Only one profile, snapshot or diff runs at a time; a second request while
+one is running raises ProfilerBusyError.
+"""
+
+import asyncio
+import cProfile
+import linecache
+import logging
+import marshal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+from .sites import deep_sizeof
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("sample", "cprofile")
+SNAPSHOT_GROUPINGS = ("lineno", "filename", "traceback")
+# Frames of the profiler and tracemalloc themselves, left out of snapshots
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+class ProfilerBusyError(RuntimeError):
+    """Another profile or snapshot is already running."""
+
+
+class StackSampler:
+    """Count one thread's Python stacks, sampled from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{Path(code.co_filename).stem}:{code.co_qualname}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """``root;...;leaf count`` per distinct stack, most frequent first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """CPU profiles and tracemalloc snapshots, one operation at a time."""
+
+    def __init__(self, max_snapshots: int = 8):
+        self.max_snapshots = max_snapshots
+        # Snapshot id -> (taken at, tracemalloc snapshot, watched structure sizes)
+        self.snapshots: OrderedDict[int, tuple[datetime, tracemalloc.Snapshot, dict]] = OrderedDict()
+        # Name -> callable returning a long-lived structure to report the size of
+        self.watched: dict[str, Callable[[], object]] = {}
+        self._next_id = 1
+        self._busy = False
+
+    @property
+    def busy(self) -> bool:
+        return self._busy
+
+    def _claim(self, what: str) -> None:
+        if self._busy:
+            raise ProfilerBusyError(f"Cannot start {what}: another profile or snapshot is running")
+        self._busy = True
+
+    def watch(self, name: str, provider: Callable[[], object]) -> None:
+        """Report the size of ``provider()`` in every snapshot under ``name``."""
+        self.watched[name] = provider
+
+    async def profile_cpu(self, seconds: float, mode: str = "sample", interval: float = 0.005) -> bytes:
+        """Profile the event loop thread for ``seconds`` and return the encoded result."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+        self._claim("CPU profile")
+        try:
+            logger.info(f"Running {mode} CPU profile for {seconds}s")
+            if mode == "sample":
+                sampler = StackSampler(threading.get_ident(), interval)
+                sampler.start()
+                try:
+                    await asyncio.sleep(seconds)
+                finally:
+                    sampler.stop()
+                return sampler.collapsed().encode("utf-8")
+
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+            profile.create_stats()
+            return marshal.dumps(profile.stats)
+        finally:
+            self._busy = False
+
+    def _watched_sizes(self) -> dict:
+        sizes = {}
+        for name, provider in self.watched.items():
+            try:
+                value = provider()
+                sizes[name] = {"items": len(value), "bytes": deep_sizeof(value)}
+            except Exception as e:
+                sizes[name] = {"error": str(e)}
+        return sizes
+
+    async def take_snapshot(self, nframes: int = 1, limit: int = 10) -> dict:
+        """Snapshot traced allocations, starting tracemalloc first if needed."""
+        self._claim("allocation snapshot")
+        try:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start(nframes)
+                logger.info(f"Started tracemalloc with {nframes} frames per allocation")
+            snapshot = await asyncio.to_thread(
+                lambda: tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            )
+            taken_at = datetime.now(timezone.utc)
+            watched = self._watched_sizes()
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self.snapshots[snapshot_id] = (taken_at, snapshot, watched)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+
+            traced, peak = tracemalloc.get_traced_memory()
+            top = await asyncio.to_thread(snapshot.statistics, "lineno")
+            return {
+                "id": snapshot_id,
+                "taken_at": taken_at.isoformat(),
+                "tracemalloc_started": started,
+                "traced_bytes": traced,
+                "peak_bytes": peak,
+                "top": [_stat_to_dict(stat) for stat in top[:limit]],
+                "watched": watched,
+            }
+        finally:
+            self._busy = False
+
+    async def diff(
+        self,
+        base_id: Optional[int] = None,
+        current_id: Optional[int] = None,
+        limit: int = 25,
+        group_by: str = "lineno",
+    ) -> dict:
+        """Top allocation sites by growth between two snapshots (default: the last two)."""
+        if group_by not in SNAPSHOT_GROUPINGS:
+            raise ValueError(f"Unknown grouping '{group_by}', expected one of {SNAPSHOT_GROUPINGS}")
+        ids = list(self.snapshots)
+        if current_id is None:
+            current_id = ids[-1] if ids else None
+        if base_id is None:
+            earlier = [i for i in ids if current_id is not None and i < current_id]
+            base_id = earlier[-1] if earlier else None
+        if base_id not in self.snapshots or current_id not in self.snapshots:
+            raise KeyError(f"Need two stored snapshots, have {ids}")
+
+        self._claim("snapshot diff")
+        try:
+            base_at, base, base_watched = self.snapshots[base_id]
+            current_at, current, current_watched = self.snapshots[current_id]
+            started = time.monotonic()
+            stats = await asyncio.to_thread(current.compare_to, base, group_by)
+            return {
+                "base": {"id": base_id, "taken_at": base_at.isoformat()},
+                "current": {"id": current_id, "taken_at": current_at.isoformat()},
+                "group_by": group_by,
+                "size_diff_bytes": sum(stat.size_diff for stat in stats),
+                "top": [_stat_to_dict(stat) for stat in stats[:limit]],
+                "watched": {
+                    name: {"base": base_watched.get(name), "current": sizes}
+                    for name, sizes in current_watched.items()
+                },
+                "compare_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+        finally:
+            self._busy = False
+
+    def stop_tracemalloc(self) -> bool:
+        """Stop tracing allocations and drop stored snapshots. Returns False if it was not running."""
+        self._claim("tracemalloc stop")
+        try:
+            self.snapshots.clear()
+            if not tracemalloc.is_tracing():
+                return False
+            tracemalloc.stop()
+            logger.info("Stopped tracemalloc")
+            return True
+        finally:
+            self._busy = False
+
+    def get_stats(self) -> dict:
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            "busy": self._busy,
+            "tracemalloc": tracemalloc.is_tracing(),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "snapshots": [
+                {"id": snapshot_id, "taken_at": taken_at.isoformat()}
+                for snapshot_id, (taken_at, _, _) in self.snapshots.items()
+            ],
+            "watched": sorted(self.watched),
+        }
+
+
+def _stat_to_dict(stat) -> dict:
+    """A tracemalloc Statistic or StatisticDiff as JSON, innermost frame last."""
+    result = {
+        "site": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size_bytes": stat.size,
+        "count": stat.count,
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        result["size_diff_bytes"] = stat.size_diff
+        result["count_diff"] = stat.count_diff
+    return result
+
+
+# Singleton instance
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """Get or create the singleton Profiler."""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
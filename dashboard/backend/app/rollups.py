@@ -0,0 +1,305 @@
+"""Incremental multi-resolution rollups of panel telemetry.
+
+Every accepted reading updates an open bucket per resolution (1 min, 15 min,
+1 h, 1 day) for three series: the panel, its string and its CCA system. A
+bucket tracks min, max, mean and last for each telemetry field and is
+written to a HistoryStore for its resolution once a reading lands in a later
+bucket or the bucket's end time passes, so long-range charts read
+pre-aggregated points instead of rescanning raw history.
+
+Panel buckets fold each reading as it arrives. String and system buckets are
+fed by ``record_groups``, which samples the totals AggregateTracker keeps once
+per history flush interval, so ``watts_mean`` on a string is its average
+power over the bucket and ``watts_max`` its peak power. ``watts`` and
+``energy`` are summed over the members; the other fields are averaged over the
+members that reported them.
+
+Each resolution has its own retention: fine buckets are only kept for days,
+coarse ones for years.
+"""
+
+import logging
+import math
+import threading
+from array import array
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .aggregates import AggregateTracker, GroupAggregate
+from .config import get_settings
+from .history_store import HISTORY_FIELDS, HistoryStore
+from .panel_state import PanelRecord
+
+logger = logging.getLogger(__name__)
+
+# Resolution name -> bucket width in seconds, finest first
+RESOLUTIONS = {"1m": 60, "15m": 900, "1h": 3600, "1d": 86400}
+STATS = ("min", "max", "mean", "last")
+ROLLUP_FIELDS = tuple(f"{field}_{stat}" for field in HISTORY_FIELDS for stat in STATS)
+NAN = float("nan")
+# Default days of rollups kept per resolution
+DEFAULT_RETENTION_DAYS = {"1m": 7, "15m": 90, "1h": 730, "1d": 3650}
+# Fields that add up across a string or system; the rest are averaged
+SUMMED_FIELDS = frozenset({"watts", "energy"})
+
+
+def string_key(string: str) -> str:
+    """Series key for a string's aggregate rollups."""
+    return f"string:{string}"
+
+
+def system_key(system: str) -> str:
+    """Series key for a CCA system's aggregate rollups."""
+    return f"system:{system}"
+
+
+def pick_resolution(
+    start: datetime, end: datetime, max_points: int, raw_interval: float
+) -> str:
+    """Finest resolution whose bucket count over the window fits ``max_points``.
+
+    ``raw_interval`` is the nominal reporting interval used to estimate raw
+    point counts. Falls back to the coarsest rollup if nothing fits.
+    """
+    window = (end - start).total_seconds()
+    if window / raw_interval <= max_points:
+        return "raw"
+    for name, width in RESOLUTIONS.items():
+        if math.ceil(window / width) <= max_points:
+            return name
+    return next(reversed(RESOLUTIONS))
+
+
+def group_values(group: GroupAggregate) -> Optional[list]:
+    """One sample of a string or system's fields, or None if no member has reported."""
+    reporting = [record for record in group.members if record.last_update is not None]
+    if not reporting:
+        return None
+    values = []
+    for name in HISTORY_FIELDS:
+        if name == "watts":
+            values.append(group.watts if group.reporting else None)
+            continue
+        present = [value for value in (getattr(r, name) for r in reporting) if value is not None]
+        if not present:
+            values.append(None)
+        elif name in SUMMED_FIELDS:
+            values.append(sum(present))
+        else:
+            values.append(sum(present) / len(present))
+    return values
+
+
+def _merge_split_buckets(columns: dict[str, array]) -> dict[str, array]:
+    """Combine records written twice for one bucket (closed at shutdown, then reopened).
+
+    Means are averaged unweighted since per-bucket counts are not stored.
+    """
+    times = columns["t"]
+    if len(set(times)) == len(times):
+        return columns
+    merged = {name: array(column.typecode) for name, column in columns.items()}
+    for i, t in enumerate(times):
+        if merged["t"] and merged["t"][-1] == t:
+            for name, column in columns.items():
+                value = column[i]
+                current = merged[name][-1]
+                if name == "t" or value != value:
+                    continue
+                if current != current or name.endswith("_last"):
+                    merged[name][-1] = value
+                elif name.endswith("_min"):
+                    merged[name][-1] = min(current, value)
+                elif name.endswith("_max"):
+                    merged[name][-1] = max(current, value)
+                else:
+                    merged[name][-1] = (current + value) / 2
+            continue
+        for name, column in columns.items():
+            merged[name].append(column[i])
+    return merged
+
+
+class Bucket:
+    """Running min/max/sum/count/last per field for one series and time bucket."""
+
+    __slots__ = ("start", "mins", "maxs", "sums", "counts", "lasts")
+
+    def __init__(self, start: int):
+        size = len(HISTORY_FIELDS)
+        self.start = start
+        self.mins = [math.inf] * size
+        self.maxs = [-math.inf] * size
+        self.sums = [0.0] * size
+        self.counts = [0] * size
+        self.lasts = [NAN] * size
+
+    def add(self, values: list) -> None:
+        for i, value in enumerate(values):
+            if value is None:
+                continue
+            if value < self.mins[i]:
+                self.mins[i] = value
+            if value > self.maxs[i]:
+                self.maxs[i] = value
+            self.sums[i] += value
+            self.counts[i] += 1
+            self.lasts[i] = value
+
+    def values(self) -> list[float]:
+        """Flatten to ROLLUP_FIELDS order, NaN for fields with no readings."""
+        result = []
+        for i in range(len(HISTORY_FIELDS)):
+            count = self.counts[i]
+            if count:
+                result += (self.mins[i], self.maxs[i], self.sums[i] / count, self.lasts[i])
+            else:
+                result += (NAN, NAN, NAN, NAN)
+        return result
+
+
+class RollupEngine:
+    """Keep open buckets per series and resolution, persisting closed ones."""
+
+    def __init__(
+        self,
+        root: Path = Path("data/rollups"),
+        retention_days: Optional[dict[str, int]] = None,
+    ):
+        retention = {**DEFAULT_RETENTION_DAYS, **(retention_days or {})}
+        self.stores = {
+            name: HistoryStore(root=Path(root) / name, fields=ROLLUP_FIELDS, retention_days=retention[name])
+            for name in RESOLUTIONS
+        }
+        # (resolution, series key) -> open bucket
+        self._open: dict[tuple[str, str], Bucket] = {}
+        self._lock = threading.Lock()
+
+    def record_panel(self, record: PanelRecord) -> None:
+        """Reading listener for PanelService: fold the reading into the panel's series."""
+        if record.last_update is None:
+            return
+        values = [getattr(record, name) for name in HISTORY_FIELDS]
+        self.add((record.display_label,), record.last_update.timestamp(), values)
+
+    def record_groups(self, aggregates: AggregateTracker, timestamp: float) -> int:
+        """Fold one sample of every string and system total into its series.
+
+        Called once per interval rather than per reading, so every sample is
+        a whole-group total. Returns the number of series sampled.
+        """
+        sampled = 0
+        for kind, key_for in (("strings", string_key), ("systems", system_key)):
+            for name, group in list(aggregates.groups[kind].items()):
+                values = group_values(group)
+                if values is not None:
+                    self.add((key_for(name),), timestamp, values)
+                    sampled += 1
+        return sampled
+
+    def add(self, keys: Iterable[str], timestamp: float, values: list) -> None:
+        """Fold one reading into the open buckets of each key at every resolution."""
+        ts = int(timestamp)
+        with self._lock:
+            for name, width in RESOLUTIONS.items():
+                bucket_start = ts - ts % width
+                for key in keys:
+                    bucket = self._open.get((name, key))
+                    # Late readings for an already-closed bucket fold into the open one
+                    if bucket is None or bucket_start > bucket.start:
+                        if bucket is not None:
+                            self.stores[name].append(key, bucket.start, bucket.values())
+                        bucket = self._open[(name, key)] = Bucket(bucket_start)
+                    bucket.add(values)
+
+    def close_expired(self, now: float) -> int:
+        """Persist buckets whose end time has passed (e.g. panels idle overnight)."""
+        closed = 0
+        with self._lock:
+            for (name, key), bucket in list(self._open.items()):
+                if bucket.start + RESOLUTIONS[name] <= now:
+                    self.stores[name].append(key, bucket.start, bucket.values())
+                    del self._open[(name, key)]
+                    closed += 1
+        return closed
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Close finished buckets and write them to disk. Blocking; use a worker thread."""
+        if now is not None:
+            self.close_expired(now)
+        return sum(store.flush() for store in self.stores.values())
+
+    def close_all(self) -> int:
+        """Persist every open bucket, e.g. on shutdown."""
+        self.close_expired(math.inf)
+        return self.flush()
+
+    def prune(self, today: Optional[date] = None) -> int:
+        """Delete rollup days older than the retention window."""
+        return sum(store.prune(today) for store in self.stores.values())
+
+    def query(
+        self,
+        key: str,
+        resolution: str,
+        start: datetime,
+        end: datetime,
+        fields: Optional[Iterable[str]] = None,
+    ) -> dict[str, array]:
+        """Return rollup columns (``t`` plus ``<field>_<stat>``) for buckets overlapping the window.
+
+        ``t`` is each bucket's start. Includes the still-open bucket so the
+        latest interval is visible. Blocking; call from a worker thread.
+        """
+        width = RESOLUTIONS[resolution]
+        start_ts = int(start.timestamp())
+        start = datetime.fromtimestamp(start_ts - start_ts % width, tz=timezone.utc)
+        names = [
+            f"{field}_{stat}"
+            for field in (fields if fields is not None else HISTORY_FIELDS)
+            for stat in STATS
+        ]
+        columns = _merge_split_buckets(self.stores[resolution].query(key, start, end, names))
+        with self._lock:
+            bucket = self._open.get((resolution, key))
+            pending = bucket.values() if bucket is not None else None
+            bucket_start = bucket.start if bucket is not None else None
+        if pending is not None and start.timestamp() <= bucket_start < end.timestamp():
+            columns["t"].append(bucket_start)
+            for name in names:
+                columns[name].append(pending[ROLLUP_FIELDS.index(name)])
+        return columns
+
+    def query_many(
+        self,
+        keys: Iterable[str],
+        resolution: str,
+        start: datetime,
+        end: datetime,
+        fields: Optional[Iterable[str]] = None,
+    ) -> dict[str, dict[str, array]]:
+        """Run ``query`` for several series (e.g. every panel on a string)."""
+        names = list(fields) if fields is not None else None
+        return {key: self.query(key, resolution, start, end, names) for key in keys}
+
+
+# Singleton instance
+_rollup_engine: Optional[RollupEngine] = None
+
+
+def get_rollup_engine() -> RollupEngine:
+    """Get or create the singleton RollupEngine instance."""
+    global _rollup_engine
+    if _rollup_engine is None:
+        settings = get_settings()
+        _rollup_engine = RollupEngine(
+            root=Path(settings.history_dir) / "rollups",
+            retention_days={
+                "1m": settings.history_rollup_1m_retention_days,
+                "15m": settings.history_rollup_15m_retention_days,
+                "1h": settings.history_rollup_1h_retention_days,
+                "1d": settings.history_rollup_1d_retention_days,
+            },
+        )
+    return _rollup_engine
@@ -0,0 +1,548 @@
+"""Panel state shared between uvicorn workers through shared memory.
+
+Running ``uvicorn --workers N`` normally gives every worker its own broker
+connection and its own copy of panel state. With ``shared_state_enabled``
+the workers elect one ingest worker by taking an exclusive lock on a file;
+that worker runs everything as before and also writes each panel into a
+shared-memory region. The other workers never connect to the broker: they
+serve /api/panels and /ws/panels by reading the region in place.
+
+Region layout (little-endian, fixed size for ``capacity`` panels):
+
+    header      magic, layout seqlock, layout generation, version,
+                panel count, capacity, aggregates seqlock, length and
+                CRC-32, writer pid, writer token, layout table length
+                and CRC-32, writer heartbeat
+    aggregates  the JSON of PanelService.get_aggregates(), up to
+                AGGREGATES_CAPACITY bytes
+    records     ``capacity`` fixed-size records (RECORD_LOCK, then
+                PAYLOAD), one per panel in config order
+    layout      a JSON string table, one ``[display_label, tigo_label,
+                string, system, sn]`` entry per record slot, up to
+                LAYOUT_BYTES_PER_PANEL bytes per panel of capacity
+
+The identifying strings only change with the layout, so they live in the
+variable-length layout table and reach readers exactly as configured;
+records hold the fixed-width readings that change with every batch.
+
+Every record and the aggregates blob is guarded by a sequence lock: the
+writer makes its counter odd, writes, then makes it even again, and a
+reader retries until it sees the same even counter before and after its
+read. Each record also carries a CRC-32 of its payload, and the header one
+of the aggregates, which the reader checks on its private copy. The
+counter check alone relies on stores becoming visible in program order,
+which x86-64 guarantees but the ARM64 boards the dashboard usually runs
+on (Raspberry Pi 4) do not; there a reader can see an even counter around
+a half-written payload, and the checksum mismatch makes it retry.
+
+The writer stamps each record with the batch ``version`` it was written
+in and bumps the header version after the batch, so readers find changes
+by comparing record versions instead of diffing values. A config reload
+rewrites the whole layout, string table included, under the layout seqlock
+and bumps the layout generation, which readers turn into a snapshot.
+
+The ingest worker refreshes a heartbeat in the header every
+HEARTBEAT_INTERVAL seconds. A reader that sees it go stale checks whether
+the region was replaced - a new writer always creates a fresh region with
+a new random token - and if so reattaches to it. Otherwise the ingest
+worker is gone or hung, and the reader retries the election: the lock is
+released when the ingest process exits, so the first serving worker to
+get it takes over ingest in place (main.py).
+"""
+
+import fcntl
+import json
+import logging
+import math
+import os
+import struct
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+from multiprocessing import resource_tracker, shared_memory
+from typing import IO, Iterable, Optional
+
+from . import json_codec
+from .models import PanelData, Position
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TIGOSHM3"
+HEADER = struct.Struct("<8sIIQIIIIIIQIId")
+# The heartbeat is the header's last field, refreshed on its own
+HEARTBEAT = struct.Struct("<d")
+HEARTBEAT_OFFSET = HEADER.size - HEARTBEAT.size
+# Seconds between writer heartbeats
+HEARTBEAT_INTERVAL = 1.0
+AGGREGATES_CAPACITY = 64 * 1024
+# Layout table space per panel of capacity (five JSON-encoded strings)
+LAYOUT_BYTES_PER_PANEL = 512
+# Each record is a seqlock and the CRC-32 of its payload, then the payload
+RECORD_LOCK = struct.Struct("<II")
+PAYLOAD = struct.Struct(
+    "<Q"  # version written in
+    "ff"  # position x/y percent
+    "9d"  # watts .. energy (NaN: no reading)
+    "d"  # last_update, Unix seconds (NaN: never)
+    "B"  # flags: online, stale, is_temporary
+    "16s32s"  # node_id, actual_system
+)
+RECORD_SIZE = RECORD_LOCK.size + PAYLOAD.size
+READING_FLOATS = (
+    "watts", "voltage_in", "voltage_out", "current_in", "current_out",
+    "temperature", "duty_cycle", "rssi", "energy",
+)
+FLAG_ONLINE, FLAG_STALE, FLAG_TEMPORARY = 1, 2, 4
+# Reader attempts before giving up on a record the writer keeps rewriting
+MAX_READ_ATTEMPTS = 1000
+
+_AGGREGATES_OFFSET = HEADER.size
+_RECORDS_OFFSET = _AGGREGATES_OFFSET + AGGREGATES_CAPACITY
+_NAN = float("nan")
+
+
+def region_size(capacity: int) -> int:
+    return _RECORDS_OFFSET + capacity * (RECORD_SIZE + LAYOUT_BYTES_PER_PANEL)
+
+
+def _layout_offset(capacity: int) -> int:
+    return _RECORDS_OFFSET + capacity * RECORD_SIZE
+
+
+def _from_text(raw: bytes) -> Optional[str]:
+    return raw.rstrip(b"\0").decode("utf-8") or None
+
+
+def _float(value: Optional[float]) -> float:
+    return _NAN if value is None else value
+
+
+def _from_float(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def lock_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"{name}.lock")
+
+
+def elect_ingest_worker(name: str) -> Optional[IO]:
+    """Try to become the ingest worker for region ``name``.
+
+    Returns the open lock file if this worker won (keep it open for the
+    worker's lifetime; the OS releases the lock when the process exits),
+    or None if another worker holds it.
+    """
+    handle = open(lock_path(name), "a+")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+class SharedPanelWriter:
+    """The ingest worker's side: owns the region and writes panels into it."""
+
+    def __init__(self, name: str, capacity: int = 2048):
+        self.name = name
+        self.capacity = capacity
+        try:
+            # A region left behind by a previous run has a stale layout
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=region_size(capacity))
+        self.buf = self.shm.buf
+        self.index: dict[str, int] = {}
+        self.version = 0
+        self.layout_gen = 0
+        self.layout_seq = 0
+        self.aggregates_seq = 0
+        self.aggregates_len = 0
+        self.aggregates_crc = 0
+        self.layout_len = 0
+        self.layout_crc = 0
+        # Reported values too long for their record field, logged once each
+        self._overlong: set[str] = set()
+        self.pid = os.getpid()
+        # Tells readers this region apart from one an earlier writer created
+        self.token = int.from_bytes(os.urandom(8), "little")
+        # CLOCK_MONOTONIC, which every process on the host shares on Linux
+        self.heartbeat_at = time.monotonic()
+        self._write_header()
+        logger.info(f"Created shared panel state '{name}' for {capacity} panels ({region_size(capacity)} bytes)")
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(
+            self.buf, 0, MAGIC, self.layout_seq, self.layout_gen, self.version,
+            len(self.index), self.capacity, self.aggregates_seq, self.aggregates_len,
+            self.aggregates_crc, self.pid, self.token, self.layout_len, self.layout_crc,
+            self.heartbeat_at,
+        )
+
+    def beat(self) -> None:
+        """Tell readers the ingest worker is alive; call every HEARTBEAT_INTERVAL."""
+        self.heartbeat_at = time.monotonic()
+        HEARTBEAT.pack_into(self.buf, HEARTBEAT_OFFSET, self.heartbeat_at)
+
+    def _fixed(self, value: Optional[str], size: int) -> bytes:
+        """Encode a reported value for a fixed-width record field.
+
+        Values from MQTT (node ID, reporting system) that do not fit are cut
+        at a character boundary and logged once, never split mid-character.
+        """
+        if not value:
+            return b""
+        data = value.encode("utf-8")
+        if len(data) <= size:
+            return data
+        if value not in self._overlong:
+            self._overlong.add(value)
+            logger.warning(f"Shared panel state field holds {size} bytes, shortening {value!r}")
+        return data[:size].decode("utf-8", "ignore").encode("utf-8")
+
+    def _write_record(self, slot: int, panel, version: int) -> None:
+        offset = _RECORDS_OFFSET + slot * RECORD_SIZE
+        last_update = panel.last_update
+        flags = (
+            (FLAG_ONLINE if panel.online else 0)
+            | (FLAG_STALE if panel.stale else 0)
+            | (FLAG_TEMPORARY if panel.is_temporary else 0)
+        )
+        payload = PAYLOAD.pack(
+            version,
+            panel.position.x_percent, panel.position.y_percent,
+            *(_float(getattr(panel, name)) for name in READING_FLOATS),
+            last_update.timestamp() if last_update is not None else _NAN,
+            flags,
+            self._fixed(panel.node_id, 16), self._fixed(panel.actual_system, 32),
+        )
+        seq = RECORD_LOCK.unpack_from(self.buf, offset)[0]
+        RECORD_LOCK.pack_into(self.buf, offset, seq + 1, 0)
+        start = offset + RECORD_LOCK.size
+        self.buf[start:start + PAYLOAD.size] = payload
+        RECORD_LOCK.pack_into(self.buf, offset, seq + 2, zlib.crc32(payload))
+
+    def write_layout(self, panels: list) -> None:
+        """Replace the whole panel set, e.g. after a config reload."""
+        if len(panels) > self.capacity:
+            logger.error(
+                f"Shared panel state holds {self.capacity} panels, config has {len(panels)}; "
+                "raise SHARED_STATE_MAX_PANELS"
+            )
+            panels = panels[:self.capacity]
+        entries = [
+            json_codec.dumps([p.display_label, p.tigo_label, p.string, p.system, p.sn]).encode("utf-8")
+            for p in panels
+        ]
+        table_capacity = self.capacity * LAYOUT_BYTES_PER_PANEL
+        size = 2
+        for count, entry in enumerate(entries):
+            size += len(entry) + 1
+            if size > table_capacity:
+                logger.error(
+                    f"Shared panel state layout table holds {table_capacity} bytes; sharing the "
+                    f"first {count} of {len(panels)} panels, shorten labels or raise SHARED_STATE_MAX_PANELS"
+                )
+                panels, entries = panels[:count], entries[:count]
+                break
+        table = b"[" + b",".join(entries) + b"]"
+
+        self.layout_seq += 1
+        self._write_header()
+        self.version += 1
+        self.index = {}
+        for slot, panel in enumerate(panels):
+            self.index[panel.display_label] = slot
+            self._write_record(slot, panel, self.version)
+        offset = _layout_offset(self.capacity)
+        self.buf[offset:offset + len(table)] = table
+        self.layout_len = len(table)
+        self.layout_crc = zlib.crc32(table)
+        self.layout_gen += 1
+        self.layout_seq += 1
+        self._write_header()
+
+    def write_panels(self, panels: Iterable) -> None:
+        """Write changed panels as one batch; unknown labels are skipped."""
+        version = self.version + 1
+        for panel in panels:
+            slot = self.index.get(panel.display_label)
+            if slot is not None:
+                self._write_record(slot, panel, version)
+        self.version = version
+        self._write_header()
+
+    def write_aggregates(self, aggregates: dict) -> None:
+        data = json_codec.dumps(aggregates).encode("utf-8")
+        if len(data) > AGGREGATES_CAPACITY:
+            logger.warning(f"Aggregates ({len(data)} bytes) exceed the shared region, not shared")
+            return
+        self.aggregates_seq += 1
+        self._write_header()
+        self.buf[_AGGREGATES_OFFSET:_AGGREGATES_OFFSET + len(data)] = data
+        self.aggregates_len = len(data)
+        self.aggregates_crc = zlib.crc32(data)
+        self.aggregates_seq += 1
+        self._write_header()
+
+    def publish(self, changed: list, resync: bool, all_panels, aggregates: Optional[dict]) -> None:
+        """Mirror one broadcast batch: a layout on resync, else the changed panels."""
+        if resync:
+            self.write_layout(all_panels())
+        elif changed:
+            self.write_panels(changed)
+        if aggregates is not None:
+            self.write_aggregates(aggregates)
+
+    def get_stats(self) -> dict:
+        return {
+            "role": "writer",
+            "name": self.name,
+            "capacity": self.capacity,
+            "panels": len(self.index),
+            "version": self.version,
+            "layout_generation": self.layout_gen,
+            "aggregates_bytes": self.aggregates_len,
+            "layout_bytes": self.layout_len,
+            "token": f"{self.token:016x}",
+        }
+
+    def close(self) -> None:
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedPanelReader:
+    """A serving worker's side: reads panels from the region.
+
+    Each record is copied out of the region into a private buffer before its
+    checksum is verified and it is decoded into a new PanelData, so a record
+    the writer changes mid-read is never half-decoded.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        self.buf = None
+        self._seen_version = 0
+        self._seen_gen = 0
+        self._seen_aggregates = 0
+        self._aggregates: dict = {}
+        # Layout string table and the generation it was read for
+        self._layout: list[list] = []
+        self._layout_gen: Optional[int] = None
+        self.retries = 0
+        self.token: Optional[int] = None
+        self.writer_live = False
+        self.reattached = 0
+
+    def _open(self) -> Optional[shared_memory.SharedMemory]:
+        """The region currently published under ``name``, or None."""
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return None
+        # Attaching registers the region with this process's resource tracker,
+        # which would unlink it when the worker exits; only the writer owns it
+        resource_tracker.unregister(shm._name, "shared_memory")
+        if bytes(shm.buf[:len(MAGIC)]) != MAGIC:
+            shm.close()
+            return None
+        return shm
+
+    def _use(self, shm: shared_memory.SharedMemory) -> None:
+        self.shm, self.buf = shm, shm.buf
+        self.token = self._header()[10]
+        # Nothing read from the new region yet: the next poll is a resync
+        self._seen_version = self._seen_gen = self._seen_aggregates = 0
+        self._aggregates = {}
+        self._layout, self._layout_gen = [], None
+
+    def attach(self) -> bool:
+        """Open the region if the ingest worker has created it; True once attached."""
+        if self.buf is not None:
+            return True
+        shm = self._open()
+        if shm is None:
+            return False
+        self._use(shm)
+        logger.info(f"Attached to shared panel state '{self.name}'")
+        return True
+
+    def check_writer(self, stale_after: float) -> str:
+        """Whether the ingest worker is still behind this region.
+
+        Returns ``"live"`` while its heartbeat is recent, ``"replaced"``
+        after reattaching to a region a new writer created (the next poll
+        resyncs), or ``"stale"`` when there is no region or no heartbeat
+        for ``stale_after`` seconds.
+        """
+        if not self.attach():
+            self.writer_live = False
+            return "stale"
+        if time.monotonic() - self._header()[13] <= stale_after:
+            self.writer_live = True
+            return "live"
+        shm = self._open()
+        if shm is not None and HEADER.unpack_from(shm.buf, 0)[10] != self.token:
+            old = self.shm
+            self.buf = None
+            old.close()
+            self._use(shm)
+            self.reattached += 1
+            self.writer_live = True
+            logger.info(f"Reattached to shared panel state '{self.name}' from writer {self._header()[9]}")
+            return "replaced"
+        if shm is not None:
+            shm.close()
+        if self.writer_live:
+            logger.warning(f"Ingest worker {self._header()[9]} stopped updating shared state '{self.name}'")
+        self.writer_live = False
+        return "stale"
+
+    def _header(self) -> tuple:
+        return HEADER.unpack_from(self.buf, 0)
+
+    def _read_record(self, slot: int) -> Optional[tuple]:
+        """A record's payload fields, from a copy whose checksum matched."""
+        offset = _RECORDS_OFFSET + slot * RECORD_SIZE
+        for _ in range(MAX_READ_ATTEMPTS):
+            raw = bytes(self.buf[offset:offset + RECORD_SIZE])
+            seq, crc = RECORD_LOCK.unpack_from(raw)
+            payload = raw[RECORD_LOCK.size:]
+            if (
+                seq % 2 == 0
+                and zlib.crc32(payload) == crc
+                and RECORD_LOCK.unpack_from(self.buf, offset)[0] == seq
+            ):
+                return PAYLOAD.unpack(payload)
+            self.retries += 1
+        return None
+
+    def _read_layout(self, header: tuple) -> bool:
+        """Load the string table for the layout ``header`` describes; False if torn."""
+        gen, capacity, length, crc = header[2], header[5], header[11], header[12]
+        if gen == self._layout_gen:
+            return True
+        offset = _layout_offset(capacity)
+        data = bytes(self.buf[offset:offset + length])
+        if zlib.crc32(data) != crc:
+            return False
+        self._layout = json.loads(data) if data else []
+        self._layout_gen = gen
+        return True
+
+    @staticmethod
+    def _to_model(values: tuple, strings: list) -> PanelData:
+        (_, x, y, *rest) = values
+        floats, last_update, flags, node_id, actual_system = rest[:9], rest[9], rest[10], rest[11], rest[12]
+        label, tigo_label, string, system, sn = strings
+        return PanelData.model_construct(
+            display_label=label,
+            tigo_label=tigo_label,
+            string=string,
+            system=system,
+            sn=sn,
+            node_id=_from_text(node_id),
+            **{name: _from_float(value) for name, value in zip(READING_FLOATS, floats)},
+            online=bool(flags & FLAG_ONLINE),
+            stale=bool(flags & FLAG_STALE),
+            is_temporary=bool(flags & FLAG_TEMPORARY),
+            actual_system=_from_text(actual_system),
+            last_update=None if math.isnan(last_update) else datetime.fromtimestamp(last_update, timezone.utc),
+            position=Position.model_construct(x_percent=x, y_percent=y),
+        )
+
+    def _scan(self, since_version: int) -> Optional[tuple[list[PanelData], int, int]]:
+        """Records written after ``since_version``, with the version and generation read."""
+        for _ in range(MAX_READ_ATTEMPTS):
+            header = self._header()
+            _, layout_seq, gen, version, count, *_ = header
+            if layout_seq % 2 or not self._read_layout(header):
+                self.retries += 1
+                continue
+            panels = []
+            for slot in range(min(count, len(self._layout))):
+                values = self._read_record(slot)
+                if values is not None and values[0] > since_version:
+                    panels.append(self._to_model(values, self._layout[slot]))
+            if self._header()[1] == layout_seq:
+                return panels, version, gen
+            self.retries += 1
+        return None
+
+    def read_panels(self) -> list[PanelData]:
+        """Every panel, as of now."""
+        if not self.attach():
+            return []
+        scanned = self._scan(0)
+        return scanned[0] if scanned else []
+
+    def poll(self) -> tuple[list[PanelData], bool]:
+        """Panels changed since the last poll, and whether the layout changed (resync)."""
+        if not self.attach():
+            return [], False
+        header = self._header()
+        if header[3] == self._seen_version and header[2] == self._seen_gen:
+            return [], False
+        resync = header[2] != self._seen_gen
+        scanned = self._scan(0 if resync else self._seen_version)
+        if scanned is None:
+            return [], False
+        changed, self._seen_version, self._seen_gen = scanned
+        return ([] if resync else changed), resync
+
+    def read_aggregates(self) -> dict:
+        """The latest aggregates the ingest worker shared."""
+        if not self.attach():
+            return {}
+        for _ in range(MAX_READ_ATTEMPTS):
+            header = self._header()
+            seq, length, crc = header[6], header[7], header[8]
+            if seq == self._seen_aggregates:
+                return self._aggregates
+            if seq % 2:
+                self.retries += 1
+                continue
+            data = bytes(self.buf[_AGGREGATES_OFFSET:_AGGREGATES_OFFSET + length])
+            if zlib.crc32(data) == crc and self._header()[6] == seq:
+                self._aggregates = json.loads(data) if data else {}
+                self._seen_aggregates = seq
+                return self._aggregates
+            self.retries += 1
+        return self._aggregates
+
+    def poll_aggregates(self) -> Optional[dict]:
+        """Aggregates if they changed since the last call, else None."""
+        if not self.attach():
+            return None
+        if self._header()[6] == self._seen_aggregates:
+            return None
+        return self.read_aggregates()
+
+    def get_stats(self) -> dict:
+        stats = {
+            "role": "reader", "name": self.name, "attached": self.buf is not None,
+            "retries": self.retries, "writer_live": self.writer_live, "reattached": self.reattached,
+        }
+        if self.buf is not None:
+            _, _, gen, version, count, capacity, _, length, _, pid, token, _, _, heartbeat = self._header()
+            stats.update(panels=count, capacity=capacity, version=version,
+                         layout_generation=gen, aggregates_bytes=length, writer_pid=pid,
+                         token=f"{token:016x}", heartbeat_age_seconds=round(time.monotonic() - heartbeat, 3))
+        return stats
+
+    def close(self) -> None:
+        if self.shm is not None:
+            self.buf = None
+            self.shm.close()
+            self.shm = None
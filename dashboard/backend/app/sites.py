@@ -0,0 +1,310 @@
+"""Multi-site mode: several installations served by one backend process.
+
+The default installation keeps using the top-level ``config/`` directory,
+``mqtt_topic_prefix`` and ``/ws/panels``. Each additional site listed in the
+``sites`` setting (``name[:topic_prefix],...``) gets:
+
+- its own config directory, ``<sites_config_dir>/<name>`` (panels.yaml or
+  panel_mapping.json, hot-reloaded like the default one)
+- its own topic prefix, ``<mqtt_topic_prefix>/<name>`` unless given
+- its own PanelService, NodeChangeFilter and staleness schedule, so panel
+  state is partitioned per site
+- its own WebSocket channel, ``/ws/panels/{site}``
+
+while sharing the process, the event loop and the MQTTHub's single broker
+connection. ``Site.memory_usage`` reports how much memory a site's own state
+takes, so adding a site can be weighed against running another container
+(see benchmarks/bench_sites.py).
+"""
+
+import asyncio
+import logging
+import re
+import sys
+import types
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+from . import tracing
+from .change_filter import NodeChangeFilter
+from .config import Settings, get_settings
+from .config_watcher import ConfigWatcher
+from .mqtt_client import MQTTClient
+from .mqtt_hub import MQTTHub
+from .panel_service import PanelService
+from .websocket_manager import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+SITE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# Shared or behavioural objects deep_sizeof never descends into
+_OPAQUE_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.MethodType,
+    types.BuiltinFunctionType,
+    logging.Logger,
+    asyncio.Task,
+    asyncio.Event,
+)
+
+
+def deep_sizeof(obj, seen: Optional[set[int]] = None) -> int:
+    """Approximate bytes held by ``obj`` and everything it references.
+
+    Follows containers, instance ``__dict__`` and ``__slots__``; each object
+    is counted once, and functions, classes, modules, tasks and loggers are
+    not followed (they are shared, not per-site state).
+    """
+    if seen is None:
+        seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _OPAQUE_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        elif not isinstance(current, (str, bytes, int, float, bool)) and current is not None:
+            attrs = getattr(current, "__dict__", None)
+            if attrs is not None:
+                stack.append(attrs)
+            for cls in type(current).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if slot in ("__dict__", "__weakref__"):
+                        continue
+                    value = getattr(current, slot, None)
+                    if value is not None:
+                        stack.append(value)
+    return total
+
+
+def parse_sites(spec: str, default_prefix: str) -> list[tuple[str, str]]:
+    """Parse the ``sites`` setting into (name, topic_prefix) pairs.
+
+    Raises ValueError for invalid or duplicate site names.
+    """
+    sites: list[tuple[str, str]] = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, prefix = entry.partition(":")
+        name = name.strip()
+        if not SITE_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid site name '{name}': use letters, digits, '-' or '_'")
+        if any(name == existing for existing, _ in sites):
+            raise ValueError(f"Duplicate site name '{name}'")
+        prefix = prefix.strip().strip("/") or f"{default_prefix.rstrip('/')}/{name}"
+        sites.append((name, prefix))
+    return sites
+
+
+class Site:
+    """One installation's config, panel state, MQTT consumers and WebSocket channel."""
+
+    def __init__(
+        self,
+        name: str,
+        config_dir: Path,
+        topic_prefix: str,
+        hub: Optional[MQTTHub] = None,
+        settings: Optional[Settings] = None,
+    ):
+        settings = settings or get_settings()
+        self.name = name
+        self.config_dir = Path(config_dir)
+        self.topic_prefix = topic_prefix
+        self.mock_mode = settings.use_mock_data
+        self.panel_service = PanelService(
+            config_path=str(self.config_dir / "panel_mapping.json"),
+            yaml_path=str(self.config_dir / "panels.yaml"),
+        )
+        self.ws_manager = ConnectionManager(
+            batch_interval_ms=settings.ws_batch_interval_ms,
+            heartbeat_interval=settings.ws_heartbeat_interval,
+            snapshot_provider=self.panel_service.get_all_panels,
+            aggregates_provider=self.panel_service.get_aggregates,
+            send_timeout=settings.ws_send_timeout_seconds,
+            client_queue_size=settings.ws_client_queue_size,
+            slow_client_timeout=settings.ws_slow_client_timeout_seconds,
+        )
+        self.mqtt_client: Optional[MQTTClient] = None
+        if hub is not None:
+            self.mqtt_client = MQTTClient(
+                on_state=self.handle_mqtt_state,
+                on_temp_nodes=self.handle_temp_nodes,
+                on_node_mappings=self.handle_node_mappings,
+                hub=hub,
+                change_filter=(
+                    NodeChangeFilter(refresh_seconds=settings.staleness_threshold_seconds / 2)
+                    if settings.mqtt_change_filter_enabled else None
+                ),
+                topic_prefix=topic_prefix,
+            )
+        self.config_watcher = ConfigWatcher(
+            self.panel_service,
+            on_reload=self.handle_config_reload,
+            mode=settings.config_watch_mode,
+            poll_interval=settings.config_poll_interval_seconds,
+            debounce_ms=settings.config_reload_debounce_ms,
+        )
+        self._staleness_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Load the site's config and start its watcher, broadcasts and MQTT consumers."""
+        try:
+            self.panel_service.load_config()
+        except FileNotFoundError:
+            logger.warning(f"Site {self.name}: no panel configuration in {self.config_dir}")
+        except Exception as e:
+            logger.error(f"Site {self.name}: failed to load panel configuration: {e}")
+        if self.mock_mode:
+            self.panel_service.apply_mock_data()
+        self.ws_manager.start_background_tasks()
+        self.config_watcher.start()
+        self._staleness_task = asyncio.create_task(self._staleness_loop())
+        if self.mqtt_client is not None:
+            await self.mqtt_client.start()
+        logger.info(f"Site {self.name} started ({len(self.panel_service.panel_state)} panels, topics {self.topic_prefix}/#)")
+
+    async def stop(self) -> None:
+        if self.mqtt_client is not None:
+            await self.mqtt_client.stop()
+        if self._staleness_task:
+            self._staleness_task.cancel()
+            try:
+                await self._staleness_task
+            except asyncio.CancelledError:
+                pass
+            self._staleness_task = None
+        await self.config_watcher.stop()
+        await self.ws_manager.stop_background_tasks()
+
+    async def queue_panel_changes(self) -> None:
+        """Queue panels changed since the last batch for delta broadcast on this site's channel."""
+        changed, resync = self.panel_service.get_changed_panels()
+        aggregates = self.panel_service.get_changed_aggregates()
+        tracing.mark("collect")
+        await self.ws_manager.queue_update(changed, resync=resync, aggregates=aggregates)
+
+    async def handle_config_reload(self) -> None:
+        if self.mqtt_client and self.mqtt_client.change_filter:
+            self.mqtt_client.change_filter.reset()
+        if self.mock_mode:
+            self.panel_service.apply_mock_data()
+        await self.queue_panel_changes()
+
+    async def handle_mqtt_state(self, nodes: dict, source_system: Optional[str]) -> None:
+        updated = self.panel_service.apply_state(nodes, source_system)
+        tracing.mark("update_panel")
+        if updated:
+            await self.queue_panel_changes()
+
+    async def handle_temp_nodes(self, system: str, node_ids: list[int]) -> None:
+        self.panel_service.update_temp_nodes(system, node_ids)
+        await self.queue_panel_changes()
+
+    async def handle_node_mappings(self, system: str, mappings: dict) -> None:
+        self.panel_service.update_node_mappings(system, mappings)
+        await self.queue_panel_changes()
+
+    async def _staleness_loop(self) -> None:
+        """Flip this site's panels to stale as their deadlines pass (FR-2.6)."""
+        while True:
+            try:
+                await asyncio.sleep(self.panel_service.seconds_until_next_stale())
+                if self.panel_service.expire_stale():
+                    await self.queue_panel_changes()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in staleness loop for site {self.name}: {e}")
+
+    def memory_usage(self) -> dict:
+        """Approximate bytes held by this site's own state (a lower bound, see deep_sizeof)."""
+        seen: set[int] = set()
+        usage = {
+            "panels": deep_sizeof(self.panel_service, seen),
+            "change_filter": (
+                deep_sizeof(self.mqtt_client.change_filter, seen)
+                if self.mqtt_client and self.mqtt_client.change_filter else 0
+            ),
+            "websocket": sum(
+                sys.getsizeof(frame)
+                for client in self.ws_manager._clients.values()
+                for frame in client.queue
+            ),
+        }
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def get_stats(self) -> dict:
+        return {
+            "name": self.name,
+            "topic_prefix": self.topic_prefix,
+            "config_dir": str(self.config_dir),
+            "panels": len(self.panel_service.panel_state),
+            "clients": len(self.ws_manager.active_connections),
+            "change_filter": (
+                self.mqtt_client.change_filter.stats()
+                if self.mqtt_client and self.mqtt_client.change_filter else {}
+            ),
+            "memory_bytes": self.memory_usage(),
+        }
+
+
+class SiteRegistry:
+    """The additional sites configured for this process, by name."""
+
+    def __init__(self):
+        self.sites: dict[str, Site] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sites
+
+    def get(self, name: str) -> Optional[Site]:
+        return self.sites.get(name)
+
+    def load(self, settings: Settings, hub: Optional[MQTTHub] = None) -> None:
+        """Create a Site for each entry of the ``sites`` setting."""
+        root = Path(settings.sites_config_dir)
+        for name, prefix in parse_sites(settings.sites, settings.mqtt_topic_prefix):
+            self.sites[name] = Site(name, root / name, prefix, hub=hub, settings=settings)
+
+    async def start(self) -> None:
+        for site in self.sites.values():
+            await site.start()
+
+    async def stop(self) -> None:
+        for site in self.sites.values():
+            await site.stop()
+
+    def get_stats(self) -> dict:
+        sites = [site.get_stats() for site in self.sites.values()]
+        return {
+            "count": len(sites),
+            "memory_bytes_total": sum(s["memory_bytes"]["total"] for s in sites),
+            "sites": sites,
+        }
+
+
+# Singleton instance
+_site_registry: Optional[SiteRegistry] = None
+
+
+def get_site_registry() -> SiteRegistry:
+    """Get or create the singleton SiteRegistry (empty until the lifespan loads it)."""
+    global _site_registry
+    if _site_registry is None:
+        _site_registry = SiteRegistry()
+    return _site_registry
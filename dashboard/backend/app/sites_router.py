@@ -0,0 +1,91 @@
+"""Multi-site API endpoints.
+
+REST endpoints for the additional sites configured with ``sites``:
+- GET /api/sites - Every site with its panel count, clients and memory use
+- GET /api/sites/{site}/panels - Current state of one site's panels
+- GET /api/sites/{site}/aggregates - One site's string and system totals
+
+WebSocket endpoint:
+- WS /ws/panels/{site} - Real-time updates for one site, same protocol as /ws/panels
+"""
+
+import logging
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from .sites import Site, get_site_registry
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/sites", tags=["sites"])
+site_websocket_router = APIRouter(tags=["sites"])
+
+
+def error_response(
+    status_code: int,
+    error_code: str,
+    message: str,
+    details: list[str] | None = None
+) -> HTTPException:
+    """Create an HTTPException with standard error format."""
+    return HTTPException(
+        status_code=status_code,
+        detail={
+            "success": False,
+            "error": error_code,
+            "message": message,
+            "details": details or []
+        }
+    )
+
+
+def get_site_or_404(name: str) -> Site:
+    site = get_site_registry().get(name)
+    if site is None:
+        raise error_response(404, "site_not_found", f"No site named '{name}'")
+    return site
+
+
+@router.get("")
+async def list_sites():
+    """Every configured site with its panel count, clients and memory use."""
+    return get_site_registry().get_stats()
+
+
+@router.get("/{name}/panels")
+async def get_site_panels(name: str):
+    """Current state of one site's panels (REST fallback for /ws/panels/{site})."""
+    panels = get_site_or_404(name).panel_service.get_all_panels()
+    return {"panels": [p.model_dump(by_alias=True) for p in panels]}
+
+
+@router.get("/{name}/aggregates")
+async def get_site_aggregates(name: str):
+    """Per-string and per-system totals for one site."""
+    return get_site_or_404(name).panel_service.get_aggregates()
+
+
+@site_websocket_router.websocket("/ws/panels/{name}")
+async def site_websocket(websocket: WebSocket, name: str):
+    """Real-time panel updates for one site.
+
+    Unknown sites are rejected before the handshake completes.
+    """
+    site = get_site_registry().get(name)
+    if site is None:
+        await websocket.close(code=1008)
+        return
+
+    ws_manager = site.ws_manager
+    await ws_manager.connect(websocket)
+    await ws_manager.send_snapshot(websocket, site.panel_service.get_all_panels())
+
+    try:
+        while True:
+            data = await websocket.receive_text()
+            await ws_manager.handle_client_message(websocket, data)
+    except WebSocketDisconnect:
+        ws_manager.disconnect(websocket)
+    except Exception as e:
+        logger.error(f"WebSocket error on site {name}: {e}")
+        ws_manager.disconnect(websocket)
@@ -0,0 +1,156 @@
+"""Client-selected panel subsets for /ws/panels.
+
+A client narrows what it receives by sending
+
+    {"type": "subscribe",
+     "systems": ["primary"],             # CCAs
+     "strings": ["A"],                   # string names
+     "panels": ["B3", "B4"],             # display labels
+     "viewport": {"x_min": 10, "x_max": 40, "y_min": 0, "y_max": 25}}
+
+Every key is optional and a panel is included if it matches any of them;
+``viewport`` is a rectangle in the layout's ``position`` percentage space
+(edges inclusive). ``{"type": "subscribe"}`` with no criteria, or
+``{"type": "unsubscribe"}``, goes back to receiving every panel.
+
+Clients with the same subscription share a SubscriptionGroup: the set of
+labels it matches is resolved once against a PanelIndex of the current
+layout, and each batch's filtered frame is encoded once per group. Each
+group numbers its own frames, so a subscribed client sees a gap-free
+``seq`` even though batches that touch none of its panels are skipped.
+The frame sequence protocol is otherwise unchanged: a subscribed client
+gets a filtered snapshot (with a ``subscription`` key echoing what it
+matched) on subscribing, on resync and after a config reload.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Iterable, NamedTuple, Optional
+
+from .models import PanelData
+
+VIEWPORT_KEYS = ("x_min", "x_max", "y_min", "y_max")
+
+
+class Subscription(NamedTuple):
+    """What a client asked for; hashable, so equal subscriptions share a group."""
+
+    systems: frozenset[str] = frozenset()
+    strings: frozenset[str] = frozenset()
+    panels: frozenset[str] = frozenset()
+    viewport: Optional[tuple[float, float, float, float]] = None  # x_min, x_max, y_min, y_max
+
+    def to_dict(self) -> dict:
+        result = {
+            "systems": sorted(self.systems),
+            "strings": sorted(self.strings),
+            "panels": sorted(self.panels),
+        }
+        if self.viewport is not None:
+            result["viewport"] = dict(zip(VIEWPORT_KEYS, self.viewport))
+        return result
+
+
+def _names(message: dict, key: str) -> frozenset[str]:
+    value = message.get(key) or []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"'{key}' must be a list of strings")
+    return frozenset(value)
+
+
+def parse_subscription(message: dict) -> Optional[Subscription]:
+    """Subscription from a client's subscribe message; None means every panel.
+
+    Raises ValueError for malformed criteria.
+    """
+    viewport = message.get("viewport")
+    bounds = None
+    if viewport is not None:
+        if not isinstance(viewport, dict):
+            raise ValueError("'viewport' must be an object with x_min, x_max, y_min and y_max")
+        try:
+            bounds = tuple(float(viewport[key]) for key in VIEWPORT_KEYS)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("'viewport' needs numeric x_min, x_max, y_min and y_max")
+        if bounds[0] > bounds[1] or bounds[2] > bounds[3]:
+            raise ValueError("'viewport' minimums must not exceed its maximums")
+
+    subscription = Subscription(
+        systems=_names(message, "systems"),
+        strings=_names(message, "strings"),
+        panels=_names(message, "panels"),
+        viewport=bounds,
+    )
+    if subscription == Subscription():
+        return None
+    return subscription
+
+
+class PanelIndex:
+    """Lookups from subscription criteria to display labels for one panel layout."""
+
+    def __init__(self, panels: Iterable[PanelData]):
+        self.labels: set[str] = set()
+        self.by_system: dict[str, set[str]] = {}
+        self.by_string: dict[str, set[str]] = {}
+        # Labels with their string and system, for the groups a match covers
+        self.groups_of: dict[str, tuple[str, str]] = {}
+        by_x: list[tuple[float, float, str]] = []
+        for panel in panels:
+            label = panel.display_label
+            self.labels.add(label)
+            self.by_system.setdefault(panel.system, set()).add(label)
+            self.by_string.setdefault(panel.string, set()).add(label)
+            self.groups_of[label] = (panel.string, panel.system)
+            by_x.append((panel.position.x_percent, panel.position.y_percent, label))
+        by_x.sort()
+        self._xs = [x for x, _, _ in by_x]
+        self._by_x = by_x
+
+    def in_viewport(self, x_min: float, x_max: float, y_min: float, y_max: float) -> set[str]:
+        """Labels whose position lies in the rectangle (edges inclusive)."""
+        start = bisect_left(self._xs, x_min)
+        end = bisect_right(self._xs, x_max)
+        return {label for _, y, label in self._by_x[start:end] if y_min <= y <= y_max}
+
+    def resolve(self, subscription: Subscription) -> frozenset[str]:
+        """Every label the subscription matches in this layout."""
+        matched: set[str] = set()
+        for system in subscription.systems:
+            matched |= self.by_system.get(system, set())
+        for string in subscription.strings:
+            matched |= self.by_string.get(string, set())
+        matched |= subscription.panels & self.labels
+        if subscription.viewport is not None:
+            matched |= self.in_viewport(*subscription.viewport)
+        return frozenset(matched)
+
+
+class SubscriptionGroup:
+    """Clients sharing one subscription, its matched labels and its frame sequence."""
+
+    def __init__(self, subscription: Subscription):
+        self.subscription = subscription
+        self.labels: frozenset[str] = frozenset()
+        self.strings: frozenset[str] = frozenset()
+        self.systems: frozenset[str] = frozenset()
+        self.clients: set = set()  # ClientConnection
+        self.seq = 0
+        self.snapshot_cache: Optional[tuple[int, str]] = None
+
+    def resolve(self, index: PanelIndex) -> None:
+        self.labels = index.resolve(self.subscription)
+        groups = [index.groups_of[label] for label in self.labels]
+        self.strings = frozenset(string for string, _ in groups)
+        self.systems = frozenset(system for _, system in groups)
+        self.snapshot_cache = None
+
+    def filter_aggregates(self, aggregates: Optional[dict]) -> Optional[dict]:
+        """The strings and systems this group's panels belong to."""
+        if not aggregates:
+            return None
+        filtered = {}
+        for kind, names in (("strings", self.strings), ("systems", self.systems)):
+            groups = {name: value for name, value in aggregates.get(kind, {}).items() if name in names}
+            if groups:
+                filtered[kind] = groups
+        return filtered or None
@@ -0,0 +1,192 @@
+"""Opt-in per-stage tracing of MQTT state messages for hot-path debugging.
+
+With tracing enabled (``trace_enabled``, or POST /api/debug/tracing), every
+message the MQTTHub receives gets a Trace with its own id. Each stage it
+passes through appends a monotonic timestamp, and the finished trace goes
+into a fixed-size ring buffer that keeps the most recent ``capacity``
+traces. /api/debug/traces returns the slowest ones and a per-stage
+breakdown.
+
+Stages, in order (each is the time since the previous mark):
+
+    receive        topic matched and payload queued on its CCA lane
+    queue_wait     waiting on the lane for its worker
+    decode         JSON decode
+    filter         NodeChangeFilter dropped repeated readings
+    update_panel   PanelService.apply_state, i.e. update_panel per node
+    collect        changed panels and aggregates gathered for broadcast
+    handoff        queued on ConnectionManager for the next batch
+    batch_wait     waiting for the batch loop
+    get_all_panels full panel list built (resync snapshots only)
+    encode         frame built: model_dump and JSON encoding
+    fanout         frame queued for every client and frame listener
+    send           the first client's writer sent the frame
+
+A message whose stages stop early (no configured panel changed, or no
+client is connected) is recorded with the stages it reached. A message
+replaced by a newer one for the same topic before processing is dropped.
+
+The trace for the message being processed travels in a context variable,
+so stages record with a module-level ``mark(stage)`` call. When tracing is
+disabled no Trace is created and ``mark`` is a context-variable lookup
+that finds None.
+"""
+
+import contextvars
+import itertools
+import time
+from typing import Optional
+
+from .config import get_settings
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar(
+    "tigo_trace", default=None
+)
+
+
+class Trace:
+    """One message's stage timestamps."""
+
+    __slots__ = ("id", "topic", "system", "started", "marks", "held", "finished")
+
+    def __init__(self, trace_id: int, topic: str, system: str, started: float):
+        self.id = trace_id
+        self.topic = topic
+        self.system = system
+        self.started = started
+        self.marks: list[tuple[str, float]] = []
+        self.held = False  # A later stage (the broadcast batch) will finish it
+        self.finished = False
+
+    def mark(self, stage: str) -> None:
+        self.marks.append((stage, time.monotonic()))
+
+    @property
+    def duration(self) -> float:
+        return self.marks[-1][1] - self.started if self.marks else 0.0
+
+    def stages(self) -> list[tuple[str, float]]:
+        """Seconds spent in each stage, in order."""
+        result = []
+        previous = self.started
+        for stage, at in self.marks:
+            result.append((stage, at - previous))
+            previous = at
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "topic": self.topic,
+            "system": self.system,
+            "total_ms": round(self.duration * 1000, 3),
+            "stages": [
+                {"stage": stage, "ms": round(seconds * 1000, 3)} for stage, seconds in self.stages()
+            ],
+        }
+
+
+class Tracer:
+    """Creates traces while enabled and keeps the last ``capacity`` finished ones."""
+
+    def __init__(self, capacity: int = 1024, enabled: bool = False):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.enabled = enabled
+        self.capacity = capacity
+        self._ring: list[Optional[Trace]] = [None] * capacity
+        self._next = 0
+        self._ids = itertools.count(1)
+        self.finished_count = 0
+
+    def start(self, topic: str, system: str, started: Optional[float] = None) -> Trace:
+        return Trace(next(self._ids), topic, system, time.monotonic() if started is None else started)
+
+    def finish(self, trace: Trace) -> None:
+        """Store a trace in the ring buffer, overwriting the oldest; repeat calls are ignored."""
+        if trace.finished:
+            return
+        trace.finished = True
+        self._ring[self._next] = trace
+        self._next = (self._next + 1) % self.capacity
+        self.finished_count += 1
+
+    def clear(self) -> None:
+        self._ring = [None] * self.capacity
+        self._next = 0
+
+    def traces(self) -> list[Trace]:
+        """Buffered traces, oldest first."""
+        ordered = self._ring[self._next:] + self._ring[:self._next]
+        return [trace for trace in ordered if trace is not None]
+
+    def slowest(self, limit: int = 20) -> list[Trace]:
+        return sorted(self.traces(), key=lambda trace: trace.duration, reverse=True)[:limit]
+
+    def breakdown(self) -> dict[str, dict]:
+        """Per stage across buffered traces: count, mean, max and share of total time."""
+        durations: dict[str, list[float]] = {}
+        for trace in self.traces():
+            for stage, seconds in trace.stages():
+                durations.setdefault(stage, []).append(seconds)
+        total = sum(sum(values) for values in durations.values())
+        result = {}
+        for stage, values in durations.items():
+            values.sort()
+            result[stage] = {
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(values[len(values) // 2] * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+                "share": round(sum(values) / total, 4) if total else 0.0,
+            }
+        return result
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "capacity": self.capacity,
+            "buffered": sum(1 for trace in self._ring if trace is not None),
+            "finished": self.finished_count,
+        }
+
+
+def current() -> Optional[Trace]:
+    """The trace of the message being processed in this context, if any."""
+    return _current.get()
+
+
+def activate(trace: Trace) -> contextvars.Token:
+    """Make ``trace`` current until ``deactivate`` is called with the returned token."""
+    return _current.set(trace)
+
+
+def deactivate(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def mark(stage: str) -> None:
+    """Record that the current message finished ``stage``; a no-op when it is not traced."""
+    trace = _current.get()
+    if trace is not None:
+        trace.mark(stage)
+
+
+def mark_all(traces: list[Trace], stage: str) -> None:
+    """Record one timestamp for every trace sharing a stage (e.g. one broadcast batch)."""
+    now = time.monotonic()
+    for trace in traces:
+        trace.marks.append((stage, now))
+
+
+# Singleton instance
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Get or create the singleton Tracer, enabled by the ``trace_enabled`` setting."""
+    global _tracer
+    if _tracer is None:
+        settings = get_settings()
+        _tracer = Tracer(capacity=settings.trace_buffer_size, enabled=settings.trace_enabled)
+    return _tracer
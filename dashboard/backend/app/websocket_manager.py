@@ -1,104 +1,668 @@
 import asyncio
+import json
 import logging
-from typing import Optional
+import time
+from collections import deque
+from typing import Callable, Iterable, Optional
 from datetime import datetime, timezone
 
 from fastapi import WebSocket
 
-from .models import WebSocketMessage, PanelData
+from . import json_codec, tracing
+from .metrics import get_metrics
+from .models import WebSocketMessage, WebSocketDelta, PanelData
+from .subscriptions import PanelIndex, Subscription, SubscriptionGroup, parse_subscription
 
 logger = logging.getLogger(__name__)
 
+PING_FRAME = json_codec.dumps({"type": "ping"})
+
+# Application close code sent to clients evicted for falling too far behind
+SLOW_CONSUMER_CLOSE_CODE = 4008
+SLOW_CONSUMER_CLOSE_REASON = "slow consumer"
+
+
+def _client_info(websocket: WebSocket) -> str:
+    return f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "unknown"
+
+
+def _dump_frame(message: WebSocketMessage | WebSocketDelta) -> dict:
+    """Serialize a frame, leaving out the aggregates and subscription sections when there are none.
+
+    Uses by_alias=True for backward compatibility during migration (FR-M.5).
+    """
+    exclude = {name for name in ("aggregates", "subscription") if getattr(message, name, None) is None}
+    return message.model_dump(mode='json', by_alias=True, exclude=exclude or None)
+
+
+class ClientConnection:
+    """Outbound state for one WebSocket: a bounded frame queue drained by a writer task.
+
+    When the queue overflows, the queued deltas are discarded and the client
+    is marked as needing a snapshot, which the writer builds from current
+    state when it next gets to send. Any number of missed frames therefore
+    collapse into a single snapshot.
+    """
+
+    __slots__ = (
+        "websocket", "info", "queue", "max_queue", "wakeup", "idle", "writer_task",
+        "needs_snapshot", "behind_since", "frames_sent", "frames_dropped", "coalesced", "group",
+        "evicting",
+    )
+
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.info = _client_info(websocket)
+        self.queue: deque[str] = deque()
+        self.max_queue = max_queue
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.needs_snapshot = False
+        self.behind_since: Optional[float] = None
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.coalesced = 0
+        # Subscription group, or None to receive every panel
+        self.group: Optional[SubscriptionGroup] = None
+        # Set once an eviction task has been started for this client
+        self.evicting = False
+
+    def enqueue(self, frame: str) -> None:
+        """Queue a delta or control frame, coalescing into a snapshot on overflow."""
+        if self.needs_snapshot:
+            # The pending snapshot will already include this change
+            self.frames_dropped += 1
+            return
+        if len(self.queue) >= self.max_queue:
+            self.frames_dropped += len(self.queue) + 1
+            self.coalesced += 1
+            self.queue.clear()
+            self.needs_snapshot = True
+            if self.behind_since is None:
+                self.behind_since = time.monotonic()
+        else:
+            self.queue.append(frame)
+        self.idle.clear()
+        self.wakeup.set()
+
+    def enqueue_snapshot(self, frame: str) -> None:
+        """Queue a full snapshot, superseding everything still queued."""
+        if self.queue or self.needs_snapshot:
+            self.frames_dropped += len(self.queue)
+            self.coalesced += 1
+            self.queue.clear()
+            self.needs_snapshot = False
+        self.queue.append(frame)
+        self.idle.clear()
+        self.wakeup.set()
+
+    def lag_seconds(self, now: float) -> float:
+        """How long this client has been unable to keep up, or 0 if it is current."""
+        return now - self.behind_since if self.behind_since is not None else 0.0
+
+    def stats(self, now: float) -> dict:
+        return {
+            "client": self.info,
+            "queue_depth": len(self.queue),
+            "needs_snapshot": self.needs_snapshot,
+            "lag_seconds": round(self.lag_seconds(now), 3),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "coalesced": self.coalesced,
+            "subscription": self.group.subscription.to_dict() if self.group else None,
+        }
+
 
 class ConnectionManager:
-    """Manages WebSocket connections with batching and heartbeat (FR-3.2, FR-3.4)."""
+    """Manages WebSocket connections with batching and heartbeat (FR-3.2, FR-3.4).
+
+    Clients receive a full ``snapshot`` frame on connect, then ``delta``
+    frames containing only the panels that changed during each batch
+    interval. Every broadcast frame carries a sequence number so a client
+    that sees a gap can send ``{"type": "resync"}`` to get a fresh snapshot.
+
+    Each frame is JSON-encoded once and handed to every client's bounded
+    outbound queue; a per-client writer task does the actual send. Broadcasts
+    never wait on the network, and a client that stays behind for longer
+    than ``slow_client_timeout`` is closed with SLOW_CONSUMER_CLOSE_CODE.
+
+    ``frame_listeners`` are called with every broadcast frame and whether it
+    is a snapshot (fanout.py republishes them for edge instances), and
+    ``relay_frame`` broadcasts an already-encoded frame under its own
+    sequence number (how an edge instance serves its clients).
+    ``snapshot_frame_provider`` supplies encoded snapshots when there are no
+    PanelData to build them from.
+
+    Clients may narrow their stream to some CCAs, strings, panels or a
+    layout rectangle by sending a ``subscribe`` message (see
+    subscriptions.py). Clients with equal subscriptions share a
+    SubscriptionGroup with its own frames and sequence numbers; everyone
+    else, and the frame listeners, get the unfiltered frames.
+    """
 
-    def __init__(self, batch_interval_ms: int = 500, heartbeat_interval: int = 30):
-        self.active_connections: list[WebSocket] = []
+    def __init__(
+        self,
+        batch_interval_ms: int = 500,
+        heartbeat_interval: int = 30,
+        snapshot_provider: Optional[Callable[[], list[PanelData]]] = None,
+        aggregates_provider: Optional[Callable[[], dict]] = None,
+        send_timeout: float = 5.0,
+        client_queue_size: int = 32,
+        slow_client_timeout: float = 30.0,
+        snapshot_frame_provider: Optional[Callable[[], Optional[str]]] = None,
+    ):
         self.batch_interval_ms = batch_interval_ms
         self.heartbeat_interval = heartbeat_interval
-        self._pending_update: bool = False
+        self.snapshot_provider = snapshot_provider
+        self.snapshot_frame_provider = snapshot_frame_provider
+        # Called with (frame, is_snapshot) for every broadcast frame
+        self.frame_listeners: list[Callable[[str, bool], None]] = []
+        self.aggregates_provider = aggregates_provider
+        self.send_timeout = send_timeout
+        self.client_queue_size = client_queue_size
+        self.slow_client_timeout = slow_client_timeout
+        self._clients: dict[WebSocket, ClientConnection] = {}
         self._batch_task: Optional[asyncio.Task] = None
         self._heartbeat_task: Optional[asyncio.Task] = None
-        self._panel_data: list[PanelData] = []
+        self._pending_panels: dict[str, PanelData] = {}
+        self._pending_resync: bool = False
+        self._pending_aggregates: dict[str, dict] = {}
+        self._seq: int = 0
+        self._snapshot_cache: Optional[tuple[int, str]] = None
+        self._evicted_count: int = 0
+        self._writer_tasks: set[asyncio.Task] = set()
         self._lock = asyncio.Lock()
+        # Traces of messages waiting for the next batch, those in the batch
+        # being broadcast, and the traced frame whose first send finishes them
+        self._tracer = tracing.get_tracer()
+        self._pending_traces: list[tracing.Trace] = []
+        self._batch_traces: Optional[list[tracing.Trace]] = None
+        self._traced_frame: Optional[tuple[str, list[tracing.Trace]]] = None
+        metrics = get_metrics()
+        self._batch_panels = metrics.ws_batch_panels
+        self._broadcast_seconds = metrics.ws_broadcast_seconds
+        # Subscription groups by subscription, the layout index they are
+        # resolved against, and display label -> groups that include it
+        self._groups: dict[Subscription, SubscriptionGroup] = {}
+        self._index: Optional[PanelIndex] = None
+        self._label_groups: dict[str, list[SubscriptionGroup]] = {}
+
+    @property
+    def seq(self) -> int:
+        """Sequence number of the most recent broadcast frame."""
+        return self._seq
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        """Currently connected WebSockets."""
+        return list(self._clients)
 
     async def connect(self, websocket: WebSocket) -> None:
         """Accept and track a new WebSocket connection."""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        client_info = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "unknown"
-        logger.info(f"WebSocket client connected: {client_info}")
+        client = ClientConnection(websocket, self.client_queue_size)
+        client.writer_task = asyncio.create_task(self._writer_loop(client))
+        self._writer_tasks.add(client.writer_task)
+        client.writer_task.add_done_callback(self._writer_tasks.discard)
+        self._clients[websocket] = client
+        logger.info(f"WebSocket client connected: {client.info}")
 
     def disconnect(self, websocket: WebSocket) -> None:
-        """Remove a WebSocket connection."""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            client_info = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else "unknown"
-            logger.info(f"WebSocket client disconnected: {client_info}")
+        """Remove a WebSocket connection and stop its writer."""
+        client = self._clients.pop(websocket, None)
+        if client is None:
+            return
+        if client.writer_task is not None and client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+        client.idle.set()
+        self._leave_group(client)
+        logger.info(f"WebSocket client disconnected: {client.info}")
 
-    async def broadcast(self, panels: list[PanelData]) -> None:
-        """Broadcast panel data to all connected clients (FR-3.4).
+    def _snapshot_frame(self, panels: list[PanelData]) -> str:
+        """Build and encode a snapshot frame at the current sequence number.
 
-        Uses by_alias=True for backward compatibility during migration (FR-M.5).
-        This outputs 'voltage' instead of 'voltage_in'.
+        Panels serialize by alias, so 'voltage' is sent instead of 'voltage_in'.
         """
-        if not self.active_connections:
-            return
-
         message = WebSocketMessage(
+            seq=self._seq,
             timestamp=datetime.now(timezone.utc).isoformat(),
             panels=panels,
+            aggregates=self.aggregates_provider() if self.aggregates_provider else None,
         )
-        message_dict = message.model_dump(mode='json', by_alias=True)
+        frame = json_codec.dumps(_dump_frame(message))
+        self._snapshot_cache = (self._seq, frame)
+        return frame
+
+    def _current_snapshot_frame(self) -> Optional[str]:
+        """Encoded snapshot of current state, shared by all clients at the same seq."""
+        if self._snapshot_cache is not None and self._snapshot_cache[0] == self._seq:
+            return self._snapshot_cache[1]
+        if self.snapshot_provider is None:
+            if self.snapshot_frame_provider is None:
+                return None
+            frame = self.snapshot_frame_provider()
+            if frame is not None:
+                self._snapshot_cache = (self._seq, frame)
+            return frame
+        return self._snapshot_frame(self.snapshot_provider())
+
+    def current_snapshot_frame(self) -> Optional[str]:
+        """Encoded snapshot at the current sequence number, or None without a provider."""
+        return self._current_snapshot_frame()
+
+    def _group_snapshot_frame(
+        self, group: SubscriptionGroup, panels: Optional[list[PanelData]] = None
+    ) -> Optional[str]:
+        """Encoded snapshot of a group's panels at its sequence number, shared by its clients."""
+        cache = group.snapshot_cache
+        if panels is None and cache is not None and cache[0] == group.seq:
+            return cache[1]
+        if panels is None:
+            if self.snapshot_provider is None:
+                return None
+            panels = self.snapshot_provider()
+        aggregates = self.aggregates_provider() if self.aggregates_provider else None
+        message = WebSocketMessage(
+            seq=group.seq,
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            panels=[panel for panel in panels if panel.display_label in group.labels],
+            aggregates=group.filter_aggregates(aggregates),
+            subscription=group.subscription.to_dict(),
+        )
+        frame = json_codec.dumps(_dump_frame(message))
+        group.snapshot_cache = (group.seq, frame)
+        return frame
+
+    def _snapshot_frame_for(self, client: ClientConnection) -> Optional[str]:
+        """Current snapshot as this client should see it."""
+        if client.group is not None:
+            return self._group_snapshot_frame(client.group)
+        return self._current_snapshot_frame()
+
+    async def _writer_loop(self, client: ClientConnection) -> None:
+        """Drain one client's queue, evicting it if a send stalls."""
+        websocket = client.websocket
+        try:
+            while True:
+                if client.needs_snapshot:
+                    client.needs_snapshot = False
+                    frame = self._snapshot_frame_for(client)
+                    if frame is None:
+                        continue
+                elif client.queue:
+                    frame = client.queue.popleft()
+                else:
+                    client.behind_since = None
+                    client.idle.set()
+                    client.wakeup.clear()
+                    await client.wakeup.wait()
+                    continue
+
+                try:
+                    await asyncio.wait_for(websocket.send_text(frame), timeout=self.send_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Send to {client.info} timed out after {self.send_timeout}s")
+                    await self._evict(client, SLOW_CONSUMER_CLOSE_CODE, SLOW_CONSUMER_CLOSE_REASON)
+                    return
+                except Exception as e:
+                    logger.warning(f"Failed to send to {client.info}: {e}")
+                    self.disconnect(websocket)
+                    return
+                client.frames_sent += 1
+                traced = self._traced_frame
+                if traced is not None and frame is traced[0]:
+                    self._traced_frame = None
+                    self._finish_traces(traced[1], "send")
+        except asyncio.CancelledError:
+            pass
+
+    async def _evict(self, client: ClientConnection, code: int, reason: str) -> None:
+        """Close a client that cannot keep up and stop tracking it."""
+        if self._clients.get(client.websocket) is not client:
+            return
+        self._evicted_count += 1
+        logger.warning(
+            f"Evicting slow WebSocket client {client.info} "
+            f"(dropped {client.frames_dropped} frames, coalesced {client.coalesced} times)"
+        )
+        self.disconnect(client.websocket)
+        try:
+            await asyncio.wait_for(
+                client.websocket.close(code=code, reason=reason), timeout=self.send_timeout
+            )
+        except Exception:
+            pass
+
+    def _enqueue_all(
+        self, frame: str, snapshot: bool = False, clients: Optional[Iterable[ClientConnection]] = None
+    ) -> None:
+        """Hand an encoded frame to every client's queue (or the given clients').
 
-        # Collect failed connections to avoid modifying list while iterating
-        failed_connections: list[WebSocket] = []
+        Clients that have lagged for longer than ``slow_client_timeout`` get
+        one eviction task, tracked with the writer tasks so it is neither
+        garbage-collected mid-close nor left running at shutdown.
+        """
+        now = time.monotonic()
+        for client in list(self._clients.values() if clients is None else clients):
+            if snapshot:
+                client.enqueue_snapshot(frame)
+            else:
+                client.enqueue(frame)
+            if not client.evicting and client.lag_seconds(now) > self.slow_client_timeout:
+                client.evicting = True
+                task = asyncio.create_task(
+                    self._evict(client, SLOW_CONSUMER_CLOSE_CODE, SLOW_CONSUMER_CLOSE_REASON)
+                )
+                self._writer_tasks.add(task)
+                task.add_done_callback(self._writer_tasks.discard)
 
-        for connection in self.active_connections:
+    def _emit(self, frame: str, snapshot: bool = False) -> None:
+        """Queue a broadcast frame for every client and hand it to the frame listeners."""
+        traces = self._batch_traces
+        if traces:
+            tracing.mark_all(traces, "encode")
+        recipients = [client for client in self._clients.values() if client.group is None]
+        self._enqueue_all(frame, snapshot=snapshot, clients=recipients)
+        for listener in self.frame_listeners:
             try:
-                await connection.send_json(message_dict)
+                listener(frame, snapshot)
             except Exception as e:
-                client_info = f"{connection.client.host}:{connection.client.port}" if connection.client else "unknown"
-                logger.warning(f"Failed to send to {client_info}: {e}")
-                failed_connections.append(connection)
+                logger.error(f"Frame listener failed: {e}")
+        if traces:
+            tracing.mark_all(traces, "fanout")
+            self._batch_traces = None
+            if recipients:
+                # Only the latest traced frame is watched; an unsent older one finishes here
+                if self._traced_frame is not None:
+                    self._finish_traces(self._traced_frame[1])
+                self._traced_frame = (frame, traces)
+            else:
+                self._finish_traces(traces)
+
+    def _finish_traces(self, traces: list[tracing.Trace], stage: Optional[str] = None) -> None:
+        if stage is not None:
+            tracing.mark_all(traces, stage)
+        for trace in traces:
+            self._tracer.finish(trace)
+
+    async def broadcast(self, panels: list[PanelData]) -> None:
+        """Broadcast a full panel snapshot to all connected clients (FR-3.4).
+
+        The layout may have changed, so subscription groups are resolved
+        again and each gets a snapshot of its panels.
+        """
+        self._seq += 1
+        self._index = None
+        if self._groups:
+            self._index = PanelIndex(panels)
+            self._resolve_groups()
+            for group in self._groups.values():
+                group.seq += 1
+                frame = self._group_snapshot_frame(group, panels)
+                self._enqueue_all(frame, snapshot=True, clients=group.clients)
+        if not self._clients and not self.frame_listeners:
+            return
+        self._emit(self._snapshot_frame(panels), snapshot=True)
+
+    async def broadcast_delta(
+        self, panels: list[PanelData], aggregates: Optional[dict] = None
+    ) -> None:
+        """Broadcast only the given changed panels (and changed aggregates) to all clients."""
+        self._seq += 1
+        if not self._clients and not self.frame_listeners:
+            return
+
+        if self._groups:
+            self._broadcast_group_deltas(panels, aggregates)
+
+        message = WebSocketDelta(
+            seq=self._seq,
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            changed=panels,
+            aggregates=aggregates,
+        )
+        self._emit(json_codec.dumps(_dump_frame(message)))
+
+    def _broadcast_group_deltas(self, panels: list[PanelData], aggregates: Optional[dict]) -> None:
+        """Send each subscription group the changed panels (and totals) it covers.
+
+        Groups the batch does not touch get no frame and keep their sequence
+        number, so their clients see no gap.
+        """
+        changed: dict[SubscriptionGroup, list[PanelData]] = {}
+        for panel in panels:
+            for group in self._label_groups.get(panel.display_label, ()):
+                changed.setdefault(group, []).append(panel)
+        timestamp = datetime.now(timezone.utc).isoformat()
+        for group in self._groups.values():
+            group_panels = changed.get(group, [])
+            group_aggregates = group.filter_aggregates(aggregates)
+            if not group_panels and not group_aggregates:
+                continue
+            group.seq += 1
+            message = WebSocketDelta(
+                seq=group.seq,
+                timestamp=timestamp,
+                changed=group_panels,
+                aggregates=group_aggregates,
+            )
+            self._enqueue_all(json_codec.dumps(_dump_frame(message)), clients=group.clients)
+
+    def _resolve_groups(self) -> None:
+        """Match every group against the current index and rebuild the label lookup."""
+        label_groups: dict[str, list[SubscriptionGroup]] = {}
+        for group in self._groups.values():
+            group.resolve(self._index)
+            for label in group.labels:
+                label_groups.setdefault(label, []).append(group)
+        self._label_groups = label_groups
+
+    def _join_group(self, client: ClientConnection, subscription: Subscription) -> SubscriptionGroup:
+        """Move a client into the group for this subscription, creating it if needed."""
+        self._leave_group(client)
+        group = self._groups.get(subscription)
+        if group is None:
+            if self._index is None:
+                self._index = PanelIndex(self.snapshot_provider())
+            group = SubscriptionGroup(subscription)
+            group.resolve(self._index)
+            self._groups[subscription] = group
+            for label in group.labels:
+                self._label_groups.setdefault(label, []).append(group)
+        group.clients.add(client)
+        client.group = group
+        return group
+
+    def _leave_group(self, client: ClientConnection) -> None:
+        """Take a client out of its group, dropping the group once it is empty."""
+        group = client.group
+        if group is None:
+            return
+        client.group = None
+        group.clients.discard(client)
+        if group.clients:
+            return
+        del self._groups[group.subscription]
+        for label in group.labels:
+            groups = self._label_groups[label]
+            groups.remove(group)
+            if not groups:
+                del self._label_groups[label]
 
-        # Remove failed connections after iteration
-        for connection in failed_connections:
-            self.disconnect(connection)
+    def relay_frame(self, frame: str, seq: int, snapshot: bool = False) -> None:
+        """Broadcast a frame encoded elsewhere, adopting its sequence number."""
+        self._seq = seq
+        if snapshot:
+            self._snapshot_cache = (seq, frame)
+        self._emit(frame, snapshot=snapshot)
 
-    async def queue_update(self, panels: list[PanelData]) -> None:
-        """Queue panel update for batched broadcast (FR-3.2)."""
+    async def send_current_snapshot(self, websocket: WebSocket) -> None:
+        """Queue the current snapshot frame for a single client, if one is available."""
+        client = self._clients.get(websocket)
+        frame = self._current_snapshot_frame()
+        if client is not None and frame is not None:
+            client.enqueue_snapshot(frame)
+
+    async def send_snapshot(self, websocket: WebSocket, panels: list[PanelData]) -> None:
+        """Queue a full snapshot for a single client (initial state or resync)."""
+        client = self._clients.get(websocket)
+        if client is not None:
+            client.enqueue_snapshot(self._snapshot_frame(panels))
+
+    async def handle_client_message(self, websocket: WebSocket, data: str) -> None:
+        """Handle a text frame from a client (pong, resync, subscribe or unsubscribe)."""
+        try:
+            message = json.loads(data)
+        except json.JSONDecodeError:
+            logger.debug(f"Ignoring non-JSON client message: {data}")
+            return
+
+        if not isinstance(message, dict):
+            return
+
+        message_type = message.get("type")
+        if message_type == "resync":
+            client = self._clients.get(websocket)
+            frame = self._snapshot_frame_for(client) if client is not None else None
+            if frame is None:
+                return
+            logger.debug(f"Client requested resync (last seq {message.get('seq')})")
+            client.enqueue_snapshot(frame)
+        elif message_type in ("subscribe", "unsubscribe"):
+            client = self._clients.get(websocket)
+            if client is not None:
+                self._subscribe(client, message)
+
+    def _subscribe(self, client: ClientConnection, message: dict) -> None:
+        """Apply a subscribe/unsubscribe message and send the client its new snapshot."""
+        try:
+            if self.snapshot_provider is None:
+                raise ValueError("subscriptions are not available on this instance")
+            subscription = parse_subscription(message) if message["type"] == "subscribe" else None
+        except ValueError as e:
+            logger.debug(f"Rejected subscription from {client.info}: {e}")
+            error = {"type": "error", "error": "invalid_subscription", "detail": str(e)}
+            client.enqueue(json_codec.dumps(error))
+            return
+
+        if subscription is None:
+            self._leave_group(client)
+            frame = self._current_snapshot_frame()
+        else:
+            group = self._join_group(client, subscription)
+            logger.debug(f"Client {client.info} subscribed to {len(group.labels)} panels")
+            frame = self._group_snapshot_frame(group)
+        if frame is not None:
+            client.enqueue_snapshot(frame)
+
+    async def wait_until_drained(self) -> None:
+        """Wait until every client's queue has been written out."""
+        await asyncio.gather(*(client.idle.wait() for client in list(self._clients.values())))
+
+    def get_stats(self) -> dict:
+        """Queue depths and drop counters for every connected client."""
+        now = time.monotonic()
+        clients = [client.stats(now) for client in self._clients.values()]
+        return {
+            "seq": self._seq,
+            "connected_clients": len(clients),
+            "evicted_clients": self._evicted_count,
+            "max_queue_depth": max((c["queue_depth"] for c in clients), default=0),
+            "total_frames_dropped": sum(c["frames_dropped"] for c in clients),
+            "subscription_groups": [
+                {
+                    "subscription": group.subscription.to_dict(),
+                    "clients": len(group.clients),
+                    "panels": len(group.labels),
+                    "seq": group.seq,
+                }
+                for group in self._groups.values()
+            ],
+            "clients": clients,
+        }
+
+    async def queue_update(
+        self,
+        panels: list[PanelData],
+        resync: bool = False,
+        aggregates: Optional[dict] = None,
+    ) -> None:
+        """Queue changed panels for the next batched broadcast (FR-3.2).
+
+        Panels are keyed by display_label so repeated updates to the same
+        panel within one batch interval collapse into a single entry, and
+        changed aggregates are merged per string/system the same way.
+        ``resync`` requests a full snapshot instead of a delta, e.g. after
+        the panel configuration was reloaded.
+        """
+        trace = tracing.current()
+        if trace is not None:
+            trace.mark("handoff")
+            trace.held = True
         async with self._lock:
-            self._panel_data = panels
-            self._pending_update = True
+            if trace is not None:
+                self._pending_traces.append(trace)
+            for panel in panels:
+                self._pending_panels[panel.display_label] = panel
+            if aggregates:
+                for kind, groups in aggregates.items():
+                    self._pending_aggregates.setdefault(kind, {}).update(groups)
+            if resync:
+                self._pending_resync = True
 
     async def _batch_loop(self) -> None:
-        """Background task to batch and broadcast updates (FR-3.2)."""
+        """Background task to batch and broadcast updates (FR-3.2).
+
+        Pending changes are swapped out under the lock; broadcasting only
+        enqueues frames, so neither step waits on client sends.
+        """
         while True:
             await asyncio.sleep(self.batch_interval_ms / 1000.0)
             async with self._lock:
-                if self._pending_update and self._panel_data:
-                    logger.info(f"Batch loop: broadcasting to {len(self.active_connections)} clients")
-                    await self.broadcast(self._panel_data)
-                    self._pending_update = False
+                pending_panels = self._pending_panels
+                pending_resync = self._pending_resync
+                pending_aggregates = self._pending_aggregates
+                pending_traces = self._pending_traces
+                self._pending_panels = {}
+                self._pending_resync = False
+                self._pending_aggregates = {}
+                self._pending_traces = []
+
+            if pending_traces:
+                tracing.mark_all(pending_traces, "batch_wait")
+                self._batch_traces = pending_traces
+            started = time.perf_counter()
+            if pending_resync and self.snapshot_provider is not None:
+                logger.info(f"Batch loop: broadcasting snapshot to {len(self._clients)} clients")
+                panels = self.snapshot_provider()
+                if pending_traces:
+                    tracing.mark_all(pending_traces, "get_all_panels")
+                await self.broadcast(panels)
+            elif pending_panels or pending_aggregates:
+                logger.debug(
+                    f"Batch loop: broadcasting {len(pending_panels)} changed panels "
+                    f"to {len(self._clients)} clients"
+                )
+                panels = list(pending_panels.values())
+                await self.broadcast_delta(panels, pending_aggregates or None)
+            else:
+                panels = None
+            if self._batch_traces:
+                # Nothing was emitted for these messages (no listeners, or nothing changed)
+                self._finish_traces(self._batch_traces)
+                self._batch_traces = None
+            if panels is None:
+                continue
+            self._broadcast_seconds.observe(time.perf_counter() - started)
+            self._batch_panels.observe(len(panels))
 
     async def _heartbeat_loop(self) -> None:
         """Background task for WebSocket heartbeat (FR-3.4)."""
         while True:
             await asyncio.sleep(self.heartbeat_interval)
-            failed_connections: list[WebSocket] = []
-
-            for connection in self.active_connections:
-                try:
-                    await connection.send_json({"type": "ping"})
-                except Exception as e:
-                    client_info = f"{connection.client.host}:{connection.client.port}" if connection.client else "unknown"
-                    logger.warning(f"Heartbeat failed for {client_info}: {e}")
-                    failed_connections.append(connection)
-
-            for connection in failed_connections:
-                self.disconnect(connection)
+            self._enqueue_all(PING_FRAME)
 
     def start_background_tasks(self) -> None:
         """Start batch and heartbeat background tasks."""
@@ -108,7 +672,7 @@ class ConnectionManager:
             self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
 
     async def stop_background_tasks(self) -> None:
-        """Stop background tasks."""
+        """Stop background tasks and client writers."""
         if self._batch_task:
             self._batch_task.cancel()
             try:
@@ -123,3 +687,9 @@ class ConnectionManager:
             except asyncio.CancelledError:
                 pass
             self._heartbeat_task = None
+        for websocket in list(self._clients):
+            self.disconnect(websocket)
+        writer_tasks = list(self._writer_tasks)
+        for task in writer_tasks:
+            task.cancel()
+        await asyncio.gather(*writer_tasks, return_exceptions=True)
@@ -0,0 +1,126 @@
+"""Benchmark WebSocket broadcast latency against simulated clients.
+
+Compares the legacy broadcast (JSON-encode the frame once per client and
+await each send in turn) with ConnectionManager, which encodes once and
+hands the frame to per-client writer tasks. Latency is measured until the
+last client has received the frame.
+
+Usage (from dashboard/backend):
+    python -m benchmarks.bench_broadcast
+    python -m benchmarks.bench_broadcast --panels 120 --latency-ms 2 --rounds 50
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from app import json_codec
+from app.models import PanelData, Position, WebSocketMessage
+from app.websocket_manager import ConnectionManager
+
+
+class SimulatedClient:
+    """WebSocket stand-in whose sends take a fixed amount of network time."""
+
+    def __init__(self, latency: float):
+        self.client = None
+        self.latency = latency
+        self.bytes_sent = 0
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, data: str) -> None:
+        await asyncio.sleep(self.latency)
+        self.bytes_sent += len(data)
+
+    async def send_json(self, data: dict) -> None:
+        # Mirrors Starlette's WebSocket.send_json encoding
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def make_panels(count: int) -> list[PanelData]:
+    now = datetime.now(timezone.utc)
+    return [
+        PanelData(
+            display_label=f"{chr(65 + i // 20)}{i % 20 + 1}",
+            tigo_label=f"{chr(65 + i // 20)}{i % 20 + 1}",
+            string=chr(65 + i // 20),
+            system="primary" if i % 2 == 0 else "secondary",
+            sn=f"4-{i:07d}",
+            node_id=str(i + 10),
+            watts=312.5, voltage_in=41.2, voltage_out=38.9,
+            current_in=7.58, current_out=8.03, temperature=42.0,
+            duty_cycle=96.0, rssi=180.0, energy=12.345,
+            last_update=now,
+            position=Position(x_percent=(i * 7) % 100, y_percent=(i * 13) % 100),
+        )
+        for i in range(count)
+    ]
+
+
+async def legacy_broadcast(clients: list[SimulatedClient], panels: list[PanelData]) -> None:
+    """The pre-optimisation broadcast: one dict, encoded and awaited per client."""
+    message = WebSocketMessage(timestamp=datetime.now(timezone.utc).isoformat(), panels=panels)
+    message_dict = message.model_dump(mode="json", by_alias=True)
+    for client in clients:
+        await client.send_json(message_dict)
+
+
+async def measure(fn, rounds: int) -> tuple[float, float]:
+    """Return (mean, p95) latency in milliseconds for an async callable."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+async def run(panel_count: int, latency_ms: float, rounds: int) -> None:
+    panels = make_panels(panel_count)
+    latency = latency_ms / 1000.0
+
+    print(f"JSON encoder: {json_codec.backend_name()}")
+    print(f"{panel_count} panels per frame, {latency_ms} ms simulated send time, {rounds} rounds")
+    print()
+    print(f"{'clients':>8} {'legacy mean':>12} {'legacy p95':>11} {'new mean':>10} {'new p95':>9} {'speedup':>8}")
+
+    for client_count in (1, 10, 100):
+        clients = [SimulatedClient(latency) for _ in range(client_count)]
+        manager = ConnectionManager(send_timeout=10.0)
+        for client in clients:
+            await manager.connect(client)
+
+        async def managed_broadcast() -> None:
+            await manager.broadcast(panels)
+            await manager.wait_until_drained()
+
+        legacy_mean, legacy_p95 = await measure(lambda: legacy_broadcast(clients, panels), rounds)
+        new_mean, new_p95 = await measure(managed_broadcast, rounds)
+        await manager.stop_background_tasks()
+
+        print(
+            f"{client_count:>8} {legacy_mean:>10.2f}ms {legacy_p95:>9.2f}ms "
+            f"{new_mean:>8.2f}ms {new_p95:>7.2f}ms {legacy_mean / new_mean:>7.1f}x"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=120, help="Panels per frame (default: 120)")
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="Simulated per-send time (default: 1.0)")
+    parser.add_argument("--rounds", type=int, default=20, help="Broadcasts per measurement (default: 20)")
+    args = parser.parse_args()
+    asyncio.run(run(args.panels, args.latency_ms, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
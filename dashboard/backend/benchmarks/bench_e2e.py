@@ -0,0 +1,384 @@
+"""End-to-end benchmark: taptap state messages in, WebSocket frames out.
+
+Runs the FastAPI app under uvicorn in this process, wires the live-panel
+MQTTClient to an MQTTHub whose broker is an in-process stand-in (messages
+enter through MQTTHub.enqueue, where aiomqtt hands them over), and connects
+N WebSocket clients to /ws/panels from a separate process. For each
+scenario of CCAs x panels it publishes taptap-shaped state messages and
+reports:
+
+- publish-to-client latency p50/p95/p99 for every panel reading delivered
+  to every client (includes the WebSocket batch interval)
+- the messages/sec ceiling with the publisher running flat-out
+- server CPU per message (payload generation excluded)
+- RSS growth over the scenario
+
+Results are written as JSON so runs can be diffed for regressions in
+mqtt_client, panel_service or websocket_manager. The broker network hop is
+not included; use tigo-mqtt/mqtt-replay against a real broker for that.
+
+Usage (from dashboard/backend):
+    python -m benchmarks.bench_e2e
+    python -m benchmarks.bench_e2e --scenario 1:10 --scenario 20:10000 --clients 10 \\
+        --seconds 20 --rate 1 --output bench_e2e.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import platform
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app import json_codec
+from benchmarks.bench_panel_state import rss_bytes
+
+PREFIX = "taptap"
+STRING_SIZE = 20
+
+
+def make_mapping(ccas: int, panels: int) -> dict:
+    """Panel config with panels spread evenly over ``ccas`` systems in strings of 20."""
+    return {
+        "panels": [
+            {
+                "sn": f"4-{i:07X}B",
+                "tigo_label": f"S{i // STRING_SIZE}-{i % STRING_SIZE + 1}",
+                "display_label": f"S{i // STRING_SIZE}-{i % STRING_SIZE + 1}",
+                "string": f"S{i // STRING_SIZE}",
+                "system": f"cca{(i // STRING_SIZE) % ccas + 1}",
+                "position": {"x_percent": (i * 7) % 100, "y_percent": (i * 13) % 100},
+            }
+            for i in range(panels)
+        ],
+        "translations": {},
+    }
+
+
+def make_state_payload(panels: list[dict], seq: int, now: str) -> bytes:
+    """One taptap state message; ``energy`` carries ``seq`` so clients can match readings."""
+    return json_codec.dumps({
+        "time": now,
+        "state": "online",
+        "nodes": {
+            panel["tigo_label"]: {
+                "node_id": str(100 + i),
+                "node_serial": panel["sn"],
+                "node_name": panel["tigo_label"],
+                "state_online": "online",
+                "voltage_in": 41.2 + i % 7 / 10,
+                "voltage_out": 38.9,
+                "current_in": 7.58,
+                "current_out": 8.03,
+                "power": 300.0 + (seq + i) % 50,
+                "temperature": 42.3,
+                "duty_cycle": 96.1,
+                "rssi": 176.5,
+                "energy": float(seq),
+                "timestamp": now,
+            }
+            for i, panel in enumerate(panels)
+        },
+    }).encode()
+
+
+def weighted_percentiles(samples: list[tuple[float, int]], points=(50, 95, 99)) -> dict:
+    """Percentiles of (value, weight) samples, in the same unit as the values."""
+    samples = sorted(samples)
+    total = sum(weight for _, weight in samples)
+    result = {}
+    for p in points:
+        target = total * p / 100
+        seen = 0
+        for value, weight in samples:
+            seen += weight
+            if seen >= target:
+                result[f"p{p}"] = round(value, 2)
+                break
+    result["max"] = round(samples[-1][0], 2) if samples else None
+    result["samples"] = total
+    return result
+
+
+def run_clients(url: str, count: int, ready, stop, conn) -> None:
+    """WebSocket client process: report (energy seq, receive time, panel count) per delta frame."""
+    asyncio.run(_clients(url, count, ready, stop, conn))
+
+
+async def _clients(url: str, count: int, ready, stop, conn) -> None:
+    import websockets
+
+    decode = json_codec.get_decoder()
+    arrivals: list[tuple[float, float, int]] = []
+    totals = {"deltas": 0, "snapshots": 0}
+
+    async def client() -> None:
+        async with websockets.connect(url, max_size=None) as ws:
+            async for raw in ws:
+                received = time.monotonic()
+                frame = decode(raw)
+                kind = frame.get("type")
+                if kind == "ping":
+                    await ws.send('{"type":"pong"}')
+                    continue
+                if kind == "snapshot":
+                    totals["snapshots"] += 1
+                    continue
+                if kind != "delta":
+                    continue
+                totals["deltas"] += 1
+                counts: dict[float, int] = {}
+                for panel in frame.get("changed", ()):
+                    seq = panel.get("energy")
+                    if seq is not None:
+                        counts[seq] = counts.get(seq, 0) + 1
+                arrivals.extend((seq, received, n) for seq, n in counts.items())
+
+    tasks = [asyncio.create_task(client()) for _ in range(count)]
+    ready.set()
+    while not stop.is_set():
+        await asyncio.sleep(0.05)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    conn.send({"arrivals": arrivals, **totals})
+    conn.close()
+
+
+async def wait_for(predicate, timeout: float, interval: float = 0.01) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+async def run_scenario(main, hub, port: int, workdir: Path, ccas: int, panels: int, args) -> dict:
+    mapping = make_mapping(ccas, panels)
+    config_path = workdir / "panel_mapping.json"
+    config_path.write_text(json.dumps(mapping))
+    main.panel_service.config_path = config_path
+    main.panel_service.yaml_path = workdir / "panels.yaml"
+    main.panel_service.load_config()
+    by_system: dict[str, list[dict]] = {}
+    for panel in mapping["panels"]:
+        by_system.setdefault(panel["system"], []).append(panel)
+    systems = sorted(by_system)
+
+    ctx = multiprocessing.get_context("spawn")
+    ready, stop = ctx.Event(), ctx.Event()
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    clients = ctx.Process(
+        target=run_clients,
+        args=(f"ws://127.0.0.1:{port}/ws/panels", args.clients, ready, stop, child_conn),
+    )
+    clients.start()
+    await asyncio.to_thread(ready.wait, 30)
+    if not await wait_for(lambda: main.ws_manager.get_stats()["connected_clients"] >= args.clients, 30):
+        raise RuntimeError("WebSocket clients did not connect")
+    # Let the join snapshots go out before measuring
+    await asyncio.sleep(main.ws_manager.batch_interval_ms / 1000 + 0.2)
+
+    rss_start = rss_bytes()
+    queue_before = hub.get_stats()
+    processed_before = hub.process_latency.count
+
+    # Latency phase: each CCA publishes ``rate`` messages per second, staggered
+    publish_times: dict[float, float] = {}
+    total = int(args.seconds * args.rate * len(systems))
+    generate_cpu = 0.0
+    cpu_start = time.process_time()
+    start = time.monotonic()
+    for k in range(total):
+        due = start + k / (args.rate * len(systems))
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        system = systems[k % len(systems)]
+        seq = float(k + 1)
+        gen_start = time.process_time()
+        payload = make_state_payload(by_system[system], k + 1, datetime.now(timezone.utc).isoformat())
+        generate_cpu += time.process_time() - gen_start
+        publish_times[seq] = time.monotonic()
+        hub.enqueue(f"{PREFIX}/{system}/state", payload)
+    await wait_for(lambda: hub.pending() == 0, 60)
+    # Let the last message and batch reach the clients
+    await asyncio.sleep(main.ws_manager.batch_interval_ms / 1000 + 0.5)
+    cpu = time.process_time() - cpu_start - generate_cpu
+    processed = hub.process_latency.count - processed_before
+
+    stop.set()
+    result = await asyncio.to_thread(parent_conn.recv)
+    await asyncio.to_thread(clients.join, 30)
+
+    samples = [
+        ((received - publish_times[seq]) * 1000, count)
+        for seq, received, count in result["arrivals"]
+        if seq in publish_times
+    ]
+
+    # Ceiling phase: flat-out, one message per CCA in flight so nothing coalesces
+    variants = {
+        system: [make_state_payload(by_system[system], total + v + 1, datetime.now(timezone.utc).isoformat())
+                 for v in range(4)]
+        for system in systems
+    }
+    rounds = max(1, args.ceiling_messages // len(systems))
+    processed_before = hub.process_latency.count
+    start = time.monotonic()
+    for r in range(rounds):
+        for system in systems:
+            hub.enqueue(f"{PREFIX}/{system}/state", variants[system][r % 4])
+        target = processed_before + (r + 1) * len(systems)
+        await wait_for(lambda: hub.process_latency.count >= target, 60, interval=0)
+    ceiling_elapsed = time.monotonic() - start
+    ceiling_messages = rounds * len(systems)
+    rss_end = rss_bytes()
+    queue_after = hub.get_stats()
+
+    return {
+        "ccas": ccas,
+        "panels": panels,
+        "clients": args.clients,
+        "rate_per_cca": args.rate,
+        "messages_published": total,
+        "messages_processed": processed,
+        "coalesced": queue_after["coalesced"] - queue_before["coalesced"],
+        "dropped": queue_after["dropped"] - queue_before["dropped"],
+        "latency_ms": weighted_percentiles(samples),
+        "frames": {"deltas": result["deltas"], "snapshots": result["snapshots"]},
+        "cpu_ms_per_message": round(cpu / max(processed, 1) * 1000, 3),
+        "ceiling_msgs_per_sec": round(ceiling_messages / ceiling_elapsed, 1),
+        "ceiling_panel_updates_per_sec": round(ceiling_messages * panels / len(systems) / ceiling_elapsed),
+        "rss_start_mb": round(rss_start / 1e6, 1) if rss_start else None,
+        "rss_growth_mb": round((rss_end - rss_start) / 1e6, 1) if rss_start and rss_end else None,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    import uvicorn
+
+    from app import main
+    logging.getLogger().setLevel(logging.WARNING)
+    from app.change_filter import NodeChangeFilter
+    from app.history_store import HistoryStore
+    from app.mqtt_client import MQTTClient
+    from app.mqtt_hub import MQTTHub
+    from app.rollups import RollupEngine
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = Path(tmpdir)
+        server = uvicorn.Server(uvicorn.Config(
+            main.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning", ws="websockets",
+        ))
+        server_task = asyncio.create_task(server.serve())
+        await wait_for(lambda: server.started, 10)
+
+        main.ws_manager.start_background_tasks()
+        hub = MQTTHub("in-process", topic_prefix=PREFIX, queue_size=main.settings.mqtt_ingest_queue_size)
+        await MQTTClient(
+            on_state=main.handle_mqtt_state,
+            on_temp_nodes=main.handle_temp_nodes,
+            on_node_mappings=main.handle_node_mappings,
+            hub=hub,
+            change_filter=NodeChangeFilter() if main.settings.mqtt_change_filter_enabled else None,
+        ).start()
+        await hub.start(connect=False)
+
+        flush_task = None
+        if args.history:
+            store = HistoryStore(root=workdir / "history")
+            rollups = RollupEngine(root=workdir / "rollups")
+            main.panel_service.reading_listeners += [store.record_panel, rollups.record_panel]
+
+            async def flush_loop():
+                while True:
+                    await asyncio.sleep(1)
+                    await asyncio.to_thread(store.flush)
+                    await asyncio.to_thread(rollups.flush, time.time())
+
+            flush_task = asyncio.create_task(flush_loop())
+
+        results = []
+        try:
+            for ccas, panels in args.scenario:
+                print(f"Scenario {ccas} CCA(s) x {panels} panels, {args.clients} clients ...", flush=True)
+                result = await run_scenario(main, hub, port, workdir, ccas, panels, args)
+                latency = result["latency_ms"]
+                print(f"  latency p50/p95/p99 {latency.get('p50')}/{latency.get('p95')}/{latency.get('p99')} ms, "
+                      f"ceiling {result['ceiling_msgs_per_sec']:,} msg/s "
+                      f"({result['ceiling_panel_updates_per_sec']:,} panel updates/s), "
+                      f"{result['cpu_ms_per_message']} ms CPU/msg, RSS +{result['rss_growth_mb']} MB", flush=True)
+                results.append(result)
+        finally:
+            if flush_task:
+                flush_task.cancel()
+            await hub.stop()
+            await main.ws_manager.stop_background_tasks()
+            server.should_exit = True
+            await server_task
+
+    return {
+        "benchmark": "bench_e2e",
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "json_backend": json_codec.backend_name(),
+        "ws_batch_interval_ms": main.ws_manager.batch_interval_ms,
+        "history": args.history,
+        "scenarios": results,
+    }
+
+
+def parse_scenario(value: str) -> tuple[int, int]:
+    try:
+        ccas, panels = (int(part) for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("scenario must be CCAS:PANELS, e.g. 20:10000")
+    if not 1 <= ccas <= panels:
+        raise argparse.ArgumentTypeError("need at least one CCA and one panel per CCA")
+    return ccas, panels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", type=parse_scenario, action="append",
+                        help="CCAS:PANELS, repeatable (default: 1:10 2:120 5:1000 20:10000)")
+    parser.add_argument("--clients", type=int, default=5, help="WebSocket clients (default: 5)")
+    parser.add_argument("--seconds", type=float, default=10, help="Latency phase length (default: 10)")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="State messages per second per CCA in the latency phase (default: 1)")
+    parser.add_argument("--ceiling-messages", type=int, default=200,
+                        help="Messages in the flat-out ceiling phase (default: 200)")
+    parser.add_argument("--history", action="store_true", help="Also record history and rollups")
+    parser.add_argument("--output", default="bench_e2e.json", help="Results file (default: bench_e2e.json)")
+    args = parser.parse_args()
+    args.scenario = args.scenario or [(1, 10), (2, 120), (5, 1000), (20, 10000)]
+
+    report = asyncio.run(run(args))
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
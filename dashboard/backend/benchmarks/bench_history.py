@@ -0,0 +1,87 @@
+"""Benchmark history store queries for a day of 10-second readings.
+
+Fills a temporary HistoryStore with one UTC day of readings per panel at a
+fixed interval, then times the per-string store query behind
+/api/history/string/{string} and, separately, base64-encoding the columns
+and JSON-encoding the response body.
+
+Usage (from dashboard/backend):
+    python -m benchmarks.bench_history
+    python -m benchmarks.bench_history --panels 100 --interval 10 --rounds 5
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from app import json_codec
+from app.history_store import HISTORY_FIELDS, HistoryStore, encode_columns
+
+
+def fill(store: HistoryStore, labels: list[str], day: datetime, interval: int) -> int:
+    """Write one day of readings for every label and return the record count."""
+    count = 0
+    for step in range(0, 86400, interval):
+        at = day.timestamp() + step
+        for i, label in enumerate(labels):
+            watts = 200.0 + (i + step / interval) % 200
+            store.append(label, at, [watts, 41.2, 38.9, 7.58, 8.03, 42.0, 96.0, 180.0, step / 3600])
+            count += 1
+        if step % 3600 == 0:
+            store.flush()
+    store.flush()
+    return count
+
+
+def timed(fn, rounds: int) -> tuple[float, object]:
+    """Return the median time in milliseconds and the last result of ``fn``."""
+    samples = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def run(panels: int, interval: int, rounds: int) -> None:
+    day = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    labels = [f"P{i}" for i in range(panels)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = HistoryStore(root=Path(tmpdir))
+        start = time.perf_counter()
+        records = fill(store, labels, day, interval)
+        print(f"Wrote {records:,} records in {time.perf_counter() - start:.1f}s "
+              f"({records * store._record.size / 1e6:.1f} MB)")
+        print(f"JSON encoder: {json_codec.backend_name()}")
+        print()
+        print(f"{'fields':>8} {'points':>10} {'query':>10} {'encode':>10} {'total':>10}")
+
+        for fields in (["watts"], list(HISTORY_FIELDS)):
+            query_ms, series = timed(
+                lambda: store.query_many(labels, day, day + timedelta(days=1), fields), rounds
+            )
+            encode_ms, _ = timed(
+                lambda: json_codec.dumps_bytes({k: encode_columns(v) for k, v in series.items()}),
+                rounds,
+            )
+            points = sum(len(columns["t"]) for columns in series.values())
+            print(f"{len(fields):>8} {points:>10,} {query_ms:>8.1f}ms {encode_ms:>8.1f}ms "
+                  f"{query_ms + encode_ms:>8.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=100, help="Panels on the string (default: 100)")
+    parser.add_argument("--interval", type=int, default=10, help="Seconds between readings (default: 10)")
+    parser.add_argument("--rounds", type=int, default=5, help="Repetitions per measurement (default: 5)")
+    args = parser.parse_args()
+    run(args.panels, args.interval, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark MQTT topic routing and payload decoding for taptap state messages.
+
+Builds state payloads shaped like taptap-mqtt's (one entry per node with the
+full set of electrical, radio and timing fields) and times, per message:
+
+- legacy: the old endswith/split chain with json.loads(payload.decode())
+- router/<decoder>: TopicRouter matching plus each available decoder
+
+Handlers are no-ops, so the numbers are routing and decoding cost only.
+
+Usage (from dashboard/backend):
+    python -m benchmarks.bench_mqtt_decode
+    python -m benchmarks.bench_mqtt_decode --nodes 40 80 --messages 2000 --rounds 5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from app import json_codec
+from app.mqtt_router import TopicRouter
+
+
+def make_state_payload(nodes: int, system: str) -> bytes:
+    """One taptap-mqtt state message for a CCA with ``nodes`` optimizers."""
+    return json.dumps({
+        "time": "2026-06-01T12:00:00.000000+00:00",
+        "uptime": 86400,
+        "state": "online",
+        "nodes": {
+            f"{system[0].upper()}{i}": {
+                "node_id": str(100 + i),
+                "node_serial": f"4-{i:06X}R",
+                "node_name": f"{system[0].upper()}{i}",
+                "gateway_id": "4609",
+                "state_online": "online",
+                "voltage_in": 41.23 + i % 7 / 10,
+                "voltage_out": 38.91,
+                "current_in": 7.581,
+                "current_out": 8.032,
+                "power": 312.6 + i % 40,
+                "temperature": 42.3,
+                "duty_cycle": 96.1,
+                "rssi": 176.5,
+                "energy": 12.345 + i / 100,
+                "timestamp": "2026-06-01T11:59:58.123456+00:00",
+                "daily_max_power": 351.2,
+                "daily_reset_timestamp": "2026-06-01T00:00:00+00:00",
+            }
+            for i in range(nodes)
+        },
+    }).encode()
+
+
+async def legacy_route(topic: str, payload: bytes) -> None:
+    data = json.loads(payload.decode())
+    if topic.endswith("/temp_nodes"):
+        pass
+    elif topic.endswith("/node_mappings"):
+        pass
+    elif topic.endswith("/state"):
+        parts = topic.split("/")
+        _ = parts[1] if len(parts) >= 2 else None
+        _ = data.get("nodes", {})
+
+
+async def ignore(payload, system) -> None:
+    payload.get("nodes", {})
+
+
+def make_router(decoder_name: str) -> TopicRouter:
+    router = TopicRouter("taptap", decoder=json_codec.get_decoder(decoder_name))
+    router.add("+/state", ignore)
+    router.add("+/temp_nodes", ignore)
+    router.add("+/node_mappings", ignore)
+    return router
+
+
+async def per_message_us(dispatch, messages: list[tuple[str, bytes]], rounds: int) -> float:
+    """Median microseconds per message over ``rounds`` passes."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for topic, payload in messages:
+            await dispatch(topic, payload)
+        samples.append((time.perf_counter() - start) / len(messages) * 1e6)
+    return statistics.median(samples)
+
+
+async def run(node_counts: list[int], count: int, rounds: int) -> None:
+    print(f"Decoders available: {', '.join(json_codec.DECODERS)}")
+    print()
+    print(f"{'nodes':>6} {'bytes':>8} {'variant':>14} {'us/msg':>10} {'msgs/s':>10}")
+    for nodes in node_counts:
+        payloads = {
+            system: make_state_payload(nodes, system) for system in ("primary", "secondary")
+        }
+        messages = [
+            (f"taptap/{system}/state", payload) for system, payload in payloads.items()
+        ] * (count // 2)
+        variants = [("legacy", legacy_route)]
+        variants += [(f"router/{name}", make_router(name).dispatch) for name in json_codec.DECODERS]
+        for name, dispatch in variants:
+            us = await per_message_us(dispatch, messages, rounds)
+            print(f"{nodes:>6} {len(payloads['primary']):>8,} {name:>14} {us:>10.1f} {1e6 / us:>10,.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[20, 40, 80],
+                        help="Optimizers per CCA state message (default: 20 40 80)")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages per pass (default: 2000)")
+    parser.add_argument("--rounds", type=int, default=5, help="Repetitions per measurement (default: 5)")
+    args = parser.parse_args()
+    asyncio.run(run(args.nodes, args.messages, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
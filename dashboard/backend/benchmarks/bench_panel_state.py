@@ -0,0 +1,151 @@
+"""Benchmark panel state updates: PanelData reconstruction vs mutable PanelRecord.
+
+For 50, 500 and 5,000 simulated panels, measures update throughput and the
+memory held by the state store, comparing the legacy approach (a new
+validated PanelData per reading) with PanelService's in-place records.
+
+Usage (from dashboard/backend):
+    python -m benchmarks.bench_panel_state
+    python -m benchmarks.bench_panel_state --sizes 50 500 5000 --rounds 5
+"""
+
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from app.models import PanelData, PanelMapping
+from app.panel_service import PanelService
+
+
+def make_mapping(count: int) -> dict:
+    return {
+        "panels": [
+            {
+                "sn": f"4-{i:07d}",
+                "tigo_label": f"T{i}",
+                "display_label": f"P{i}",
+                "string": f"S{i // 20}",
+                "system": "primary" if i % 2 == 0 else "secondary",
+                "position": {"x_percent": (i * 7) % 100, "y_percent": (i * 13) % 100},
+            }
+            for i in range(count)
+        ],
+        "translations": {},
+    }
+
+
+def make_reading(i: int) -> dict:
+    return {
+        "watts": 300.0 + i % 50, "voltage_in": 41.2, "voltage_out": 38.9,
+        "current_in": 7.58, "current_out": 8.03, "temperature": 42.0,
+        "duty_cycle": 96.0, "rssi": 180.0, "energy": 12.345,
+    }
+
+
+def rss_bytes() -> int | None:
+    """Current resident set size from /proc (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class LegacyStore:
+    """The pre-optimisation store: rebuild a validated PanelData on every reading."""
+
+    def __init__(self, mapping: PanelMapping):
+        self.panels_by_sn = {p.sn: p for p in mapping.panels}
+        self.panel_state: dict[str, PanelData] = {}
+        for p in mapping.panels:
+            self.panel_state[p.display_label] = PanelData(
+                display_label=p.display_label, tigo_label=p.tigo_label, string=p.string,
+                system=p.system, sn=p.sn, position=p.position,
+            )
+
+    def update_panel(self, sn: str, **values) -> None:
+        cfg = self.panels_by_sn[sn]
+        existing = self.panel_state[cfg.display_label]
+        self.panel_state[cfg.display_label] = PanelData(
+            display_label=cfg.display_label, tigo_label=cfg.tigo_label, string=cfg.string,
+            system=cfg.system, sn=cfg.sn, node_id=existing.node_id, online=True, stale=False,
+            is_temporary=False, last_update=datetime.now(timezone.utc), position=cfg.position,
+            **values,
+        )
+
+
+def measure_updates(store, serials: list[str], readings: list[dict], rounds: int) -> float:
+    """Return updates per second over ``rounds`` passes across all panels."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sn, reading in zip(serials, readings):
+            store.update_panel(sn=sn, **reading)
+    elapsed = time.perf_counter() - start
+    return len(serials) * rounds / elapsed
+
+
+def measure_memory(build) -> tuple[object, int, int | None]:
+    """Build a store and return it with its traced allocation size and RSS growth."""
+    gc.collect()
+    rss_before = rss_bytes()
+    tracemalloc.start()
+    store = build()
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = rss_bytes()
+    rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return store, traced, rss_delta
+
+
+def run(sizes: list[int], rounds: int) -> None:
+    print(f"{'panels':>7} {'store':>7} {'updates/s':>12} {'traced KiB':>11} {'RSS delta KiB':>14}")
+    for size in sizes:
+        data = make_mapping(size)
+        mapping = PanelMapping(**data)
+        serials = [p.sn for p in mapping.panels]
+        readings = [make_reading(i) for i in range(size)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config_path = os.path.join(tmpdir, "panel_mapping.json")
+            with open(config_path, "w") as f:
+                json.dump(data, f)
+
+            def build_records():
+                service = PanelService(
+                    config_path=config_path, yaml_path=os.path.join(tmpdir, "panels.yaml")
+                )
+                service.load_config()
+                # Populate every record with a reading so both stores hold equal data
+                for sn, reading in zip(serials, readings):
+                    service.update_panel(sn=sn, **reading)
+                return service
+
+            def build_legacy():
+                store = LegacyStore(mapping)
+                for sn, reading in zip(serials, readings):
+                    store.update_panel(sn=sn, **reading)
+                return store
+
+            for name, build in (("legacy", build_legacy), ("records", build_records)):
+                store, traced, rss_delta = measure_memory(build)
+                rate = measure_updates(store, serials, readings, rounds)
+                rss_text = f"{rss_delta / 1024:.0f}" if rss_delta is not None else "n/a"
+                print(f"{size:>7} {name:>7} {rate:>12,.0f} {traced / 1024:>11.0f} {rss_text:>14}")
+                del store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000], help="Panel counts")
+    parser.add_argument("--rounds", type=int, default=5, help="Update passes per measurement (default: 5)")
+    args = parser.parse_args()
+    run(args.sizes, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
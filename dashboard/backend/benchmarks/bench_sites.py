@@ -0,0 +1,153 @@
+"""Benchmark the memory cost of serving extra sites from one backend process.
+
+Compares two ways to monitor N installations:
+
+- one container per site: every site pays for a whole backend process. The
+  floor is measured as the resident set of a fresh interpreter after
+  ``import app.main`` (excluding the container runtime itself).
+- multi-site mode: one process, N Site objects sharing the MQTTHub. Each
+  site's cost is measured with tracemalloc across creating, loading and
+  feeding it one state message per CCA, and compared with the estimate that
+  ``Site.memory_usage`` reports on /api/sites. The estimate walks the site's
+  objects with sys.getsizeof and misses allocator and pydantic-core
+  overhead, so expect it to read about half the measured figure.
+
+Usage (from dashboard/backend):
+    python -m benchmarks.bench_sites
+    python -m benchmarks.bench_sites --sites 1 10 50 --panels 40 400
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from app.config import Settings
+from app.mqtt_hub import MQTTHub
+from app.sites import Site
+
+from .bench_mqtt_decode import make_state_payload
+
+SYSTEMS = ("primary", "secondary")
+
+BASELINE_SCRIPT = """
+import app.main
+for line in open("/proc/self/status"):
+    if line.startswith("VmRSS:"):
+        print(int(line.split()[1]) * 1024)
+"""
+
+
+def process_floor_bytes() -> int:
+    """Resident memory of a fresh backend process with the app imported."""
+    result = subprocess.run(
+        [sys.executable, "-c", BASELINE_SCRIPT],
+        capture_output=True, text=True, check=True,
+        env={"USE_MOCK_DATA": "false", "HISTORY_ENABLED": "false", "LOG_LEVEL": "WARNING", "PATH": ""},
+    )
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+def serial(system: str, i: int) -> str:
+    return f"4-{SYSTEMS.index(system):02X}{i:04X}R"
+
+
+def state_payload(system: str, nodes: int) -> bytes:
+    """make_state_payload with serials unique across both CCAs."""
+    data = json.loads(make_state_payload(nodes, system))
+    for i, node in enumerate(data["nodes"].values()):
+        node["node_serial"] = serial(system, i)
+    return json.dumps(data).encode()
+
+
+def write_config(config_dir: Path, panels: int) -> None:
+    """A panel_mapping.json whose serials match state_payload's nodes."""
+    config_dir.mkdir(parents=True, exist_ok=True)
+    per_system = panels // len(SYSTEMS)
+    entries = [
+        {
+            "sn": serial(system, i),
+            "tigo_label": f"{system[0].upper()}{i}",
+            "display_label": f"{system[0].upper()}{i}",
+            "string": f"{system[0].upper()}{i // 20}",
+            "system": system,
+            "position": {"x_percent": 10.0, "y_percent": 10.0},
+        }
+        for system in SYSTEMS
+        for i in range(per_system)
+    ]
+    (config_dir / "panel_mapping.json").write_text(json.dumps({"panels": entries, "translations": {}}))
+
+
+async def measure(site_count: int, panels: int, root: Path) -> dict:
+    settings = Settings(use_mock_data=False, config_watch_mode="poll", log_level="WARNING")
+    hub = MQTTHub("bench.local", decoder=settings.mqtt_payload_decoder)
+    payloads = {system: state_payload(system, panels // len(SYSTEMS)) for system in SYSTEMS}
+    for n in range(site_count):
+        write_config(root / f"site{n}", panels)
+
+    await hub.start(connect=False)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sites = []
+    for n in range(site_count):
+        site = Site(f"site{n}", root / f"site{n}", f"bench/site{n}", hub=hub, settings=settings)
+        await site.start()
+        for system in SYSTEMS:
+            hub.enqueue(f"bench/site{n}/{system}/state", payloads[system])
+        sites.append(site)
+    while hub.pending():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    gc.collect()
+    measured = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    estimated = sum(site.memory_usage()["total"] for site in sites)
+    readings = sum(
+        1 for site in sites for record in site.panel_service.panel_state.values() if record.watts is not None
+    )
+    for site in sites:
+        await site.stop()
+    await hub.stop()
+    return {
+        "sites": site_count,
+        "panels": panels,
+        "readings": readings,
+        "per_site_measured": measured / site_count,
+        "per_site_estimated": estimated / site_count,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sites", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--panels", type=int, nargs="+", default=[40, 400])
+    args = parser.parse_args()
+
+    floor = process_floor_bytes()
+    print(f"One backend process (container floor): {floor / 2**20:.1f} MiB RSS\n")
+    print(f"{'sites':>6} {'panels':>7} {'per site measured':>19} {'per site reported':>19} {'vs container':>13}")
+    for panels in args.panels:
+        for site_count in args.sites:
+            with tempfile.TemporaryDirectory() as tmp:
+                result = asyncio.run(measure(site_count, panels, Path(tmp)))
+            assert result["readings"] == site_count * panels, result
+            print(
+                f"{site_count:>6} {panels:>7} "
+                f"{result['per_site_measured'] / 1024:>15.0f} KiB "
+                f"{result['per_site_estimated'] / 1024:>15.0f} KiB "
+                f"{floor / result['per_site_measured']:>12.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
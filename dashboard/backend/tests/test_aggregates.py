@@ -0,0 +1,98 @@
+"""Tests for aggregates.py running string and system totals."""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.panel_service import PanelService
+
+# Local-time readings so kWh-today day boundaries follow the server clock
+MORNING = datetime(2026, 6, 1, 9, 0).astimezone()
+
+
+@pytest.fixture
+def service(tmp_path, valid_panel_mapping):
+    valid_panel_mapping["panels"].append({
+        "sn": "4-C3F2B00",
+        "tigo_label": "B1",
+        "display_label": "B1",
+        "string": "B",
+        "system": "secondary",
+        "position": {"x_percent": 50.0, "y_percent": 50.0},
+    })
+    config_path = tmp_path / "panel_mapping.json"
+    config_path.write_text(json.dumps(valid_panel_mapping))
+    service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+    service.load_config()
+    return service
+
+
+def read(service, sn, watts, energy=None, at=MORNING):
+    service.update_panel(sn=sn, watts=watts, voltage_in=40.0, energy=energy, received_at=at)
+
+
+class TestAggregates:
+    def test_watts_totals_follow_deltas(self, service):
+        read(service, "4-C3F23CR", 300.0)
+        read(service, "4-C3F2ACK", 200.0)
+        read(service, "4-C3F23CR", 250.0)
+
+        aggregates = service.get_aggregates()
+        assert aggregates["strings"]["A"]["watts"] == 450.0
+        assert aggregates["strings"]["A"]["reporting"] == 2
+        assert aggregates["systems"]["primary"]["watts"] == 450.0
+        assert aggregates["strings"]["B"] == {
+            "watts": 0.0, "kwh_today": 0.0, "peak": None, "peak_watts": None,
+            "panels": 1, "reporting": 0,
+        }
+
+    def test_peak_panel_recomputed_when_peak_drops(self, service):
+        read(service, "4-C3F23CR", 300.0)
+        read(service, "4-C3F2ACK", 200.0)
+        assert service.get_aggregates()["strings"]["A"]["peak"] == "A1"
+
+        read(service, "4-C3F23CR", 150.0)
+        string_a = service.get_aggregates()["strings"]["A"]
+        assert string_a["peak"] == "A2"
+        assert string_a["peak_watts"] == 200.0
+
+    def test_kwh_today_from_energy_counter(self, service):
+        read(service, "4-C3F23CR", 300.0, energy=100.0)
+        read(service, "4-C3F23CR", 300.0, energy=100.5, at=MORNING + timedelta(hours=1))
+        read(service, "4-C3F2ACK", 200.0, energy=10.0)
+        read(service, "4-C3F2ACK", 200.0, energy=10.25, at=MORNING + timedelta(hours=1))
+        # Counter reset counts the new value as fresh energy
+        read(service, "4-C3F2ACK", 200.0, energy=0.25, at=MORNING + timedelta(hours=2))
+
+        assert service.aggregates.snapshot()["strings"]["A"]["kwh_today"] == 1.0
+
+        # A new local day starts from zero
+        read(service, "4-C3F23CR", 300.0, energy=101.0, at=MORNING + timedelta(days=1))
+        assert service.aggregates.snapshot()["strings"]["A"]["kwh_today"] == 0.5
+
+    def test_changed_aggregates_only_include_touched_groups(self, service):
+        service.get_changed_aggregates()
+        read(service, "4-C3F2B00", 120.0)
+
+        changed = service.get_changed_aggregates()
+        assert set(changed["strings"]) == {"B"}
+        assert set(changed["systems"]) == {"secondary"}
+        assert service.get_changed_aggregates() is None
+
+    def test_snapshot_cached_until_change(self, service):
+        read(service, "4-C3F23CR", 300.0)
+        first = service.aggregates.snapshot()
+        assert service.aggregates.snapshot() is first
+
+        read(service, "4-C3F23CR", 310.0)
+        assert service.aggregates.snapshot() is not first
+
+    def test_totals_survive_config_reload(self, service):
+        read(service, "4-C3F23CR", 300.0, energy=5.0)
+        read(service, "4-C3F23CR", 300.0, energy=5.5, at=MORNING + timedelta(minutes=10))
+        service.load_config()
+
+        string_a = service.aggregates.snapshot()["strings"]["A"]
+        assert string_a["watts"] == 300.0
+        assert string_a["kwh_today"] == 0.5
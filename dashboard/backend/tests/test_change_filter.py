@@ -0,0 +1,69 @@
+"""Tests for change_filter.py duplicate node reading suppression."""
+
+from app.change_filter import NodeChangeFilter
+from app.mqtt_client import MQTTClient
+from app.mqtt_hub import MQTTHub
+
+
+def node(serial: str, power: float = 300.0, timestamp: str = "2026-06-01T12:00:00") -> dict:
+    return {"node_serial": serial, "power": power, "voltage_in": 41.0, "timestamp": timestamp}
+
+
+class TestNodeChangeFilter:
+    def test_exact_repeats_are_dropped_and_counted_per_system(self):
+        change_filter = NodeChangeFilter()
+        nodes = {"A1": node("4-A1"), "A2": node("4-A2")}
+
+        assert change_filter.filter(nodes, "primary", now=0) == nodes
+        assert change_filter.filter(dict(nodes), "primary", now=10) == {}
+        # Same serials on another CCA are tracked separately
+        assert len(change_filter.filter(dict(nodes), "secondary", now=10)) == 2
+
+        stats = change_filter.stats()
+        assert stats["primary"] == {"received": 4, "duplicates": 2, "duplicate_ratio": 0.5}
+        assert stats["secondary"]["duplicates"] == 0
+
+    def test_changed_value_or_timestamp_passes(self):
+        change_filter = NodeChangeFilter()
+        change_filter.filter({"A1": node("4-A1"), "A2": node("4-A2")}, "primary", now=0)
+
+        changed = change_filter.filter({
+            "A1": node("4-A1", power=301.0),
+            "A2": node("4-A2", timestamp="2026-06-01T12:00:10"),
+        }, "primary", now=10)
+
+        assert set(changed) == {"A1", "A2"}
+
+    def test_repeat_passes_again_after_refresh_interval(self):
+        change_filter = NodeChangeFilter(refresh_seconds=150)
+        nodes = {"A1": node("4-A1")}
+        change_filter.filter(nodes, "primary", now=0)
+
+        assert change_filter.filter(nodes, "primary", now=149) == {}
+        assert change_filter.filter(nodes, "primary", now=150) == nodes
+        assert change_filter.filter(nodes, "primary", now=200) == {}
+
+    def test_reset_and_nodes_without_serial(self):
+        change_filter = NodeChangeFilter()
+        nodes = {"A1": node("4-A1"), "bad": {"power": 1.0}}
+        change_filter.filter(nodes, "primary", now=0)
+
+        assert change_filter.filter(nodes, "primary", now=1) == {"bad": {"power": 1.0}}
+        change_filter.reset()
+        assert change_filter.filter(nodes, "primary", now=2) == nodes
+
+
+class TestClientIntegration:
+    async def test_fully_repeated_payload_skips_callback(self):
+        calls = []
+
+        async def on_state(nodes, source_system):
+            calls.append(sorted(nodes))
+
+        client = MQTTClient(on_state=on_state, hub=MQTTHub("broker"), change_filter=NodeChangeFilter())
+        payload = {"nodes": {"A1": node("4-A1"), "A2": node("4-A2")}}
+        await client._process_message(payload, "primary")
+        await client._process_message(payload, "primary")
+        await client._process_message({"nodes": {"A1": node("4-A1", power=1.0), "A2": node("4-A2")}}, "primary")
+
+        assert calls == [["A1", "A2"], ["A1"]]
@@ -0,0 +1,91 @@
+"""Tests for config_watcher.py background hot-reload."""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+from app.config_watcher import ConfigWatcher
+from app.panel_service import PanelService
+
+
+@pytest.fixture
+def config_path(tmp_path, valid_panel_mapping):
+    path = tmp_path / "panel_mapping.json"
+    path.write_text(json.dumps(valid_panel_mapping))
+    return path
+
+
+@pytest.fixture
+def service(tmp_path, config_path):
+    service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+    service.load_config()
+    return service
+
+
+def rewrite(path, mapping) -> None:
+    """Write a new config and push its mtime past the NAS jitter tolerance."""
+    path.write_text(json.dumps(mapping))
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+class TestConfigWatcher:
+    async def test_check_now_swaps_in_changed_config(self, service, config_path, valid_panel_mapping):
+        reloads = []
+
+        async def on_reload():
+            reloads.append(len(service.get_all_panels()))
+
+        watcher = ConfigWatcher(service, on_reload=on_reload, mode="poll")
+        valid_panel_mapping["panels"] = valid_panel_mapping["panels"][:1]
+        rewrite(config_path, valid_panel_mapping)
+
+        assert await watcher.check_now() is True
+        assert reloads == [1]
+        assert await watcher.check_now() is False
+
+    async def test_unchanged_config_is_not_reloaded(self, service):
+        watcher = ConfigWatcher(service, mode="poll")
+        assert await watcher.check_now() is False
+        assert watcher.reload_count == 0
+
+    async def test_invalid_config_keeps_current_state(self, service, config_path):
+        watcher = ConfigWatcher(service, mode="poll")
+        config_path.write_text("{not json")
+        stat = config_path.stat()
+        os.utime(config_path, (stat.st_atime, stat.st_mtime + 10))
+
+        assert await watcher.check_now() is False
+        assert len(service.get_all_panels()) == 2
+
+    async def test_removed_config_clears_state(self, service, config_path):
+        watcher = ConfigWatcher(service, mode="poll")
+        config_path.unlink()
+
+        assert await watcher.check_now() is True
+        assert service.get_all_panels() == []
+        _, resync = service.get_changed_panels()
+        assert resync is True
+
+    async def test_poll_loop_reloads_in_background(self, service, config_path, valid_panel_mapping):
+        reloaded = asyncio.Event()
+
+        async def on_reload():
+            reloaded.set()
+
+        watcher = ConfigWatcher(service, on_reload=on_reload, mode="poll", poll_interval=0.01, debounce_ms=10)
+        watcher.start()
+        try:
+            valid_panel_mapping["panels"][0]["display_label"] = "Z9"
+            rewrite(config_path, valid_panel_mapping)
+            await asyncio.wait_for(reloaded.wait(), timeout=1.0)
+        finally:
+            await watcher.stop()
+
+        assert {p.display_label for p in service.get_all_panels()} == {"Z9", "A2"}
+
+    def test_unknown_mode_rejected(self, service):
+        with pytest.raises(ValueError):
+            ConfigWatcher(service, mode="fsevents")
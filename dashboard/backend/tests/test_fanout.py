@@ -0,0 +1,199 @@
+"""Tests for fanout.py publisher and edge mirror.
+
+Most tests loop the hub's publish back into its own ingest path, so the
+ingest and edge side share one MQTTHub without a broker. Set
+FANOUT_TEST_BROKER=host[:port] to also run the round trip through a real
+local broker (e.g. ``docker run -p 1883:1883 eclipse-mosquitto``).
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app import json_codec
+from app.fanout import EdgeMirror, FanoutPublisher
+from app.mqtt_hub import MQTTHub
+from app.websocket_manager import ConnectionManager
+
+from .test_websocket_manager import FakeWebSocket, make_panel
+
+TOPIC = "test/fanout"
+
+
+def loopback(hub: MQTTHub) -> list[tuple[str, str, bool]]:
+    """Make ``hub.publish`` deliver to the hub itself; returns the publish log."""
+    published = []
+
+    async def publish(topic, payload, retain=False):
+        published.append((topic, payload, retain))
+        hub.enqueue(topic, payload)
+        return True
+
+    hub.publish = publish
+    return published
+
+
+async def until(predicate, timeout: float = 2.0) -> None:
+    async def wait():
+        while not predicate():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(wait(), timeout)
+
+
+@pytest.fixture
+async def pair():
+    """An ingest ConnectionManager with a publisher and an edge manager with a mirror."""
+    panels = [make_panel("A1"), make_panel("A2")]
+    hub = MQTTHub("broker.local")
+    published = loopback(hub)
+    ingest = ConnectionManager(snapshot_provider=lambda: panels)
+    edge = ConnectionManager()
+    publisher = FanoutPublisher(hub, ingest, topic=TOPIC, snapshot_interval=60)
+    mirror = EdgeMirror(hub, edge, topic=TOPIC, edge_id="edge-1")
+    await publisher.start()
+    await mirror.start()
+    await hub.start(connect=False)
+    yield ingest, edge, publisher, mirror, published
+    await publisher.stop()
+    await mirror.stop()
+    await hub.stop()
+    await edge.stop_background_tasks()
+
+
+class TestRoundTrip:
+    async def test_edge_mirrors_snapshot_and_deltas(self, pair):
+        ingest, edge, publisher, mirror, published = pair
+
+        await ingest.broadcast([make_panel("A1"), make_panel("A2")])
+        await ingest.broadcast_delta([make_panel("A2", watts=250.0)])
+        await until(lambda: mirror.seq == 2)
+
+        assert mirror.get_panels()[1]["watts"] == 250.0
+        assert edge.seq == ingest.seq == 2
+        # Snapshots are retained for edges that join later; deltas are not
+        assert [(topic, retain) for topic, _, retain in published] == [
+            (f"{TOPIC}/snapshot", True),
+            (f"{TOPIC}/frames", False),
+        ]
+
+    async def test_edge_clients_get_snapshot_then_relayed_deltas(self, pair):
+        ingest, edge, publisher, mirror, published = pair
+        await ingest.broadcast([make_panel("A1"), make_panel("A2")])
+        await until(lambda: mirror.synced)
+
+        ws = FakeWebSocket()
+        await edge.connect(ws)
+        await edge.send_current_snapshot(ws)
+        await ingest.broadcast_delta([make_panel("A1", watts=7.0)])
+        await until(lambda: len(ws.sent) == 2)
+
+        assert [(f["type"], f["seq"]) for f in ws.sent] == [("snapshot", 1), ("delta", 2)]
+        assert len(ws.sent[0]["panels"]) == 2
+        assert ws.sent[1]["changed"][0]["watts"] == 7.0
+
+    async def test_gap_triggers_resync_snapshot(self, pair):
+        ingest, edge, publisher, mirror, published = pair
+        await ingest.broadcast([make_panel("A1")])
+        await until(lambda: mirror.synced)
+
+        ingest._seq += 1  # A delta the edge never saw
+        await ingest.broadcast_delta([make_panel("A1", watts=3.0)])
+        await until(lambda: publisher.resync_requests == 1)
+        await until(lambda: publisher.snapshots_published == 2)
+
+        assert mirror.gaps == 1
+        assert any(topic == f"{TOPIC}/resync" for topic, _, _ in published)
+
+    async def test_delta_burst_is_not_coalesced(self):
+        hub = MQTTHub("broker.local")
+        edge = ConnectionManager()
+        mirror = EdgeMirror(hub, edge, topic=TOPIC)
+        await mirror.start()
+        await hub.start(connect=False)
+        try:
+            hub.enqueue(f"{TOPIC}/snapshot", json_codec.dumps(
+                {"type": "snapshot", "seq": 1, "panels": [make_panel("A1").model_dump(mode="json")]}
+            ))
+            for seq in range(2, 7):
+                panel = make_panel(f"A{seq}").model_dump(mode="json")
+                delta = {"type": "delta", "seq": seq, "changed": [panel]}
+                hub.enqueue(f"{TOPIC}/frames", json_codec.dumps(delta))
+            await until(lambda: mirror.seq == 6)
+        finally:
+            await mirror.stop()
+            await hub.stop()
+
+        assert mirror.frames_received == 6
+        assert mirror.gaps == 0
+        assert sorted(mirror.panels) == ["A1", "A2", "A3", "A4", "A5", "A6"]
+
+    async def test_retained_seq_is_the_published_snapshots_own(self):
+        hub = MQTTHub("broker.local")
+        ingest = ConnectionManager(snapshot_provider=lambda: [make_panel("A1")])
+        publisher = FanoutPublisher(hub, ingest, topic=TOPIC, snapshot_interval=0.05)
+        published = []
+
+        async def publish(topic, payload, retain=False):
+            published.append((topic, json_codec.get_decoder()(payload)["seq"]))
+            return True
+
+        hub.publish = publish
+        await publisher.start()
+        try:
+            # Deltas broadcast after the snapshot but before the publisher drains it
+            await ingest.broadcast([make_panel("A1")])
+            await ingest.broadcast_delta([make_panel("A1", watts=1.0)])
+            await ingest.broadcast_delta([make_panel("A1", watts=2.0)])
+            await until(lambda: len(published) == 3)
+            assert publisher._retained_seq == 1
+
+            # The periodic refresh notices the retained snapshot is behind
+            await until(lambda: publisher.snapshots_published == 2)
+            assert published[-1] == (f"{TOPIC}/snapshot", 3)
+            assert publisher._retained_seq == 3
+        finally:
+            await publisher.stop()
+
+    async def test_publisher_backlog_collapses_into_snapshot(self):
+        hub = MQTTHub("broker.local")
+        ingest = ConnectionManager(snapshot_provider=lambda: [make_panel("A1")])
+        publisher = FanoutPublisher(hub, ingest, topic=TOPIC, max_pending=2)
+        ingest.frame_listeners.append(publisher.on_frame)
+
+        for watts in range(5):
+            await ingest.broadcast_delta([make_panel("A1", watts=float(watts))])
+
+        assert publisher._needs_snapshot
+        assert len(publisher._pending) == 2
+        assert publisher.frames_dropped == 3
+
+
+@pytest.mark.skipif(not os.environ.get("FANOUT_TEST_BROKER"), reason="FANOUT_TEST_BROKER not set")
+class TestLocalBroker:
+    async def test_round_trip_through_broker(self):
+        host, _, port = os.environ["FANOUT_TEST_BROKER"].partition(":")
+        topic = f"test/fanout-{uuid.uuid4().hex[:8]}"
+        ingest_hub = MQTTHub(host, int(port or 1883), topic_prefix="unused")
+        edge_hub = MQTTHub(host, int(port or 1883), topic_prefix="unused")
+        ingest = ConnectionManager(snapshot_provider=lambda: [make_panel("A1")])
+        edge = ConnectionManager()
+        publisher = FanoutPublisher(ingest_hub, ingest, topic=topic)
+        mirror = EdgeMirror(edge_hub, edge, topic=topic)
+        await publisher.start()
+        await mirror.start()
+        await ingest_hub.start()
+        await edge_hub.start()
+        try:
+            await until(lambda: ingest_hub.connected and edge_hub.connected, timeout=10)
+            await until(lambda: mirror.synced, timeout=10)
+            await ingest.broadcast_delta([make_panel("A1", watts=42.0)])
+            await until(lambda: mirror.seq == ingest.seq, timeout=10)
+            assert mirror.panels["A1"]["watts"] == 42.0
+        finally:
+            await ingest_hub.publish(f"{topic}/snapshot", b"", retain=True)  # Clear the retained snapshot
+            await publisher.stop()
+            await mirror.stop()
+            await ingest_hub.stop()
+            await edge_hub.stop()
@@ -0,0 +1,201 @@
+"""Tests for history_store.py and the /api/history endpoints."""
+
+import asyncio
+import base64
+import json
+import math
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import history_router, json_codec
+from app.history_store import HISTORY_FIELDS, HistoryStore, encode_columns
+from app.main import app
+from app.panel_service import PanelService
+
+from .test_websocket_manager import make_panel
+
+DAY = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+def reading(watts: float) -> list:
+    return [watts, 41.0, 38.5, 7.5, 8.0, 40.0, 95.0, 180.0, None]
+
+
+def decode_columns(encoded: dict) -> dict[str, list]:
+    """Decode base64 API columns back to lists, with NaN gaps as None."""
+    columns = {}
+    for name, data in encoded.items():
+        column = array("I" if name == "t" else "f")
+        column.frombytes(base64.b64decode(data))
+        columns[name] = [None if v != v else v for v in column.tolist()]
+    return columns
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(root=tmp_path / "history", retention_days=7)
+
+
+class TestHistoryStore:
+    def test_round_trip_through_segment_files(self, store):
+        for i in range(6):
+            store.append("A1", (DAY + timedelta(seconds=10 * i)).timestamp(), reading(100.0 + i))
+        assert store.flush() == 6
+
+        segment = store.root / "2026-06-01" / "A1.f32"
+        assert segment.stat().st_size == 6 * 4 * (len(HISTORY_FIELDS) + 1)
+
+        columns = store.query("A1", DAY, DAY + timedelta(minutes=1), ["watts", "energy"])
+        assert columns["t"].tolist() == [int(DAY.timestamp()) + 10 * i for i in range(6)]
+        assert columns["watts"].tolist() == [100.0, 101.0, 102.0, 103.0, 104.0, 105.0]
+        assert all(math.isnan(v) for v in columns["energy"])
+
+        # Gaps stay NaN in the encoded API columns
+        encoded = encode_columns(columns)
+        assert set(encoded) == {"t", "watts", "energy"}
+        assert len(base64.b64decode(encoded["watts"])) == 6 * 4
+        assert decode_columns(encoded)["energy"] == [None] * 6
+        assert decode_columns(encoded)["t"] == columns["t"].tolist()
+
+    def test_query_filters_by_time_and_includes_unflushed(self, store):
+        for i in range(10):
+            store.append("A1", (DAY + timedelta(minutes=i)).timestamp(), reading(float(i)))
+        store.flush()
+        store.append("A1", (DAY + timedelta(minutes=10)).timestamp(), reading(10.0))
+
+        columns = store.query("A1", DAY + timedelta(minutes=3), DAY + timedelta(minutes=11), ["watts"])
+        assert columns["watts"].tolist() == [3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0]
+
+    def test_query_spans_days(self, store):
+        store.append("A1", (DAY - timedelta(seconds=30)).timestamp(), reading(1.0))
+        store.append("A1", (DAY + timedelta(seconds=30)).timestamp(), reading(2.0))
+        store.flush()
+
+        assert (store.root / "2026-05-31" / "A1.f32").exists()
+        columns = store.query("A1", DAY - timedelta(minutes=1), DAY + timedelta(minutes=1), ["watts"])
+        assert columns["watts"].tolist() == [1.0, 2.0]
+
+    def test_torn_trailing_record_is_ignored(self, store):
+        store.append("A1", DAY.timestamp(), reading(5.0))
+        store.flush()
+        with open(store.root / "2026-06-01" / "A1.f32", "ab") as f:
+            f.write(b"\x00\x01\x02")
+
+        assert store.query("A1", DAY, DAY + timedelta(seconds=1), ["watts"])["watts"].tolist() == [5.0]
+
+    def test_unsafe_keys_stay_inside_day_directory(self, store):
+        store.append("../x", DAY.timestamp(), reading(1.0))
+        store.flush()
+
+        assert [p.name for p in (store.root / "2026-06-01").iterdir()] == ["%2E%2E%2Fx.f32"]
+
+    def test_prune_removes_days_outside_retention(self, store):
+        for offset in (0, 8, 10):
+            store.append("A1", (DAY - timedelta(days=offset)).timestamp(), reading(1.0))
+        store.flush()
+
+        assert store.prune(today=date(2026, 6, 1)) == 2
+        assert sorted(p.name for p in store.root.iterdir()) == ["2026-06-01"]
+
+    def test_record_panel_listener(self, store, tmp_path, valid_panel_mapping):
+        config_path = tmp_path / "panel_mapping.json"
+        config_path.write_text(json.dumps(valid_panel_mapping))
+        service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+        service.load_config()
+        service.reading_listeners.append(store.record_panel)
+
+        service.update_panel(sn="4-C3F23CR", watts=385.0, voltage_in=42.5, received_at=DAY)
+
+        columns = store.query("A1", DAY, DAY + timedelta(seconds=1), ["watts", "voltage_in"])
+        assert columns["watts"].tolist() == [385.0]
+        assert columns["voltage_in"].tolist() == [42.5]
+
+
+class TestHistoryRouter:
+    @pytest.fixture
+    def client(self, store, tmp_path, valid_panel_mapping):
+        config_path = tmp_path / "panel_mapping.json"
+        config_path.write_text(json.dumps(valid_panel_mapping))
+        service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+        service.load_config()
+        for i in range(3):
+            at = (DAY + timedelta(seconds=10 * i)).timestamp()
+            store.append("A1", at, reading(100.0 + i))
+            store.append("A2", at, reading(200.0 + i))
+        store.flush()
+
+        with patch("app.history_router.get_history_store", return_value=store), \
+                patch("app.history_router.get_panel_service", return_value=service):
+            yield TestClient(app)
+
+    def test_panel_history(self, client):
+        response = client.get(
+            "/api/history/A1",
+            params={"start": DAY.isoformat(), "end": (DAY + timedelta(hours=1)).isoformat()},
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert body["encoding"] == "base64"
+        columns = decode_columns({name: body[name] for name in ("t", *body["fields"])})
+        assert columns["watts"] == [100.0, 101.0, 102.0]
+        assert columns["energy"] == [None, None, None]
+        assert len(columns["t"]) == 3
+
+    def test_string_history(self, client):
+        response = client.get(
+            "/api/history/string/A",
+            params={"start": DAY.isoformat(), "end": (DAY + timedelta(hours=1)).isoformat(), "fields": "watts"},
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert body["fields"] == ["watts"]
+        assert decode_columns(body["panels"]["A2"])["watts"] == [200.0, 201.0, 202.0]
+        assert set(body["panels"]["A1"]) == {"t", "watts"}
+
+    def test_body_encoded_off_the_event_loop(self, client):
+        on_loop = []
+        encode = json_codec.dumps_bytes
+
+        def recording_dumps(obj):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return encode(obj)
+
+        with patch("app.history_router.json_codec.dumps_bytes", side_effect=recording_dumps):
+            response = client.get("/api/history/string/A", params={
+                "start": DAY.isoformat(), "end": (DAY + timedelta(hours=1)).isoformat(),
+            })
+        assert response.status_code == 200
+        assert on_loop == [False]
+
+    def test_serving_worker_looks_up_panels_in_its_panel_source(self, client, monkeypatch):
+        # A serving worker's own PanelService is empty; its panels come from shared memory
+        monkeypatch.setattr(history_router, "get_panel_service", lambda: PanelService(config_path="missing.json"))
+        monkeypatch.setattr(history_router, "_panel_source", lambda: [make_panel("A1"), make_panel("A2")])
+        window = {"start": DAY.isoformat(), "end": (DAY + timedelta(hours=1)).isoformat(), "fields": "watts"}
+
+        response = client.get("/api/history/A1", params=window)
+        assert response.status_code == 200
+        assert decode_columns({"watts": response.json()["watts"]})["watts"] == [100.0, 101.0, 102.0]
+        assert set(client.get("/api/history/string/A", params=window).json()["panels"]) == {"A1", "A2"}
+        assert client.get("/api/history/Z9", params=window).status_code == 404
+
+    def test_edge_without_history_answers_conflict(self, client, monkeypatch):
+        monkeypatch.setattr(history_router, "_panel_source", None)
+
+        response = client.get("/api/history/A1")
+        assert response.status_code == 409
+        assert response.json()["detail"]["error"] == "not_ingest_instance"
+
+    def test_unknown_panel_and_field(self, client):
+        assert client.get("/api/history/Z9").status_code == 404
+        response = client.get("/api/history/A1", params={"fields": "watts,bogus"})
+        assert response.status_code == 400
+        assert response.json()["detail"]["details"] == ["bogus"]
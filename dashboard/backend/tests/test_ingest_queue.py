@@ -0,0 +1,48 @@
+"""Tests for ingest_queue.py coalescing queue and lane idle handling."""
+
+import asyncio
+
+from app.ingest_queue import CoalescingQueue, IngestLane
+
+
+class TestCoalescingQueue:
+    async def test_newer_item_replaces_waiting_one_in_place(self):
+        queue = CoalescingQueue(maxsize=4)
+        queue.put_nowait("a", 1)
+        queue.put_nowait("b", 2)
+        queue.put_nowait("a", 3)
+
+        assert [await queue.get(), await queue.get()] == [("a", 3), ("b", 2)]
+        assert queue.stats()["coalesced"] == 1
+
+    async def test_wait_ready_timeout_leaves_queue_intact(self):
+        queue = CoalescingQueue()
+        assert await queue.wait_ready(0.01) is False
+
+        # Put lands on the same loop turn the timeout fires
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, queue.put_nowait, "a", 1)
+        await queue.wait_ready(0.01)
+
+        assert len(queue) == 1
+        assert queue.get_nowait() == ("a", 1)
+
+
+class TestIngestLane:
+    async def test_items_processed_before_idle_retirement(self):
+        processed = []
+        retired = []
+
+        async def process(item):
+            processed.append(item)
+
+        lane = IngestLane("cca", process, idle_timeout=0.02, on_idle=retired.append)
+        lane.queue.put_nowait("a", 1)
+        lane.start()
+        await asyncio.sleep(0.01)
+        lane.queue.put_nowait("b", 2)
+        await asyncio.wait_for(lane._task, timeout=1)
+
+        assert processed == [1, 2]
+        assert retired == [lane]
+        assert not lane.running
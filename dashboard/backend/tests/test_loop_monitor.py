@@ -0,0 +1,93 @@
+"""Tests for loop_monitor.py lag sampling and blocked-loop detection."""
+
+import asyncio
+import time
+
+import pytest
+
+from app import metrics as metrics_module
+from app.loop_monitor import LoopMonitor, TaskLabelMiddleware, describe_task
+from app.metrics import PipelineMetrics
+
+
+@pytest.fixture(autouse=True)
+def metrics(monkeypatch):
+    fresh = PipelineMetrics()
+    monkeypatch.setattr(metrics_module, "_metrics", fresh)
+    return fresh
+
+
+def parse_state_file_slowly():
+    time.sleep(0.25)
+
+
+async def until(predicate, timeout: float = 2.0) -> None:
+    async def wait():
+        while not predicate():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(wait(), timeout)
+
+
+class TestLagSampler:
+    async def test_records_lag_caused_by_blocking_call(self, metrics):
+        monitor = LoopMonitor(interval=0.01)
+        monitor.start()
+        try:
+            await asyncio.sleep(0.03)
+            time.sleep(0.1)
+            await until(lambda: monitor.lag.max >= 0.05)
+        finally:
+            await monitor.stop()
+
+        assert metrics.event_loop_lag_seconds.count == monitor.lag.count
+        assert metrics.event_loop_lag_seconds.quantile(1.0) >= 0.05
+        assert monitor.stall_count == 0  # No watchdog without a threshold
+
+
+class TestWatchdog:
+    async def test_stall_logged_with_task_and_stack(self, metrics, caplog):
+        monitor = LoopMonitor(interval=0.01, block_threshold=0.05)
+        monitor.start()
+
+        async def temp_image_cleanup_loop():
+            await asyncio.sleep(0.02)
+            parse_state_file_slowly()
+
+        try:
+            await asyncio.create_task(temp_image_cleanup_loop(), name="cleanup")
+            await until(lambda: monitor.stalls and monitor.stalls[-1]["duration_ms"] is not None)
+        finally:
+            await monitor.stop()
+
+        stall = monitor.stalls[-1]
+        assert stall["culprit"] == (
+            "task cleanup (TestWatchdog.test_stall_logged_with_task_and_stack.<locals>.temp_image_cleanup_loop)"
+        )
+        assert "parse_state_file_slowly" in stall["stack"][-1]
+        assert stall["duration_ms"] >= 200
+        assert monitor.stall_count == 1
+        assert metrics.event_loop_blocked.value == 1
+        assert "Event loop blocked for over 50 ms" in caplog.text
+
+    async def test_quiet_loop_reports_no_stalls(self):
+        monitor = LoopMonitor(interval=0.01, block_threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.2)
+        await monitor.stop()
+
+        assert monitor.get_stats()["stalls"] == []
+
+
+class TestTaskLabels:
+    async def test_request_task_named_after_route(self):
+        seen = []
+
+        async def endpoint(scope, receive, send):
+            seen.append(describe_task(asyncio.current_task()))
+
+        middleware = TaskLabelMiddleware(endpoint)
+        await middleware({"type": "http", "method": "POST", "path": "/api/backup/export"}, None, None)
+        await middleware({"type": "websocket", "path": "/ws/panels"}, None, None)
+
+        assert seen == ["POST /api/backup/export", "WS /ws/panels"]
+        assert describe_task(None) == "event loop callback (no task)"
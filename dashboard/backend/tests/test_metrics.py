@@ -0,0 +1,129 @@
+"""Tests for metrics.py and the pipeline stages that record into it."""
+
+import asyncio
+import json
+
+import pytest
+
+from app import metrics as metrics_module
+from app.metrics import Histogram, PipelineMetrics
+from app.mqtt_hub import MQTTHub
+from app.panel_service import PanelService
+from app.websocket_manager import ConnectionManager
+
+from .test_mqtt_hub import drain, state_payload
+from .test_websocket_manager import make_panel
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """A fresh registry installed as the process-wide one."""
+    fresh = PipelineMetrics()
+    monkeypatch.setattr(metrics_module, "_metrics", fresh)
+    return fresh
+
+
+class TestHistogram:
+    def test_bucket_boundaries_are_inclusive(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 1, 3, 10, 11):
+            histogram.observe(value)
+
+        assert histogram.counts == [2, 1, 1, 1]
+        assert histogram.cumulative() == [2, 3, 4, 5]
+        assert histogram.sum == 25.5
+        assert histogram.quantile(0.5) == 5
+        assert histogram.quantile(0.99) is None  # Above the largest bound
+
+
+class TestExposition:
+    def test_prometheus_text(self, metrics):
+        metrics.mqtt_messages.labels("state", "primary").inc(3)
+        metrics.ws_batch_panels.observe(4)
+        metrics.ws_clients.collect = lambda: {("default",): 2}
+
+        text = metrics.render_prometheus()
+
+        assert "# TYPE tigo_mqtt_messages_total counter" in text
+        assert 'tigo_mqtt_messages_total{topic="state",system="primary"} 3' in text
+        assert 'tigo_ws_batch_panels_bucket{le="2"} 0' in text
+        assert 'tigo_ws_batch_panels_bucket{le="5"} 1' in text
+        assert 'tigo_ws_batch_panels_bucket{le="+Inf"} 1' in text
+        assert "tigo_ws_batch_panels_count 1" in text
+        assert 'tigo_ws_clients{site="default"} 2' in text
+
+    def test_json_rates_cover_time_since_previous_collection(self, metrics, monkeypatch):
+        clock = [100.0]
+        monkeypatch.setattr(metrics_module.time, "monotonic", lambda: clock[0])
+        metrics.started = clock[0]
+        counter = metrics.mqtt_messages.labels("state", "primary")
+
+        counter.inc(10)
+        clock[0] += 2
+        first = metrics.to_dict()["tigo_mqtt_messages_total"]["values"][0]
+        counter.inc(40)
+        clock[0] += 4
+        second = metrics.to_dict()["tigo_mqtt_messages_total"]["values"][0]
+
+        assert first["per_second"] == 5.0
+        assert second == {
+            "labels": {"topic": "state", "system": "primary"},
+            "value": 50,
+            "per_second": 10.0,
+        }
+        json.dumps(metrics.to_dict())
+
+
+class TestRecording:
+    async def test_hub_counts_messages_per_topic_and_system(self, metrics):
+        hub = MQTTHub("broker.local")
+
+        async def consume(payload, system):
+            pass
+
+        await hub.add_consumer("+/state", consume)
+        await hub.add_consumer("+/temp_nodes", consume)
+        hub.enqueue("taptap/primary/state", state_payload(2))
+        hub.enqueue("taptap/primary/state", state_payload(2))
+        hub.enqueue("taptap/secondary/temp_nodes", b"[1, 2]")
+        hub.enqueue("taptap/secondary/state", b"not json")
+        await drain(hub)
+
+        counts = {labels: child.value for labels, child in metrics.mqtt_messages.children.items()}
+        assert counts == {
+            ("state", "primary"): 2,
+            ("temp_nodes", "secondary"): 1,
+            ("state", "secondary"): 1,
+        }
+        # The first primary state was coalesced into the second before decoding
+        assert metrics.mqtt_decode_seconds.count == 2
+        assert metrics.mqtt_decode_errors.value == 1
+
+    def test_apply_state_times_each_update(self, metrics, tmp_path):
+        service = PanelService(
+            config_path=str(tmp_path / "panel_mapping.json"), yaml_path=str(tmp_path / "panels.yaml")
+        )
+
+        service.apply_state({
+            "A1": {"node_serial": "4-UNKNOWN1", "power": 100.0},
+            "A2": {"node_serial": "4-UNKNOWN2", "power": 100.0},
+            "bad": "not a node",
+        })
+
+        assert metrics.panel_update_seconds.count == 2
+
+    async def test_batch_loop_records_batch_size_and_duration(self, metrics):
+        manager = ConnectionManager(batch_interval_ms=10)
+        manager.start_background_tasks()
+        try:
+            await manager.queue_update([make_panel("A1"), make_panel("A2"), make_panel("A1")])
+            for _ in range(100):
+                if metrics.ws_batch_panels.count:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await manager.stop_background_tasks()
+
+        assert metrics.ws_batch_panels.count == 1
+        assert metrics.ws_batch_panels.sum == 2
+        assert metrics.ws_broadcast_seconds.count == 1
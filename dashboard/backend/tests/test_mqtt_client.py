@@ -0,0 +1,73 @@
+"""Tests for mqtt_client.py message processing."""
+
+from app.mqtt_client import MQTTClient
+from app.mqtt_hub import MQTTHub
+
+
+def make_state_payload(count: int) -> dict:
+    return {
+        "nodes": {
+            f"A{i}": {
+                "node_serial": f"4-SN{i:04d}",
+                "node_id": str(i),
+                "power": 300.0 + i,
+                "voltage_in": 40.0,
+                "state_online": "online",
+                "timestamp": "2026-01-01T12:00:00",
+            }
+            for i in range(count)
+        }
+    }
+
+
+class TestStateProcessing:
+    async def test_state_payload_delivered_in_one_batch_call(self):
+        calls = []
+
+        async def on_state(nodes, source_system):
+            calls.append((nodes, source_system))
+
+        client = MQTTClient(on_state=on_state)
+        await client._process_message(make_state_payload(50), "primary")
+
+        assert len(calls) == 1
+        nodes, source_system = calls[0]
+        assert len(nodes) == 50
+        assert source_system == "primary"
+
+    async def test_legacy_per_node_callback_still_supported(self):
+        messages = []
+
+        async def on_message(data):
+            messages.append(data)
+
+        client = MQTTClient(on_message=on_message)
+        await client._process_message(make_state_payload(3), "secondary")
+
+        assert [m["node_serial"] for m in messages] == ["4-SN0000", "4-SN0001", "4-SN0002"]
+        assert all(m["source_system"] == "secondary" for m in messages)
+
+    async def test_invalid_nodes_payload_is_ignored(self):
+        calls = []
+
+        async def on_state(nodes, source_system):
+            calls.append(nodes)
+
+        client = MQTTClient(on_state=on_state)
+        await client._process_message({"nodes": ["not", "a", "dict"]}, "primary")
+
+        assert calls == []
+
+
+
+class TestHubRegistration:
+    async def test_start_registers_handlers_and_stop_removes_them(self):
+        hub = MQTTHub("broker")
+        client = MQTTClient(on_state=lambda nodes, system: None, hub=hub)
+
+        await client.start()
+        assert hub.router.subscriptions() == ["taptap/+/state", "taptap/+/temp_nodes", "taptap/+/node_mappings"]
+        assert hub.get_stats()["consumers"] == {"+/state": 1, "+/temp_nodes": 1, "+/node_mappings": 1}
+
+        await client.stop()
+        assert set(hub.get_stats()["consumers"].values()) == {0}
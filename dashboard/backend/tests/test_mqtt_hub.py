@@ -0,0 +1,219 @@
+"""Tests for mqtt_hub.py: ingest queue, single decode and consumer fan-out."""
+
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from app.discovery_service import DiscoveryService
+from app.mqtt_client import MQTTClient
+from app.mqtt_hub import MQTTHub
+
+
+def state_payload(count: int) -> bytes:
+    return json.dumps({
+        "nodes": {f"A{i}": {"node_serial": f"4-SN{i:04d}", "power": 300.0 + i} for i in range(count)}
+    }).encode()
+
+
+async def drain(hub: MQTTHub) -> None:
+    """Process everything waiting in the ingest lanes, lane by lane."""
+    for lane in hub.lanes.values():
+        while len(lane.queue):
+            _, item = await lane.queue.get()
+            await hub._handle_message(item)
+
+
+@pytest.fixture
+def hub():
+    return MQTTHub("broker.local", port=1883, topic_prefix="taptap")
+
+
+class TestIngestQueue:
+    async def test_newer_state_replaces_unprocessed_one(self, hub):
+        calls = []
+
+        async def on_state(payload, system):
+            calls.append((len(payload["nodes"]), system))
+
+        await hub.add_consumer("+/state", on_state)
+        hub.enqueue("taptap/primary/state", state_payload(1))
+        hub.enqueue("taptap/secondary/state", state_payload(2))
+        hub.enqueue("taptap/primary/state", state_payload(3))
+
+        assert hub.pending() == 2
+        assert list(hub.lanes) == ["primary", "secondary"]
+        await drain(hub)
+
+        # The replacement keeps the original position in line
+        assert calls == [(3, "primary"), (2, "secondary")]
+        stats = hub.get_stats()
+        assert stats["coalesced"] == 1
+        assert stats["received"] == 3
+        assert stats["lanes"]["primary"]["queue_wait"]["count"] == 1
+
+    async def test_full_lane_drops_oldest_and_ignores_unknown_topics(self):
+        hub = MQTTHub("broker.local", queue_size=2)
+        for kind in ("state", "temp_nodes", "node_mappings"):
+            await hub.add_consumer(f"+/{kind}", lambda payload, system: None)
+            hub.enqueue(f"taptap/a/{kind}", b"{}")
+        hub.enqueue("taptap/b/state", b"{}")
+        hub.enqueue("taptap/a/status", b"{}")
+
+        assert list(hub.lanes["a"].queue._items) == ["taptap/a/temp_nodes", "taptap/a/node_mappings"]
+        assert len(hub.lanes["b"].queue) == 1
+        stats = hub.get_stats()
+        assert stats["dropped"] == 1
+        assert stats["ignored"] == 1
+
+    async def test_worker_processes_queue_in_background(self, hub):
+        processed = asyncio.Event()
+
+        async def on_temp_nodes(system, node_ids):
+            assert (system, node_ids) == ("primary", [42])
+            processed.set()
+
+        await MQTTClient(on_temp_nodes=on_temp_nodes, hub=hub).start()
+        await hub.start(connect=False)
+        try:
+            hub.enqueue("taptap/primary/temp_nodes", b"[42]")
+            await asyncio.wait_for(processed.wait(), timeout=1)
+        finally:
+            await hub.stop()
+
+        assert hub.get_stats()["process"]["count"] == 1
+
+
+class TestLanes:
+    async def test_backlog_on_one_system_does_not_delay_another(self, hub):
+        done = []
+
+        async def slow(payload, system):
+            await asyncio.sleep(0.05)
+            done.append(system)
+
+        for kind in ("state", "temp_nodes", "node_mappings"):
+            await hub.add_consumer(f"+/{kind}", slow)
+            hub.enqueue(f"taptap/primary/{kind}", b"{}")
+        hub.enqueue("taptap/secondary/state", b"{}")
+
+        await hub.start(connect=False)
+        try:
+            await asyncio.wait_for(_until(lambda: "secondary" in done), timeout=1)
+            # Secondary finished alongside primary's first message, not after its backlog
+            assert done.count("primary") <= 1
+            await asyncio.wait_for(_until(lambda: len(done) == 4), timeout=1)
+        finally:
+            await hub.stop()
+
+        lanes = hub.get_stats()["lanes"]
+        assert lanes["primary"]["process"]["count"] == 3
+        assert lanes["secondary"]["process"]["count"] == 1
+
+    async def test_idle_lane_is_retired_and_recreated(self):
+        hub = MQTTHub("broker.local", lane_idle_seconds=0.05)
+        await hub.add_consumer("+/state", lambda payload, system: asyncio.sleep(0))
+        await hub.start(connect=False)
+        try:
+            hub.enqueue("taptap/cca3/state", b"{}")
+            await asyncio.wait_for(_until(lambda: not hub.lanes), timeout=1)
+
+            stats = hub.get_stats()
+            assert stats["lanes_retired"] == 1
+            assert stats["received"] == 1
+
+            hub.enqueue("taptap/cca3/state", b"{}")
+            assert hub.lanes["cca3"].running
+        finally:
+            await hub.stop()
+
+
+async def _until(predicate) -> None:
+    while not predicate():
+        await asyncio.sleep(0.005)
+
+
+class TestFanOut:
+    async def test_each_message_decoded_once_for_all_consumers(self, hub):
+        decodes = []
+        decode = hub.router.decode
+        hub.router.decode = lambda data: decodes.append(data) or decode(data)
+        received = []
+
+        async def live(payload, system):
+            received.append(("live", system))
+
+        async def discovery(payload, system):
+            received.append(("discovery", system))
+
+        await hub.add_consumer("+/state", live)
+        await hub.add_consumer("+/state", discovery)
+        hub.enqueue("taptap/primary/state", state_payload(1))
+        await drain(hub)
+
+        assert len(decodes) == 1
+        assert received == [("live", "primary"), ("discovery", "primary")]
+        assert hub.router.subscriptions() == ["taptap/+/state"]
+
+    async def test_failing_consumer_does_not_block_others(self, hub):
+        received = []
+
+        async def broken(payload, system):
+            raise RuntimeError("boom")
+
+        async def healthy(payload, system):
+            received.append(system)
+
+        await hub.add_consumer("+/state", broken)
+        await hub.add_consumer("+/state", healthy)
+        hub.enqueue("taptap/primary/state", b"{}")
+        await drain(hub)
+
+        assert received == ["primary"]
+
+    def test_serves_matches_broker_identity(self, hub):
+        assert hub.serves("Broker.Local", 1883, None, "taptap/")
+        assert not hub.serves("other", 1883, None, "taptap")
+        assert not hub.serves("broker.local", 8883, None, "taptap")
+        assert not hub.serves("broker.local", 1883, "wizard", "taptap")
+
+
+class TestDiscoveryOnHub:
+    async def test_discovery_shares_running_hub_for_same_broker(self, hub):
+        await hub.start(connect=False)
+        hub.connected = True
+        service = DiscoveryService()
+        events = []
+
+        async def on_event(event):
+            events.append(event["type"])
+
+        service.subscribe(on_event)
+        try:
+            with patch("app.discovery_service.get_mqtt_hub", return_value=hub):
+                await service.start_discovery("broker.local", 1883, topic_prefix="taptap")
+
+            assert service._mqtt_task is None
+            hub.enqueue("taptap/primary/state", state_payload(2))
+            await asyncio.wait_for(_until(lambda: service.discovered_count == 2), timeout=1)
+            assert events == ["connection_status", "panel_discovered", "panel_discovered"]
+
+            await service.stop_discovery()
+            assert hub.get_stats()["consumers"] == {"+/state": 0}
+            assert hub.connection_listeners == []
+        finally:
+            await hub.stop()
+
+    async def test_discovery_opens_own_connection_for_other_broker(self, hub):
+        hub._running = True
+        service = DiscoveryService()
+
+        with patch("app.discovery_service.get_mqtt_hub", return_value=hub), \
+                patch.object(DiscoveryService, "_discovery_loop", return_value=None) as loop:
+            await service.start_discovery("wizard-broker", 1883, topic_prefix="taptap")
+            await service.stop_discovery()
+
+        loop.assert_called_once()
+        assert service._hub is None
+        assert hub.get_stats()["consumers"] == {}
@@ -0,0 +1,85 @@
+"""Tests for mqtt_router.py topic matching and payload decoding."""
+
+import json
+
+from app import json_codec
+from app.discovery_service import DiscoveryService
+from app.mqtt_router import TopicRouter
+
+
+def make_router(calls: list, **kwargs) -> TopicRouter:
+    async def on_state(payload, system):
+        calls.append(("state", system, payload))
+
+    async def on_mappings(payload, system):
+        calls.append(("node_mappings", system, payload))
+
+    router = TopicRouter("taptap", **kwargs)
+    router.add("+/state", on_state)
+    router.add("+/node_mappings", on_mappings)
+    return router
+
+
+class TestTopicRouter:
+    async def test_routes_by_pattern_and_passes_wildcards(self):
+        calls = []
+        router = make_router(calls)
+
+        assert await router.dispatch("taptap/primary/state", b'{"nodes": {}}') is True
+        assert await router.dispatch("taptap/secondary/node_mappings", '{"42": "4-X"}') is True
+
+        assert calls == [
+            ("state", "primary", {"nodes": {}}),
+            ("node_mappings", "secondary", {"42": "4-X"}),
+        ]
+        assert router.subscriptions() == ["taptap/+/state", "taptap/+/node_mappings"]
+
+    async def test_unmatched_topics_are_not_delivered(self):
+        calls = []
+        router = make_router(calls)
+
+        for topic in ("other/primary/state", "taptap/primary/state/extra", "taptap/state", "taptap/a/b/state"):
+            assert await router.dispatch(topic, b"{}") is False
+        assert calls == []
+
+    async def test_prefix_is_matched_literally(self):
+        calls = []
+        router = make_router(calls)
+
+        assert router.match("taptapXprimary/state") is None
+        assert router.match("taptap/primary/state").params == ("primary",)
+
+    async def test_invalid_payload_is_dropped(self):
+        calls = []
+        router = make_router(calls)
+
+        assert await router.dispatch("taptap/primary/state", b"{not json") is False
+        assert calls == []
+
+    async def test_pluggable_decoder(self):
+        calls = []
+        decoded = []
+
+        def decoder(data):
+            decoded.append(data)
+            return json.loads(data)
+
+        router = make_router(calls, decoder=decoder)
+        await router.dispatch("taptap/primary/state", b'{"nodes": {}}')
+
+        assert decoded == [b'{"nodes": {}}']
+        assert json_codec.get_decoder("json") is json.loads
+        assert json_codec.get_decoder("missing") is json.loads
+
+
+class TestDiscoveryRouting:
+    async def test_state_message_discovers_panels(self):
+        service = DiscoveryService()
+        router = TopicRouter("taptap")
+        router.add("+/state", service._process_state_message)
+        payload = {"nodes": {"A1": {"node_serial": "4-C3F23CR", "power": 385.0, "voltage_in": 42.5}}}
+
+        await router.dispatch("taptap/primary/state", json.dumps(payload).encode())
+
+        panel = service.discovered_panels["4-C3F23CR"]
+        assert (panel.cca, panel.tigo_label, panel.watts) == ("primary", "A1", 385.0)
@@ -134,3 +134,146 @@ class TestPanelService:
             assert panel.voltage_in is not None
             assert 40 <= panel.voltage_in <= 50  # ~42-48 base ±3%
             assert panel.online is True
+
+    def test_get_changed_panels_returns_only_updated(self, valid_panel_mapping):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            json.dump(valid_panel_mapping, f)
+            config_path = f.name
+
+        service = PanelService(config_path=config_path)
+        service.load_config()
+
+        # Initial load requires a full snapshot
+        changed, resync = service.get_changed_panels()
+        assert resync is True
+        assert changed == []
+
+        service.update_panel(sn="4-C3F2ACK", watts=300.0, voltage_in=41.0)
+        changed, resync = service.get_changed_panels()
+        assert resync is False
+        assert [p.display_label for p in changed] == ["A2"]
+
+        # Changes are drained after being collected
+        changed, resync = service.get_changed_panels()
+        assert changed == []
+        assert resync is False
+
+    def test_staleness_flip_marks_panel_changed(self, valid_panel_mapping):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            json.dump(valid_panel_mapping, f)
+            config_path = f.name
+
+        service = PanelService(config_path=config_path)
+        service.load_config()
+        service.update_panel(sn="4-C3F23CR", watts=385.0, voltage_in=42.5)
+        service.get_changed_panels()
+
+        settings = get_settings()
+        later = datetime.now(timezone.utc) + timedelta(seconds=settings.staleness_threshold_seconds + 1)
+
+        assert service.expire_stale(now=later) == ["A1"]
+        changed, _ = service.get_changed_panels()
+        assert [p.display_label for p in changed] == ["A1"]
+        assert changed[0].stale is True
+
+    def test_expire_stale_only_flips_due_panels(self, valid_panel_mapping):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            json.dump(valid_panel_mapping, f)
+            config_path = f.name
+
+        service = PanelService(config_path=config_path)
+        service.load_config()
+        threshold = get_settings().staleness_threshold_seconds
+        start = datetime.now(timezone.utc)
+        service.update_panel(sn="4-C3F23CR", watts=385.0, voltage_in=42.5, received_at=start)
+        service.update_panel(sn="4-C3F2ACK", watts=300.0, voltage_in=41.0, received_at=start)
+
+        # A2 reports again halfway through, pushing its deadline out
+        halfway = start + timedelta(seconds=threshold / 2)
+        service.update_panel(sn="4-C3F2ACK", watts=310.0, voltage_in=41.0, received_at=halfway)
+
+        assert service.expire_stale(now=start + timedelta(seconds=threshold - 1)) == []
+        assert service.expire_stale(now=start + timedelta(seconds=threshold + 1)) == ["A1"]
+        assert service.panel_state["A2"].stale is False
+        assert service.expire_stale(now=halfway + timedelta(seconds=threshold + 1)) == ["A2"]
+        assert service._stale_heap == []
+
+        # A fresh reading clears the flag and schedules a new deadline
+        service.update_panel(sn="4-C3F23CR", watts=390.0, voltage_in=42.5)
+        assert service.panel_state["A1"].stale is False
+        assert 0 < service.seconds_until_next_stale() <= threshold
+
+    def test_apply_state_updates_all_nodes_in_one_call(self, valid_panel_mapping):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            json.dump(valid_panel_mapping, f)
+            config_path = f.name
+
+        service = PanelService(config_path=config_path)
+        service.load_config()
+        service.get_changed_panels()
+
+        nodes = {
+            "A1": {"node_serial": "4-C3F23CR", "power": 385.0, "voltage_in": 42.5, "node_id": "12"},
+            "A2": {"node_serial": "4-C3F2ACK", "power": 120.0, "state_online": "offline"},
+            "X9": {"node_serial": "unknown-sn", "power": 10.0},
+            "bad": "not a dict",
+        }
+        updated = service.apply_state(nodes, source_system="primary")
+
+        assert updated == 2
+        assert service.panel_state["A1"].watts == 385.0
+        assert service.panel_state["A1"].node_id == "12"
+        assert service.panel_state["A1"].actual_system == "primary"
+        assert service.panel_state["A2"].online is False
+        # Both nodes share one receive timestamp
+        assert service.last_update["A1"] == service.last_update["A2"]
+
+        changed, _ = service.get_changed_panels()
+        assert sorted(p.display_label for p in changed) == ["A1", "A2"]
+
+    def test_update_mutates_record_in_place(self, valid_panel_mapping):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            json.dump(valid_panel_mapping, f)
+            config_path = f.name
+
+        service = PanelService(config_path=config_path)
+        service.load_config()
+        record = service.panel_state["A1"]
+
+        service.update_panel(sn="4-C3F23CR", watts=385, voltage_in="42.5", node_id=7)
+        service.update_panel(sn="4-C3F23CR", watts="garbage", voltage_in=41.0)
+
+        assert service.panel_state["A1"] is record
+        assert record.watts is None
+        assert record.voltage_in == 41.0
+        assert record.node_id == "7"
+
+    def test_readings_preserved_across_reload(self, valid_panel_mapping):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
+            json.dump(valid_panel_mapping, f)
+            config_path = f.name
+
+        service = PanelService(config_path=config_path)
+        service.load_config()
+        service.update_panel(sn="4-C3F23CR", watts=385.0, voltage_in=42.5, actual_system="primary")
+
+        service.load_config()
+
+        panel = next(p for p in service.get_all_panels() if p.display_label == "A1")
+        assert panel.watts == 385.0
+        assert panel.actual_system == "primary"
+        dumped = panel.model_dump(mode='json', by_alias=True)
+        assert dumped["voltage"] == 42.5
+        assert dumped["position"] == {"x_percent": 15.5, "y_percent": 23.2}
+
+    def test_get_all_panels_does_not_touch_config_file(self, valid_panel_mapping, tmp_path):
+        config_path = tmp_path / "panel_mapping.json"
+        config_path.write_text(json.dumps(valid_panel_mapping))
+
+        service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+        service.load_config()
+        config_path.unlink()
+
+        # Reload detection lives in ConfigWatcher, not on the read path
+        assert len(service.get_all_panels()) == 2
+        assert service.detect_config_change() == "clear"
@@ -0,0 +1,115 @@
+"""Tests for profiler.py CPU profiles and allocation snapshots."""
+
+import asyncio
+import marshal
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.profiler import Profiler, ProfilerBusyError
+
+
+def busy_work(deadline: float) -> int:
+    total = 0
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        total += sum(range(200))
+    return total
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler(max_snapshots=3)
+    yield profiler
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+class TestCpuProfile:
+    async def test_sample_mode_sees_event_loop_work(self, profiler):
+        async def work():
+            await asyncio.sleep(0.01)
+            busy_work(asyncio.get_running_loop().time() + 0.15)
+
+        task = asyncio.create_task(work())
+        data = await profiler.profile_cpu(0.3, mode="sample", interval=0.002)
+        await task
+
+        lines = data.decode().splitlines()
+        assert lines
+        assert any("test_profiler:busy_work" in line for line in lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) >= 1 and ";" in stack
+
+    async def test_cprofile_mode_returns_pstats(self, profiler):
+        async def work():
+            await asyncio.sleep(0.01)
+            busy_work(asyncio.get_running_loop().time() + 0.02)
+
+        task = asyncio.create_task(work())
+        data = await profiler.profile_cpu(0.1, mode="cprofile")
+        await task
+
+        stats = marshal.loads(data)
+        assert any(name == "busy_work" for (_, _, name) in stats)
+
+    async def test_concurrent_profiles_rejected(self, profiler):
+        first = asyncio.create_task(profiler.profile_cpu(0.1))
+        await asyncio.sleep(0)
+
+        with pytest.raises(ProfilerBusyError):
+            await profiler.profile_cpu(0.1)
+        with pytest.raises(ProfilerBusyError):
+            await profiler.take_snapshot()
+        await first
+        assert not profiler.busy
+
+
+class TestAllocationSnapshots:
+    async def test_diff_shows_growth_and_watched_sizes(self, profiler):
+        leak: dict[str, bytearray] = {}
+        profiler.watch("leak", lambda: leak)
+
+        first = await profiler.take_snapshot()
+        for i in range(2000):
+            leak[f"serial-{i}"] = bytearray(100)
+        second = await profiler.take_snapshot()
+        diff = await profiler.diff()
+
+        assert first["tracemalloc_started"] and not second["tracemalloc_started"]
+        assert (diff["base"]["id"], diff["current"]["id"]) == (first["id"], second["id"])
+        assert diff["watched"]["leak"]["base"]["items"] == 0
+        assert diff["watched"]["leak"]["current"]["items"] == 2000
+        assert diff["size_diff_bytes"] > 200_000
+        assert "test_profiler.py" in diff["top"][0]["site"][-1]
+
+    async def test_old_snapshots_are_dropped(self, profiler):
+        for _ in range(4):
+            await profiler.take_snapshot()
+
+        assert list(profiler.snapshots) == [2, 3, 4]
+        with pytest.raises(KeyError):
+            await profiler.diff(base_id=1)
+        assert profiler.stop_tracemalloc()
+        assert not tracemalloc.is_tracing() and not profiler.snapshots
+
+
+class TestDebugRouter:
+    def test_profile_download_and_busy_conflict(self, profiler):
+        with patch("app.debug_router.get_profiler", return_value=profiler):
+            client = TestClient(app)
+            response = client.post("/api/debug/profile", params={"seconds": 0.05})
+            assert response.status_code == 200
+            assert response.headers["content-disposition"].endswith('.collapsed.txt"')
+
+            profiler._busy = True
+            response = client.post("/api/debug/tracemalloc/snapshot")
+            assert response.status_code == 409
+            assert response.json()["detail"]["error"] == "profiler_busy"
+            profiler._busy = False
+
+            assert client.get("/api/debug/tracemalloc/diff").status_code == 404
+            assert client.post("/api/debug/profile", params={"mode": "perf"}).status_code == 400
@@ -0,0 +1,181 @@
+"""Tests for rollups.py incremental aggregation and resolution selection."""
+
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.history_store import HistoryStore
+from app.main import app
+from app.panel_service import PanelService
+from app.rollups import DEFAULT_RETENTION_DAYS, RollupEngine, pick_resolution, string_key, system_key
+
+from .test_history_store import decode_columns
+
+DAY = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+def reading(watts: float) -> list:
+    return [watts, 41.0, None, None, None, None, None, None, None]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return RollupEngine(root=tmp_path / "rollups")
+
+
+class TestRollupEngine:
+    def test_bucket_tracks_min_max_mean_last(self, engine):
+        for seconds, watts in ((0, 100.0), (20, 300.0), (40, 200.0)):
+            engine.add(["A1"], (DAY + timedelta(seconds=seconds)).timestamp(), reading(watts))
+
+        # Still open: served from memory
+        columns = engine.query("A1", "1m", DAY, DAY + timedelta(minutes=1), ["watts"])
+        assert columns["t"].tolist() == [int(DAY.timestamp())]
+        assert columns["watts_min"].tolist() == [100.0]
+        assert columns["watts_max"].tolist() == [300.0]
+        assert columns["watts_mean"].tolist() == [200.0]
+        assert columns["watts_last"].tolist() == [200.0]
+
+    def test_bucket_persisted_when_next_bucket_starts(self, engine):
+        engine.add(["A1"], DAY.timestamp(), reading(100.0))
+        engine.add(["A1"], (DAY + timedelta(seconds=61)).timestamp(), reading(150.0))
+        engine.flush()
+
+        stored = engine.stores["1m"].query("A1", DAY, DAY + timedelta(hours=1), ["watts_mean"])
+        assert stored["watts_mean"].tolist() == [100.0]
+        # Coarser resolutions keep folding both readings into one bucket
+        columns = engine.query("A1", "1h", DAY, DAY + timedelta(hours=1), ["watts"])
+        assert columns["watts_mean"].tolist() == [125.0]
+
+    def test_close_expired_writes_idle_buckets(self, engine):
+        engine.add(["A1"], DAY.timestamp(), reading(100.0))
+        engine.flush(now=(DAY + timedelta(minutes=5)).timestamp())
+
+        stored = engine.stores["1m"].query("A1", DAY, DAY + timedelta(hours=1), ["watts_last"])
+        assert stored["watts_last"].tolist() == [100.0]
+        assert engine.stores["15m"].query("A1", DAY, DAY + timedelta(hours=1), ["watts_last"])["t"].tolist() == []
+
+    def test_string_and_system_series_sample_group_totals(self, engine, tmp_path, valid_panel_mapping):
+        config_path = tmp_path / "panel_mapping.json"
+        config_path.write_text(json.dumps(valid_panel_mapping))
+        service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+        service.load_config()
+        service.reading_listeners.append(engine.record_panel)
+
+        service.update_panel(sn="4-C3F23CR", watts=300.0, voltage_in=42.0, received_at=DAY)
+        service.update_panel(sn="4-C3F2ACK", watts=100.0, voltage_in=40.0, received_at=DAY)
+        # Panel readings alone do not touch the group series
+        assert engine.query(string_key("A"), "15m", DAY, DAY + timedelta(minutes=15))["t"].tolist() == []
+
+        assert engine.record_groups(service.aggregates, DAY.timestamp()) == 2
+        later = DAY + timedelta(seconds=10)
+        service.update_panel(sn="4-C3F23CR", watts=200.0, voltage_in=42.0, received_at=later)
+        engine.record_groups(service.aggregates, later.timestamp())
+
+        # Buckets hold string power (A1 + A2) per sample, not single panel readings
+        columns = engine.query(string_key("A"), "15m", DAY, DAY + timedelta(minutes=15), ["watts"])
+        assert columns["watts_min"].tolist() == [300.0]
+        assert columns["watts_max"].tolist() == [400.0]
+        assert columns["watts_mean"].tolist() == [350.0]
+        assert columns["watts_last"].tolist() == [300.0]
+        system = engine.query(system_key("primary"), "1d", DAY, DAY + timedelta(days=1), ["voltage_in"])
+        assert system["voltage_in_mean"].tolist() == [41.0]
+        panel = engine.query("A1", "1m", DAY, DAY + timedelta(minutes=1), ["watts"])
+        assert panel["watts_max"].tolist() == [300.0]
+
+    def test_groups_without_readings_are_not_sampled(self, engine, tmp_path, valid_panel_mapping):
+        config_path = tmp_path / "panel_mapping.json"
+        config_path.write_text(json.dumps(valid_panel_mapping))
+        service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+        service.load_config()
+
+        assert engine.record_groups(service.aggregates, DAY.timestamp()) == 0
+
+    def test_retention_is_per_resolution(self, tmp_path):
+        engine = RollupEngine(root=tmp_path / "rollups", retention_days={"1m": 2})
+        old = DAY - timedelta(days=5)
+        engine.add(["A1"], old.timestamp(), reading(100.0))
+        engine.close_all()
+
+        assert engine.stores["1m"].retention_days == 2
+        assert engine.stores["1h"].retention_days == DEFAULT_RETENTION_DAYS["1h"]
+        engine.prune(DAY.date())
+        assert engine.query("A1", "1m", old, old + timedelta(minutes=1))["t"].tolist() == []
+        assert len(engine.query("A1", "1h", old, old + timedelta(hours=1))["t"]) == 1
+
+    def test_bucket_split_by_restart_is_merged(self, engine):
+        engine.add(["A1"], DAY.timestamp(), reading(100.0))
+        engine.close_all()
+        engine.add(["A1"], (DAY + timedelta(seconds=30)).timestamp(), reading(300.0))
+        engine.close_all()
+
+        columns = engine.query("A1", "1m", DAY, DAY + timedelta(minutes=1), ["watts"])
+        assert columns["t"].tolist() == [int(DAY.timestamp())]
+        assert columns["watts_min"].tolist() == [100.0]
+        assert columns["watts_max"].tolist() == [300.0]
+        assert columns["watts_last"].tolist() == [300.0]
+
+
+class TestPickResolution:
+    @pytest.mark.parametrize("window,max_points,expected", [
+        (timedelta(hours=1), 500, "raw"),
+        (timedelta(hours=24), 1500, "1m"),
+        (timedelta(days=7), 1000, "15m"),
+        (timedelta(days=30), 1000, "1h"),
+        (timedelta(days=365), 400, "1d"),
+        (timedelta(days=365), 10, "1d"),
+    ])
+    def test_finest_resolution_within_budget(self, window, max_points, expected):
+        assert pick_resolution(DAY, DAY + window, max_points, raw_interval=10) == expected
+
+
+class TestRollupRouter:
+    @pytest.fixture
+    def client(self, engine, tmp_path, valid_panel_mapping):
+        config_path = tmp_path / "panel_mapping.json"
+        config_path.write_text(json.dumps(valid_panel_mapping))
+        service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+        service.load_config()
+        service.reading_listeners.append(engine.record_panel)
+        for hour in range(48):
+            at = DAY + timedelta(hours=hour)
+            service.update_panel(sn="4-C3F23CR", watts=100.0 + hour, voltage_in=42.0, received_at=at)
+            engine.record_groups(service.aggregates, at.timestamp())
+        engine.flush()
+
+        with patch("app.history_router.get_rollup_engine", return_value=engine), \
+                patch("app.history_router.get_history_store", return_value=HistoryStore(root=tmp_path / "h")), \
+                patch("app.history_router.get_panel_service", return_value=service):
+            yield TestClient(app)
+
+    def test_max_points_selects_rollup(self, client):
+        response = client.get("/api/history/A1", params={
+            "start": DAY.isoformat(), "end": (DAY + timedelta(days=2)).isoformat(),
+            "fields": "watts", "max_points": 100,
+        })
+        assert response.status_code == 200
+        body = response.json()
+        assert body["resolution"] == "1h"
+        columns = decode_columns({"t": body["t"], "watts_mean": body["watts_mean"]})
+        assert len(columns["t"]) == 48
+        assert columns["watts_mean"][:2] == [100.0, 101.0]
+
+    def test_string_rollup_includes_aggregate(self, client):
+        response = client.get("/api/history/string/A", params={
+            "start": DAY.isoformat(), "end": (DAY + timedelta(days=2)).isoformat(),
+            "fields": "watts", "resolution": "1d",
+        })
+        body = response.json()
+        assert decode_columns(body["aggregate"])["watts_max"] == [123.0, 147.0]
+        assert decode_columns(body["panels"]["A2"])["t"] == []
+
+    def test_system_history_and_unknown_resolution(self, client):
+        response = client.get("/api/history/system/primary", params={
+            "start": DAY.isoformat(), "end": (DAY + timedelta(days=1)).isoformat(),
+            "fields": "watts", "resolution": "1d",
+        })
+        assert decode_columns({"watts_min": response.json()["watts_min"]})["watts_min"] == [100.0]
+        assert client.get("/api/history/A1", params={"resolution": "5m"}).status_code == 400
@@ -0,0 +1,305 @@
+"""Tests for shared_state.py shared-memory panel state."""
+
+import json
+import multiprocessing
+import os
+import struct
+import time
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import history_router, main
+from app.panel_service import PanelService
+from app.shared_state import (
+    HEARTBEAT,
+    HEARTBEAT_OFFSET,
+    RECORD_LOCK,
+    RECORD_SIZE,
+    SharedPanelReader,
+    SharedPanelWriter,
+    _AGGREGATES_OFFSET,
+    _RECORDS_OFFSET,
+    _layout_offset,
+    elect_ingest_worker,
+    lock_path,
+)
+
+from .test_websocket_manager import make_panel
+
+
+@pytest.fixture
+def region():
+    name = f"tigo-test-{uuid.uuid4().hex[:8]}"
+    writer = SharedPanelWriter(name, capacity=8)
+    reader = SharedPanelReader(name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def _read_in_child(name, queue):
+    reader = SharedPanelReader(name)
+    queue.put([(p.display_label, p.watts) for p in reader.read_panels()])
+    reader.close()
+
+
+class TestRoundTrip:
+    def test_reader_sees_layout_with_every_field(self, region):
+        writer, reader = region
+        panel = make_panel("A1", watts=312.5)
+        panel.node_id = "42"
+        panel.stale = True
+        panel.last_update = datetime(2026, 6, 1, 12, 0, tzinfo=timezone.utc)
+        writer.write_layout([panel, make_panel("B1", watts=None)])
+
+        panels = reader.read_panels()
+
+        assert [p.model_dump() for p in panels[:1]] == [panel.model_dump()]
+        assert panels[1].watts is None
+
+    def test_long_and_non_ascii_strings_reach_readers_unchanged(self, region):
+        writer, reader = region
+        # Same first 32 bytes, and a multi-byte character across the old cut
+        prefix = "Südwest-Dach Reihe 3 Modul"
+        labels = [prefix + " Nummer 14", prefix + " Nummer 15", "ü" * 16 + "x"]
+        panels = [make_panel(label) for label in labels]
+        panels[0].sn = "SN-" + "9" * 40
+        panels[0].node_id = "ü" * 9
+        writer.write_layout(panels)
+
+        read = reader.read_panels()
+
+        assert [p.display_label for p in read] == labels
+        assert read[0].sn == panels[0].sn
+        # Reported node IDs that overflow their field are cut between characters
+        assert read[0].node_id == "ü" * 8
+        assert reader.poll() == ([], True)
+        writer.write_panels([make_panel(labels[1], watts=5.0)])
+        changed, _ = reader.poll()
+        assert [(p.display_label, p.watts) for p in changed] == [(labels[1], 5.0)]
+
+    def test_torn_layout_table_is_rejected(self, region):
+        writer, reader = region
+        writer.write_layout([make_panel("A1")])
+        writer.buf[_layout_offset(writer.capacity) + 3] ^= 0xFF
+
+        assert reader.read_panels() == []
+        assert reader.retries > 0
+
+    def test_poll_returns_only_changed_panels(self, region):
+        writer, reader = region
+        writer.write_layout([make_panel("A1"), make_panel("A2"), make_panel("B1")])
+        assert reader.poll() == ([], True)
+
+        writer.write_panels([make_panel("A2", watts=7.0)])
+        changed, resync = reader.poll()
+
+        assert [(p.display_label, p.watts) for p in changed] == [("A2", 7.0)]
+        assert not resync
+        assert reader.poll() == ([], False)
+
+    def test_layout_change_requests_resync(self, region):
+        writer, reader = region
+        writer.write_layout([make_panel("A1")])
+        reader.poll()
+
+        writer.write_layout([make_panel("A1"), make_panel("C1")])
+
+        assert reader.poll() == ([], True)
+        assert [p.display_label for p in reader.read_panels()] == ["A1", "C1"]
+
+    def test_aggregates_shared_once_per_change(self, region):
+        writer, reader = region
+        writer.write_aggregates({"strings": {"A": {"watts": 600.0}}})
+
+        assert reader.poll_aggregates() == {"strings": {"A": {"watts": 600.0}}}
+        assert reader.poll_aggregates() is None
+
+    def test_record_mid_write_is_not_returned(self, region):
+        writer, reader = region
+        writer.write_layout([make_panel("A1")])
+        # Leave the record's sequence lock odd, as if the writer were mid-update
+        seq = struct.unpack_from("<I", writer.buf, _RECORDS_OFFSET)[0]
+        struct.pack_into("<I", writer.buf, _RECORDS_OFFSET, seq + 1)
+
+        assert reader.read_panels() == []
+        assert reader.retries > 0
+
+    def test_torn_record_is_rejected_by_checksum(self, region):
+        writer, reader = region
+        writer.write_layout([make_panel("A1", watts=100.0), make_panel("A2")])
+        # An even sequence lock around a payload that does not match its
+        # checksum, as a reader on ARM64 can see while stores are reordered
+        offset = _RECORDS_OFFSET + RECORD_LOCK.size + 8
+        writer.buf[offset] ^= 0xFF
+
+        assert [p.display_label for p in reader.read_panels()] == ["A2"]
+        assert reader.retries > 0
+
+    def test_torn_aggregates_are_rejected_by_checksum(self, region):
+        writer, reader = region
+        writer.write_aggregates({"strings": {"A": {"watts": 600.0}}})
+        assert reader.read_aggregates() == {"strings": {"A": {"watts": 600.0}}}
+
+        writer.write_aggregates({"strings": {"A": {"watts": 700.0}}})
+        writer.buf[_AGGREGATES_OFFSET + 2] ^= 0xFF
+
+        assert reader.read_aggregates() == {"strings": {"A": {"watts": 600.0}}}
+        assert reader.retries > 0
+
+    def test_other_process_reads_region(self, region):
+        writer, _ = region
+        writer.write_layout([make_panel("A1", watts=99.0)])
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        child = context.Process(target=_read_in_child, args=(writer.name, queue))
+        child.start()
+        child.join(timeout=30)
+
+        assert queue.get(timeout=5) == [("A1", 99.0)]
+        # The child detaching must not remove the region
+        reader = SharedPanelReader(writer.name)
+        assert [p.watts for p in reader.read_panels()] == [99.0]
+        reader.close()
+
+
+class TestWriterLiveness:
+    def test_silent_writer_reported_stale(self, region):
+        writer, reader = region
+        assert reader.check_writer(stale_after=5.0) == "live"
+
+        HEARTBEAT.pack_into(writer.buf, HEARTBEAT_OFFSET, time.monotonic() - 10)
+        assert reader.check_writer(stale_after=5.0) == "stale"
+        assert not reader.get_stats()["writer_live"]
+
+        writer.beat()
+        assert reader.check_writer(stale_after=5.0) == "live"
+
+    def test_reader_follows_restarted_writer(self, region):
+        writer, reader = region
+        writer.write_layout([make_panel("A1")])
+        assert reader.poll() == ([], True)
+
+        writer.close()
+        restarted = SharedPanelWriter(writer.name, capacity=8)
+        try:
+            restarted.write_layout([make_panel("B1", watts=5.0)])
+            # The old region's heartbeat is as old as the writer that died
+            assert reader.check_writer(stale_after=0.0) == "replaced"
+
+            assert reader.poll() == ([], True)
+            assert [(p.display_label, p.watts) for p in reader.read_panels()] == [("B1", 5.0)]
+            assert reader.get_stats()["writer_pid"] == os.getpid()
+        finally:
+            reader.close()
+            restarted.close()
+
+
+class TestServingWorker:
+    async def test_takes_over_ingest_when_writer_is_gone(self, monkeypatch):
+        name = f"tigo-test-{uuid.uuid4().hex[:8]}"
+        writer = SharedPanelWriter(name, capacity=8)
+        reader = SharedPanelReader(name)
+        HEARTBEAT.pack_into(writer.buf, HEARTBEAT_OFFSET, time.monotonic() - 60)
+        entered = []
+
+        @asynccontextmanager
+        async def ingest_lifespan(lock):
+            entered.append(lock)
+            yield
+            lock.close()
+
+        monkeypatch.setattr(main.settings, "shared_state_name", name)
+        monkeypatch.setattr(main, "shared_reader", reader)
+        monkeypatch.setattr(main, "ingest_lifespan", ingest_lifespan)
+        monkeypatch.setattr(main.ws_manager, "snapshot_provider", reader.read_panels)
+        try:
+            async with AsyncExitStack() as takeover:
+                assert await main.check_shared_writer(takeover)
+                assert len(entered) == 1
+                assert main.shared_reader is None
+                assert main.ws_manager.snapshot_provider == main.panel_service.get_all_panels
+                assert history_router._panel_source is history_router.ingest_panels
+        finally:
+            main.ws_manager._pending_resync = False
+            writer.close()
+            os.remove(lock_path(name))
+
+    async def test_waits_while_writer_holds_the_lock(self, monkeypatch, region):
+        writer, reader = region
+        HEARTBEAT.pack_into(writer.buf, HEARTBEAT_OFFSET, time.monotonic() - 60)
+        lock = elect_ingest_worker(writer.name)
+        monkeypatch.setattr(main.settings, "shared_state_name", writer.name)
+        monkeypatch.setattr(main, "shared_reader", reader)
+        try:
+            assert not await main.check_shared_writer(AsyncExitStack())
+            assert main.shared_reader is reader
+        finally:
+            lock.close()
+            os.remove(lock_path(writer.name))
+
+    def test_health_and_reload_on_serving_worker(self, region):
+        _, reader = region
+        client = TestClient(main.app)
+        with patch("app.main.shared_reader", reader):
+            reader.writer_live = False
+            response = client.get("/health")
+            assert response.status_code == 503
+            assert response.json()["status"] == "unhealthy"
+
+            reader.writer_live = True
+            assert client.get("/health").status_code == 200
+
+            response = client.post("/api/reload")
+            assert response.status_code == 409
+            assert response.json()["detail"]["error"] == "not_ingest_instance"
+
+
+class TestIngestReload:
+    def test_reload_rewrites_shared_layout_before_one_snapshot(
+        self, monkeypatch, region, tmp_path, valid_panel_mapping
+    ):
+        writer, reader = region
+        config_path = tmp_path / "panel_mapping.json"
+        config_path.write_text(json.dumps(valid_panel_mapping))
+        service = PanelService(config_path=str(config_path), yaml_path=str(tmp_path / "panels.yaml"))
+        writer.write_layout([make_panel("Z9")])
+        queue_update = AsyncMock()
+        broadcast = AsyncMock()
+        monkeypatch.setattr(main, "panel_service", service)
+        monkeypatch.setattr(main, "shared_writer", writer)
+        monkeypatch.setattr(main.ws_manager, "queue_update", queue_update)
+        monkeypatch.setattr(main.ws_manager, "broadcast", broadcast)
+
+        response = TestClient(main.app).post("/api/reload")
+
+        assert response.json() == {"status": "reloaded", "panels": 2}
+        assert [p.display_label for p in reader.read_panels()] == ["A1", "A2"]
+        broadcast.assert_not_called()
+        queue_update.assert_awaited_once()
+        assert queue_update.await_args.kwargs["resync"] is True
+
+
+class TestElection:
+    def test_only_one_worker_wins(self):
+        name = f"tigo-test-{uuid.uuid4().hex[:8]}"
+        first = elect_ingest_worker(name)
+        try:
+            assert first is not None
+            assert elect_ingest_worker(name) is None
+        finally:
+            first.close()
+        second = elect_ingest_worker(name)
+        assert second is not None
+        second.close()
+        os.remove(lock_path(name))
+
+
+def test_record_layout_unchanged():
+    # Changing the record layout needs a new MAGIC so old readers refuse the region
+    assert RECORD_SIZE == 153
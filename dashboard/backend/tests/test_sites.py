@@ -0,0 +1,120 @@
+"""Tests for multi-site mode (sites.py)."""
+
+import asyncio
+import json
+
+import pytest
+
+from app.config import Settings
+from app.mqtt_hub import MQTTHub
+from app.sites import Site, SiteRegistry, deep_sizeof, parse_sites
+
+
+def write_site_config(config_dir, serials):
+    config_dir.mkdir(parents=True)
+    panels = [
+        {
+            "sn": sn,
+            "tigo_label": f"A{i}",
+            "display_label": f"A{i}",
+            "string": "A",
+            "system": "primary",
+            "position": {"x_percent": 10.0, "y_percent": 10.0},
+        }
+        for i, sn in enumerate(serials, start=1)
+    ]
+    (config_dir / "panel_mapping.json").write_text(json.dumps({"panels": panels, "translations": {}}))
+
+
+def state_payload(sn: str, power: float) -> bytes:
+    return json.dumps({
+        "nodes": {
+            "A1": {
+                "node_serial": sn,
+                "power": power,
+                "voltage_in": 40.0,
+                "state_online": "online",
+                "timestamp": "2026-01-01T12:00:00",
+            }
+        }
+    }).encode()
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return Settings(
+        use_mock_data=False,
+        sites="north,south:solar/south",
+        sites_config_dir=str(tmp_path),
+        config_watch_mode="poll",
+        history_enabled=False,
+    )
+
+
+class TestParseSites:
+    def test_default_prefix_is_nested_under_topic_prefix(self):
+        assert parse_sites("north, south:solar/south/", "taptap") == [
+            ("north", "taptap/north"),
+            ("south", "solar/south"),
+        ]
+
+    def test_empty_spec_means_no_sites(self):
+        assert parse_sites("", "taptap") == []
+
+    @pytest.mark.parametrize("spec", ["north,north", "no rth", "../etc"])
+    def test_invalid_or_duplicate_names_rejected(self, spec):
+        with pytest.raises(ValueError):
+            parse_sites(spec, "taptap")
+
+
+class TestSites:
+    async def test_messages_reach_only_their_sites_panels(self, settings, tmp_path):
+        # The same serial on both roofs must stay partitioned by topic prefix
+        write_site_config(tmp_path / "north", ["4-SHARED"])
+        write_site_config(tmp_path / "south", ["4-SHARED"])
+        hub = MQTTHub("broker.local")
+        registry = SiteRegistry()
+        registry.load(settings, hub=hub)
+        await registry.start()
+        await hub.start(connect=False)
+        try:
+            hub.enqueue("taptap/north/primary/state", state_payload("4-SHARED", 111.0))
+            hub.enqueue("solar/south/primary/state", state_payload("4-SHARED", 222.0))
+            while hub.pending() or any(lane.process_latency.count == 0 for lane in hub.lanes.values()):
+                await asyncio.sleep(0.005)
+        finally:
+            await hub.stop()
+            await registry.stop()
+
+        north = registry.get("north").panel_service.panel_state["A1"]
+        south = registry.get("south").panel_service.panel_state["A1"]
+        assert (north.watts, south.watts) == (111.0, 222.0)
+        assert set(hub.lanes) == {"taptap/north/primary", "solar/south/primary"}
+
+    async def test_stats_report_per_site_memory(self, settings, tmp_path):
+        write_site_config(tmp_path / "north", [f"4-N{i:04d}" for i in range(200)])
+        write_site_config(tmp_path / "south", ["4-S0001"])
+        registry = SiteRegistry()
+        registry.load(settings)
+        await registry.start()
+        try:
+            stats = registry.get_stats()
+        finally:
+            await registry.stop()
+
+        by_name = {s["name"]: s for s in stats["sites"]}
+        assert by_name["north"]["panels"] == 200
+        assert by_name["north"]["memory_bytes"]["panels"] > by_name["south"]["memory_bytes"]["panels"]
+        assert stats["memory_bytes_total"] == sum(s["memory_bytes"]["total"] for s in stats["sites"])
+
+    async def test_missing_config_dir_starts_empty(self, settings):
+        site = Site("empty", settings.sites_config_dir + "/empty", "taptap/empty", settings=settings)
+        await site.start()
+        await site.stop()
+        assert site.panel_service.panel_state == {}
+
+
+class TestDeepSizeof:
+    def test_shared_objects_counted_once(self):
+        shared = ["x" * 1000]
+        assert deep_sizeof([shared, shared]) < deep_sizeof([shared, ["x" * 1000]])
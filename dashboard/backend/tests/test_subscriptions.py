@@ -0,0 +1,173 @@
+"""Tests for subscriptions.py and subscribed clients on the WebSocket manager."""
+
+import json
+
+import pytest
+
+from app.models import PanelData, Position
+from app.subscriptions import PanelIndex, Subscription, parse_subscription
+from app.websocket_manager import ConnectionManager
+
+from .test_websocket_manager import FakeWebSocket
+
+
+def layout_panel(label: str, x: float, y: float, system: str = "primary", watts: float = 100.0) -> PanelData:
+    return PanelData(
+        display_label=label,
+        string=label[0],
+        system=system,
+        sn=f"SN-{label}",
+        watts=watts,
+        voltage_in=40.0,
+        position=Position(x_percent=x, y_percent=y),
+    )
+
+
+@pytest.fixture
+def layout():
+    return [
+        layout_panel("A1", 10.0, 10.0),
+        layout_panel("A2", 20.0, 10.0),
+        layout_panel("B1", 30.0, 50.0),
+        layout_panel("C1", 80.0, 80.0, system="secondary"),
+    ]
+
+
+@pytest.fixture
+async def manager(layout):
+    manager = ConnectionManager(snapshot_provider=lambda: layout)
+    yield manager
+    await manager.stop_background_tasks()
+
+
+async def subscribe(manager, ws, **criteria) -> None:
+    await manager.handle_client_message(ws, json.dumps({"type": "subscribe", **criteria}))
+
+
+class TestPanelIndex:
+    def test_criteria_are_unioned(self, layout):
+        index = PanelIndex(layout)
+        subscription = Subscription(
+            systems=frozenset({"secondary"}),
+            strings=frozenset({"B"}),
+            panels=frozenset({"A1", "Z9"}),
+        )
+
+        assert index.resolve(subscription) == {"A1", "B1", "C1"}
+
+    def test_viewport_edges_are_inclusive(self, layout):
+        index = PanelIndex(layout)
+
+        assert index.in_viewport(20.0, 30.0, 0.0, 50.0) == {"A2", "B1"}
+        assert index.in_viewport(0.0, 100.0, 60.0, 100.0) == {"C1"}
+        assert index.in_viewport(40.0, 70.0, 0.0, 100.0) == set()
+
+    def test_parse_rejects_malformed_criteria(self):
+        assert parse_subscription({"type": "subscribe"}) is None
+        assert parse_subscription({"strings": ["A"]}) == Subscription(strings=frozenset({"A"}))
+        with pytest.raises(ValueError):
+            parse_subscription({"systems": "primary"})
+        with pytest.raises(ValueError):
+            parse_subscription({"viewport": {"x_min": 0, "x_max": 10}})
+        with pytest.raises(ValueError):
+            parse_subscription({"viewport": {"x_min": 50, "x_max": 10, "y_min": 0, "y_max": 10}})
+
+
+class TestSubscribedClients:
+    async def test_subscriber_receives_only_matching_panels(self, manager, layout):
+        subscriber = FakeWebSocket()
+        everyone = FakeWebSocket()
+        await manager.connect(subscriber)
+        await manager.connect(everyone)
+
+        await subscribe(manager, subscriber, strings=["A"])
+        await manager.broadcast_delta([layout_panel("A1", 10.0, 10.0, watts=5.0), layout[2]])
+        await manager.broadcast_delta([layout[3]])
+        await manager.wait_until_drained()
+
+        snapshot, delta = subscriber.sent
+        assert snapshot["type"] == "snapshot"
+        assert [p["display_label"] for p in snapshot["panels"]] == ["A1", "A2"]
+        assert snapshot["subscription"]["strings"] == ["A"]
+        assert delta["type"] == "delta" and delta["seq"] == snapshot["seq"] + 1
+        assert [(p["display_label"], p["watts"]) for p in delta["changed"]] == [("A1", 5.0)]
+
+        assert [len(frame["changed"]) for frame in everyone.sent] == [2, 1]
+        assert "subscription" not in everyone.sent[0]
+
+    async def test_equal_subscriptions_share_one_encoded_frame(self, manager, layout):
+        clients = [FakeWebSocket() for _ in range(3)]
+        for ws in clients:
+            await manager.connect(ws)
+            await subscribe(manager, ws, viewport={"x_min": 0, "x_max": 25, "y_min": 0, "y_max": 25})
+
+        await manager.broadcast_delta(layout)
+        await manager.wait_until_drained()
+
+        assert len(manager._groups) == 1
+        assert clients[0].raw[-1] == clients[1].raw[-1] == clients[2].raw[-1]
+        assert [p["display_label"] for p in clients[0].sent[-1]["changed"]] == ["A1", "A2"]
+
+    async def test_aggregates_filtered_to_subscribed_groups(self, manager, layout):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+        await subscribe(manager, ws, panels=["C1"])
+
+        await manager.broadcast_delta(
+            [], {"strings": {"A": {"watts": 1.0}, "C": {"watts": 2.0}}, "systems": {"primary": {"watts": 1.0}}}
+        )
+        await manager.broadcast_delta([], {"strings": {"A": {"watts": 3.0}}})
+        await manager.wait_until_drained()
+
+        assert len(ws.sent) == 2
+        assert ws.sent[1]["aggregates"] == {"strings": {"C": {"watts": 2.0}}}
+
+    async def test_resync_and_reload_send_filtered_snapshots(self, manager, layout):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+        await subscribe(manager, ws, systems=["secondary"])
+
+        await manager.handle_client_message(ws, json.dumps({"type": "resync"}))
+        await manager.wait_until_drained()
+        layout.append(layout_panel("D1", 90.0, 90.0, system="secondary"))
+        await manager.broadcast(layout)
+        await manager.wait_until_drained()
+
+        resync, reload = ws.sent[-2:]
+        assert [p["display_label"] for p in resync["panels"]] == ["C1"]
+        assert [p["display_label"] for p in reload["panels"]] == ["C1", "D1"]
+        assert reload["seq"] == resync["seq"] + 1
+
+    async def test_unsubscribe_restores_full_stream(self, manager, layout):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+        await subscribe(manager, ws, strings=["B"])
+
+        await manager.handle_client_message(ws, json.dumps({"type": "unsubscribe"}))
+        await manager.broadcast_delta(layout)
+        await manager.wait_until_drained()
+
+        assert len(ws.sent[-2]["panels"]) == 4
+        assert len(ws.sent[-1]["changed"]) == 4
+        assert manager._groups == {} and manager._label_groups == {}
+
+    async def test_disconnect_drops_empty_group(self, manager):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+        await subscribe(manager, ws, strings=["A"])
+
+        manager.disconnect(ws)
+
+        assert manager._groups == {} and manager._label_groups == {}
+
+    async def test_invalid_subscription_reported_to_client(self, manager):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+
+        await subscribe(manager, ws, viewport=[0, 10])
+        await manager.wait_until_drained()
+
+        assert ws.sent == [
+            {"type": "error", "error": "invalid_subscription", "detail": ws.sent[0]["detail"]}
+        ]
+        assert manager._groups == {}
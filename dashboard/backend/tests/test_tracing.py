@@ -0,0 +1,134 @@
+"""Tests for tracing.py and the per-stage marks along the ingest-to-browser path."""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import tracing
+from app.main import app
+from app.mqtt_client import MQTTClient
+from app.mqtt_hub import MQTTHub
+from app.tracing import Trace, Tracer
+from app.websocket_manager import ConnectionManager
+
+from .test_mqtt_hub import drain, state_payload
+from .test_websocket_manager import FakeWebSocket, make_panel
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    """An enabled tracer installed as the singleton before components pick it up."""
+    fresh = Tracer(capacity=8, enabled=True)
+    monkeypatch.setattr(tracing, "_tracer", fresh)
+    return fresh
+
+
+async def until(predicate, timeout: float = 2.0) -> None:
+    async def wait():
+        while not predicate():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(wait(), timeout)
+
+
+def traced_trace(trace_id: int, *durations: float) -> Trace:
+    trace = Trace(trace_id, "taptap/primary/state", "primary", started=0.0)
+    at = 0.0
+    for stage, seconds in zip(("decode", "update_panel"), durations):
+        at += seconds
+        trace.marks.append((stage, at))
+    return trace
+
+
+class TestTracer:
+    def test_ring_buffer_keeps_most_recent(self):
+        tracer = Tracer(capacity=2)
+        for trace_id in range(1, 4):
+            tracer.finish(traced_trace(trace_id, 0.001))
+
+        assert [trace.id for trace in tracer.traces()] == [2, 3]
+        assert tracer.get_stats()["finished"] == 3
+
+    def test_slowest_and_breakdown(self):
+        tracer = Tracer()
+        tracer.finish(traced_trace(1, 0.001, 0.003))
+        tracer.finish(traced_trace(2, 0.002, 0.010))
+
+        assert [trace.id for trace in tracer.slowest(1)] == [2]
+        breakdown = tracer.breakdown()
+        assert breakdown["update_panel"]["max_ms"] == 10.0
+        assert breakdown["decode"]["count"] == 2
+        assert breakdown["decode"]["share"] == pytest.approx(0.1875)
+
+    def test_mark_without_current_trace_is_a_no_op(self):
+        tracing.mark("decode")
+        assert tracing.current() is None
+
+
+class TestPipeline:
+    async def test_state_message_traced_through_to_send(self, tracer):
+        hub = MQTTHub("broker.local")
+        manager = ConnectionManager(batch_interval_ms=10)
+
+        async def on_state(nodes, system):
+            tracing.mark("update_panel")
+            await manager.queue_update([make_panel("A1")])
+
+        client = MQTTClient(on_state=on_state, hub=hub)
+        await client.start()
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+        manager.start_background_tasks()
+        try:
+            hub.enqueue("taptap/primary/state", state_payload(1))
+            await drain(hub)
+            await until(lambda: tracer.traces())
+        finally:
+            await manager.stop_background_tasks()
+
+        trace = tracer.traces()[0]
+        assert trace.system == "primary"
+        assert [stage for stage, _ in trace.stages()] == [
+            "receive", "queue_wait", "decode", "update_panel",
+            "handoff", "batch_wait", "encode", "fanout", "send",
+        ]
+
+    async def test_message_without_broadcast_finishes_at_hub(self, tracer):
+        hub = MQTTHub("broker.local")
+        await hub.add_consumer("+/state", lambda payload, system: asyncio.sleep(0))
+        hub.enqueue("taptap/primary/state", state_payload(1))
+        await drain(hub)
+
+        assert [stage for stage, _ in tracer.traces()[0].stages()] == ["receive", "queue_wait", "decode"]
+
+    async def test_disabled_tracer_creates_no_traces(self, tracer):
+        tracer.enabled = False
+        hub = MQTTHub("broker.local")
+        await hub.add_consumer("+/state", lambda payload, system: asyncio.sleep(0))
+        hub.enqueue("taptap/primary/state", state_payload(1))
+
+        _, (_, _, trace) = await hub.lanes["primary"].queue.get()
+        assert trace is None
+        assert tracer.traces() == []
+
+
+class TestDebugRouter:
+    def test_toggle_and_read_traces(self):
+        tracer = Tracer()
+        tracer.finish(traced_trace(1, 0.001, 0.002))
+        with patch("app.debug_router.get_tracer", return_value=tracer):
+            client = TestClient(app)
+            response = client.post("/api/debug/tracing", json={"enabled": True})
+            assert response.json()["tracing"]["enabled"] is True
+            assert tracer.enabled
+
+            body = client.get("/api/debug/traces", params={"limit": 5}).json()
+            assert body["slowest"][0]["stages"] == [
+                {"stage": "decode", "ms": 1.0},
+                {"stage": "update_panel", "ms": 2.0},
+            ]
+            assert set(body["breakdown"]) == {"decode", "update_panel"}
+
+            client.delete("/api/debug/traces")
+            assert tracer.traces() == []
@@ -0,0 +1,288 @@
+"""Tests for websocket_manager.py delta protocol and per-client send queues."""
+
+import asyncio
+import json
+
+import pytest
+
+from app.models import PanelData, Position
+from app.websocket_manager import ConnectionManager, SLOW_CONSUMER_CLOSE_CODE
+
+
+class FakeWebSocket:
+    """Minimal stand-in for a Starlette WebSocket that records sent frames."""
+
+    def __init__(self, delay: float = 0.0):
+        self.client = None
+        self.accepted = False
+        self.closed_code: int | None = None
+        self.delay = delay
+        self.sent: list[dict] = []
+        self.raw: list[str] = []
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, data: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.raw.append(data)
+        self.sent.append(json.loads(data))
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        self.closed_code = code
+
+
+def make_panel(label: str, watts: float = 100.0) -> PanelData:
+    return PanelData(
+        display_label=label,
+        string=label[0],
+        system="primary",
+        sn=f"SN-{label}",
+        watts=watts,
+        voltage_in=40.0,
+        position=Position(x_percent=10.0, y_percent=10.0),
+    )
+
+
+@pytest.fixture
+def panels():
+    return [make_panel("A1"), make_panel("A2"), make_panel("B1")]
+
+
+@pytest.fixture
+async def make_manager(panels):
+    """Factory for managers whose client writer tasks are stopped after the test."""
+    managers: list[ConnectionManager] = []
+
+    def factory(**kwargs) -> ConnectionManager:
+        manager = ConnectionManager(snapshot_provider=lambda: panels, **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield factory
+    for manager in managers:
+        await manager.stop_background_tasks()
+
+
+@pytest.fixture
+def manager(make_manager):
+    return make_manager()
+
+
+class TestDeltaProtocol:
+    async def test_snapshot_sent_only_to_joining_client(self, manager, panels):
+        existing = FakeWebSocket()
+        joining = FakeWebSocket()
+        await manager.connect(existing)
+        await manager.connect(joining)
+
+        await manager.send_snapshot(joining, panels)
+        await manager.wait_until_drained()
+
+        assert existing.sent == []
+        assert len(joining.sent) == 1
+        frame = joining.sent[0]
+        assert frame["type"] == "snapshot"
+        assert frame["seq"] == 0
+        assert [p["display_label"] for p in frame["panels"]] == ["A1", "A2", "B1"]
+        # by_alias output keeps the legacy 'voltage' key (FR-M.5)
+        assert frame["panels"][0]["voltage"] == 40.0
+
+    async def test_delta_contains_only_changed_panels(self, manager, panels):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+
+        await manager.broadcast_delta([panels[1]])
+        await manager.wait_until_drained()
+
+        frame = ws.sent[0]
+        assert frame["type"] == "delta"
+        assert frame["seq"] == 1
+        assert "panels" not in frame
+        assert [p["display_label"] for p in frame["changed"]] == ["A2"]
+
+    async def test_sequence_numbers_increase_per_broadcast(self, manager, panels):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+
+        await manager.broadcast_delta([panels[0]])
+        await manager.wait_until_drained()
+        await manager.broadcast_delta([panels[2]])
+        await manager.wait_until_drained()
+        await manager.broadcast(panels)
+        await manager.wait_until_drained()
+
+        assert [f["seq"] for f in ws.sent] == [1, 2, 3]
+        assert [f["type"] for f in ws.sent] == ["delta", "delta", "snapshot"]
+
+    async def test_queue_update_collapses_repeated_panels(self, manager):
+        await manager.queue_update([make_panel("A1", 100.0)])
+        await manager.queue_update([make_panel("A1", 250.0), make_panel("B1")])
+
+        assert set(manager._pending_panels) == {"A1", "B1"}
+        assert manager._pending_panels["A1"].watts == 250.0
+
+    async def test_resync_request_sends_snapshot_to_requester(self, manager):
+        requester = FakeWebSocket()
+        other = FakeWebSocket()
+        await manager.connect(requester)
+        await manager.connect(other)
+        await manager.broadcast_delta([make_panel("A1")])
+
+        await manager.handle_client_message(requester, json.dumps({"type": "resync", "seq": 0}))
+        await manager.wait_until_drained()
+
+        assert requester.sent[-1]["type"] == "snapshot"
+        assert requester.sent[-1]["seq"] == 1
+        assert len(requester.sent[-1]["panels"]) == 3
+        assert len(other.sent) == 1
+
+    async def test_aggregates_in_snapshot_and_delta_frames(self, make_manager, panels):
+        totals = {"strings": {"A": {"watts": 200.0}}, "systems": {}}
+        manager = make_manager(aggregates_provider=lambda: totals, batch_interval_ms=20)
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+
+        await manager.send_snapshot(ws, panels)
+        await manager.queue_update([], aggregates={"strings": {"A": {"watts": 150.0}}})
+        await manager.queue_update([], aggregates={"strings": {"A": {"watts": 175.0}}})
+        manager.start_background_tasks()
+        await asyncio.sleep(0.05)
+        await manager.wait_until_drained()
+
+        assert ws.sent[0]["aggregates"] == totals
+        assert ws.sent[1]["type"] == "delta"
+        assert ws.sent[1]["changed"] == []
+        assert ws.sent[1]["aggregates"] == {"strings": {"A": {"watts": 175.0}}}
+
+    async def test_frames_omit_aggregates_when_absent(self, manager, panels):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+
+        await manager.broadcast_delta([panels[0]])
+        await manager.wait_until_drained()
+
+        assert "aggregates" not in ws.sent[0]
+
+    async def test_non_resync_messages_are_ignored(self, manager):
+        ws = FakeWebSocket()
+        await manager.connect(ws)
+
+        await manager.handle_client_message(ws, json.dumps({"type": "pong"}))
+        await manager.handle_client_message(ws, "not json")
+        await manager.wait_until_drained()
+
+        assert ws.sent == []
+
+
+class TestBroadcastFanOut:
+    async def test_same_encoded_frame_sent_to_every_client(self, manager, panels):
+        clients = [FakeWebSocket() for _ in range(3)]
+        for ws in clients:
+            await manager.connect(ws)
+
+        await manager.broadcast_delta(panels)
+        await manager.wait_until_drained()
+
+        frames = [ws.raw[0] for ws in clients]
+        assert frames[0] == frames[1] == frames[2]
+
+    async def test_slow_client_times_out_without_blocking_others(self, make_manager, panels):
+        manager = make_manager(send_timeout=0.05)
+        fast = FakeWebSocket()
+        slow = FakeWebSocket(delay=1.0)
+        await manager.connect(fast)
+        await manager.connect(slow)
+
+        await asyncio.wait_for(manager.broadcast_delta(panels), timeout=0.5)
+        await asyncio.wait_for(manager.wait_until_drained(), timeout=0.5)
+
+        assert len(fast.sent) == 1
+        assert slow not in manager.active_connections
+        assert fast in manager.active_connections
+        assert slow.closed_code == SLOW_CONSUMER_CLOSE_CODE
+
+
+class BlockedWebSocket(FakeWebSocket):
+    """Client whose sends never complete until released, like a stalled TCP peer."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def send_text(self, data: str):
+        await self.release.wait()
+        await super().send_text(data)
+
+
+class TestClientQueues:
+    async def test_broadcast_does_not_wait_for_stalled_client(self, manager, panels):
+        stalled = BlockedWebSocket()
+        await manager.connect(stalled)
+
+        # Returns immediately even though the client never drains
+        await asyncio.wait_for(manager.broadcast_delta(panels), timeout=0.1)
+        await asyncio.wait_for(manager.queue_update(panels), timeout=0.1)
+
+    async def test_overflow_coalesces_into_single_snapshot(self, make_manager, panels):
+        manager = make_manager(client_queue_size=2)
+        ws = BlockedWebSocket()
+        await manager.connect(ws)
+        await asyncio.sleep(0)
+
+        for _ in range(6):
+            await manager.broadcast_delta([panels[0]])
+
+        stats = manager.get_stats()["clients"][0]
+        assert stats["needs_snapshot"] is True
+        assert stats["frames_dropped"] > 0
+        assert stats["coalesced"] >= 1
+
+        ws.release.set()
+        await manager.wait_until_drained()
+
+        # All six deltas collapsed into one snapshot of current state
+        assert [f["type"] for f in ws.sent] == ["snapshot"]
+        assert ws.sent[-1]["seq"] == 6
+        assert len(ws.sent[-1]["panels"]) == 3
+
+    async def test_client_behind_too_long_is_evicted(self, make_manager, panels):
+        manager = make_manager(client_queue_size=1, slow_client_timeout=0.01)
+        stalled = BlockedWebSocket()
+        healthy = FakeWebSocket()
+        await manager.connect(stalled)
+        await manager.connect(healthy)
+        await asyncio.sleep(0)
+
+        await manager.broadcast_delta([panels[0]])
+        await manager.broadcast_delta([panels[0]])
+        await manager.broadcast_delta([panels[0]])
+        await asyncio.sleep(0.02)
+        await manager.broadcast_delta([panels[0]])
+        await asyncio.sleep(0.01)
+
+        assert stalled not in manager.active_connections
+        assert stalled.closed_code == SLOW_CONSUMER_CLOSE_CODE
+        assert healthy in manager.active_connections
+        assert manager.get_stats()["evicted_clients"] == 1
+
+    async def test_lagging_client_gets_one_tracked_eviction_task(self, make_manager, panels):
+        manager = make_manager(client_queue_size=1, slow_client_timeout=0.01)
+        stalled = BlockedWebSocket()
+        await manager.connect(stalled)
+        await asyncio.sleep(0)
+        await manager.broadcast_delta([panels[0]])
+        await manager.broadcast_delta([panels[0]])
+        await manager.broadcast_delta([panels[0]])
+        await asyncio.sleep(0.02)
+
+        before = set(manager._writer_tasks)
+        for _ in range(5):
+            await manager.broadcast_delta([panels[0]])
+        evictions = manager._writer_tasks - before
+
+        assert len(evictions) == 1
+        await asyncio.gather(*evictions)
+        assert stalled.closed_code == SLOW_CONSUMER_CLOSE_CODE
+        assert manager.get_stats()["evicted_clients"] == 1
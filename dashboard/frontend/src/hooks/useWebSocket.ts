@@ -31,16 +31,38 @@ export interface PanelData {
   voltage?: number | null;
 }
 
+export interface GroupAggregate {
+  watts: number;
+  kwh_today: number;
+  peak: string | null;
+  peak_watts: number | null;
+  panels: number;
+  reporting: number;
+}
+
+// Per-string and per-system totals computed by the backend on ingest
+export interface Aggregates {
+  strings: Record<string, GroupAggregate>;
+  systems: Record<string, GroupAggregate>;
+}
+
 export interface WebSocketMessage {
   timestamp: string;
-  panels: PanelData[];
-  type?: string;
+  // Full state, present on 'snapshot' frames (and legacy frames without a type)
+  panels?: PanelData[];
+  // Changed panels only, present on 'delta' frames
+  changed?: PanelData[];
+  type?: 'snapshot' | 'delta' | 'ping' | string;
+  seq?: number;
+  // All groups on snapshots, only changed groups on deltas
+  aggregates?: Partial<Aggregates>;
 }
 
 export type ConnectionStatus = 'connecting' | 'connected' | 'disconnected' | 'error';
 
 interface UseWebSocketResult {
   panels: PanelData[];
+  aggregates: Aggregates;
   status: ConnectionStatus;
   error: string | null;
   retry: () => void;
@@ -60,11 +82,26 @@ function getWebSocketUrl(): string {
 const WS_URL = getWebSocketUrl();
 const RECONNECT_DELAY = 3000;
 
+const EMPTY_AGGREGATES: Aggregates = { strings: {}, systems: {} };
+
+function mergeAggregates(current: Aggregates, update: Partial<Aggregates>): Aggregates {
+  return {
+    strings: { ...current.strings, ...update.strings },
+    systems: { ...current.systems, ...update.systems },
+  };
+}
+
 export function useWebSocket(): UseWebSocketResult {
   const [panels, setPanels] = useState<PanelData[]>([]);
+  const [aggregates, setAggregates] = useState<Aggregates>(EMPTY_AGGREGATES);
   const [status, setStatus] = useState<ConnectionStatus>('connecting');
   const [error, setError] = useState<string | null>(null);
   const wsRef = useRef<WebSocket | null>(null);
+  // Latest panel state keyed by display_label, merged from snapshots and deltas
+  const panelMapRef = useRef<Map<string, PanelData>>(new Map());
+  const lastSeqRef = useRef<number | null>(null);
+  // Set once a resync is requested; deltas are dropped until the snapshot arrives
+  const resyncPendingRef = useRef(false);
   const reconnectTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
 
   const connect = useCallback(() => {
@@ -87,6 +124,8 @@ export function useWebSocket(): UseWebSocketResult {
       wsRef.current = ws;
 
       ws.onopen = () => {
+        lastSeqRef.current = null;
+        resyncPendingRef.current = false;
         setStatus('connected');
         setError(null);
       };
@@ -101,9 +140,39 @@ export function useWebSocket(): UseWebSocketResult {
             return;
           }
 
-          // Handle panel data
+          // Delta: merge changed panels, or ask for a resync on a sequence gap
+          if (data.type === 'delta' && data.changed) {
+            if (resyncPendingRef.current) {
+              return;
+            }
+            const lastSeq = lastSeqRef.current;
+            if (lastSeq === null || data.seq !== lastSeq + 1) {
+              resyncPendingRef.current = true;
+              ws.send(JSON.stringify({ type: 'resync', seq: lastSeq }));
+              return;
+            }
+            lastSeqRef.current = data.seq;
+            const panelMap = panelMapRef.current;
+            for (const panel of data.changed) {
+              panelMap.set(panel.display_label, panel);
+            }
+            if (data.changed.length > 0) {
+              setPanels(Array.from(panelMap.values()));
+            }
+            if (data.aggregates) {
+              const update = data.aggregates;
+              setAggregates((current) => mergeAggregates(current, update));
+            }
+            return;
+          }
+
+          // Snapshot: replace all panel data
           if (data.panels) {
+            panelMapRef.current = new Map(data.panels.map((p) => [p.display_label, p]));
+            lastSeqRef.current = data.seq ?? null;
+            resyncPendingRef.current = false;
             setPanels(data.panels);
+            setAggregates(mergeAggregates(EMPTY_AGGREGATES, data.aggregates ?? {}));
           }
         } catch (e) {
           console.error('Failed to parse WebSocket message:', e);
@@ -143,5 +212,5 @@ export function useWebSocket(): UseWebSocketResult {
     };
   }, [connect]);
 
-  return { panels, status, error, retry };
+  return { panels, aggregates, status, error, retry };
 }
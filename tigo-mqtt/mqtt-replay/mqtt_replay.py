@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+MQTT Traffic Recorder and Replayer
+
+Records taptap-mqtt traffic (state, temp_nodes and node_mappings topics) to a
+compressed capture file, and republishes a capture to a broker at real time,
+10x, 100x or flat-out, optionally multiplied into synthetic extra CCAs and
+panels. Used to load-test the dashboard backend with production-shaped data.
+
+Usage:
+    # Record from the production broker until Ctrl-C (or for 1 hour)
+    python3 mqtt_replay.py record capture.ttcap --host 192.168.1.100 --duration 3600
+
+    # Replay at 10x to a local broker, as 4 CCAs with 3x the panels each
+    python3 mqtt_replay.py replay capture.ttcap --host localhost --speed 10 --ccas 4 --panels 3
+
+    # Replay as fast as the broker accepts, looping 5 times with fresh timestamps
+    python3 mqtt_replay.py replay capture.ttcap --speed max --loop 5 --fresh-timestamps
+
+    # Write a panels.yaml matching the synthetic CCAs and panel copies
+    python3 mqtt_replay.py panels capture.ttcap panels.yaml --ccas 4 --panels 3
+
+    # Summarize a capture
+    python3 mqtt_replay.py info capture.ttcap
+
+The dashboard matches readings to panels by serial, so multiplied copies
+(serials "<serial>-N", labels "<label>~N", CCAs "<system>-N") are dropped as
+unknown unless its panels.yaml lists them. Generate one with the ``panels``
+subcommand using the same --ccas/--panels as the replay; positions are left
+out so the dashboard lays the panels out on a grid.
+
+Capture format: gzip stream starting with the line "TTCAP1", then one JSON
+header line, then binary records of
+    <uint32 ms since start> <uint8 flags> <uint16 topic length> <uint32 payload length>
+followed by the topic and raw payload bytes. Flag bit 0 is the retain flag.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import re
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, NamedTuple
+
+MAGIC = b"TTCAP1\n"
+RECORD_HEADER = struct.Struct("<IBHI")
+FLAG_RETAIN = 0x01
+TOPICS = ("state", "temp_nodes", "node_mappings")
+
+# Synthetic node IDs are offset per copy so they never collide with real ones
+NODE_ID_STRIDE = 1000
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
+
+class Record(NamedTuple):
+    offset_ms: int
+    topic: str
+    payload: bytes
+    retain: bool
+
+
+def write_header(f: BinaryIO, prefix: str, host: str) -> None:
+    """Write the magic line and JSON header to a new capture."""
+    header = {
+        "prefix": prefix,
+        "source": host,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+    }
+    f.write(MAGIC)
+    f.write(json.dumps(header).encode() + b"\n")
+
+
+def write_record(f: BinaryIO, record: Record) -> None:
+    topic = record.topic.encode()
+    flags = FLAG_RETAIN if record.retain else 0
+    f.write(RECORD_HEADER.pack(record.offset_ms, flags, len(topic), len(record.payload)))
+    f.write(topic)
+    f.write(record.payload)
+
+
+def read_capture(path: str) -> tuple[dict, Iterator[Record]]:
+    """Open a capture and return its header and a record iterator.
+
+    A truncated final record (recorder killed mid-write) ends iteration.
+    """
+    f = gzip.open(path, "rb")
+    if f.readline() != MAGIC:
+        f.close()
+        raise ValueError(f"{path} is not a taptap capture file")
+    header = json.loads(f.readline())
+
+    def records() -> Iterator[Record]:
+        with f:
+            while True:
+                try:
+                    raw = f.read(RECORD_HEADER.size)
+                    if len(raw) < RECORD_HEADER.size:
+                        return
+                    offset_ms, flags, topic_len, payload_len = RECORD_HEADER.unpack(raw)
+                    topic = f.read(topic_len)
+                    payload = f.read(payload_len)
+                except EOFError:
+                    return
+                if len(topic) < topic_len or len(payload) < payload_len:
+                    return
+                yield Record(offset_ms, topic.decode(), payload, bool(flags & FLAG_RETAIN))
+
+    return header, records()
+
+
+def system_names(system: str, ccas: int) -> list[str]:
+    """The recorded system plus synthetic copies, e.g. primary, primary-2, primary-3."""
+    return [system] + [f"{system}-{i}" for i in range(2, ccas + 1)]
+
+
+def clone_serial(serial: str, copy: int) -> str:
+    return serial if copy == 0 else f"{serial}-{copy}"
+
+
+def clone_label(label: str, copy: int) -> str:
+    return label if copy == 0 else f"{label}~{copy}"
+
+
+def clone_node_id(node_id, copy: int):
+    """Offset a numeric node ID for a copy, keeping its type; other IDs pass through."""
+    if copy == 0 or node_id is None:
+        return node_id
+    try:
+        cloned = int(node_id) + copy * NODE_ID_STRIDE
+    except (TypeError, ValueError):
+        return node_id
+    return cloned if isinstance(node_id, int) else str(cloned)
+
+
+def multiply_payload(kind: str, payload: bytes, cca_index: int, panels: int, fresh_ts: str | None) -> bytes:
+    """Expand one payload into ``panels`` copies of every node for synthetic CCA ``cca_index``.
+
+    Copies get unique labels, serials and node IDs; CCA copies beyond the
+    first are offset too, so every synthetic panel is distinct.
+    """
+    if panels == 1 and cca_index == 0 and fresh_ts is None:
+        return payload
+    data = json.loads(payload)
+    copies = [cca_index * panels + i for i in range(panels)]
+
+    if kind == "state" and isinstance(data.get("nodes"), dict):
+        nodes = {}
+        for label, node in data["nodes"].items():
+            for copy in copies:
+                clone = dict(node) if isinstance(node, dict) else node
+                if isinstance(clone, dict):
+                    if "node_serial" in clone:
+                        clone["node_serial"] = clone_serial(clone["node_serial"], copy)
+                    if "node_id" in clone:
+                        clone["node_id"] = clone_node_id(clone["node_id"], copy)
+                    if "node_name" in clone:
+                        clone["node_name"] = clone_label(clone["node_name"], copy)
+                    if fresh_ts is not None and "timestamp" in clone:
+                        clone["timestamp"] = fresh_ts
+                nodes[clone_label(label, copy)] = clone
+        data["nodes"] = nodes
+    elif kind == "node_mappings" and isinstance(data, dict):
+        data = {
+            clone_node_id(node_id, copy): clone_serial(serial, copy)
+            for node_id, serial in data.items()
+            for copy in copies
+        }
+    elif kind == "temp_nodes" and isinstance(data, list):
+        data = [clone_node_id(n, copy) for n in data for copy in copies]
+    return json.dumps(data).encode()
+
+
+def capture_nodes(records: Iterator[Record]) -> dict[str, dict[str, str]]:
+    """Collect ``{system: {label: serial}}`` from the state messages in a capture."""
+    systems: dict[str, dict[str, str]] = {}
+    for rec in records:
+        parts = rec.topic.split("/")
+        if len(parts) < 3 or parts[-1] != "state":
+            continue
+        try:
+            nodes = json.loads(rec.payload).get("nodes")
+        except (ValueError, AttributeError):
+            continue
+        if not isinstance(nodes, dict):
+            continue
+        labels = systems.setdefault(parts[-2], {})
+        for label, node in nodes.items():
+            if isinstance(node, dict) and node.get("node_serial"):
+                labels[label] = node["node_serial"]
+    return systems
+
+
+def synthetic_panels(systems: dict[str, dict[str, str]], ccas: int, panels: int) -> list[dict]:
+    """Panel config entries for every node a replay with ``ccas``/``panels`` publishes.
+
+    Serials, labels and CCA names follow ``multiply_payload`` and
+    ``system_names``; the string is the letter prefix of the recorded label.
+    """
+    entries = []
+    for system, labels in sorted(systems.items()):
+        for cca_index, name in enumerate(system_names(system, ccas)):
+            for copy in range(cca_index * panels, (cca_index + 1) * panels):
+                for label, serial in sorted(labels.items()):
+                    match = re.match(r"[A-Za-z]+", label)
+                    entries.append({
+                        "serial": clone_serial(serial, copy),
+                        "cca": name,
+                        "string": match.group().upper() if match else label,
+                        "tigo_label": clone_label(label, copy),
+                        "display_label": clone_label(label, copy),
+                    })
+    return entries
+
+
+def write_panels_yaml(f, entries: list[dict]) -> None:
+    """Write entries in the dashboard's panels.yaml format (JSON-quoted scalars are valid YAML)."""
+    f.write("# Generated by mqtt_replay.py panels for synthetic replay traffic\n")
+    f.write("panels:\n")
+    for entry in entries:
+        first = True
+        for key, value in entry.items():
+            f.write(f"  {'- ' if first else '  '}{key}: {json.dumps(value)}\n")
+            first = False
+    f.write("translations: {}\n")
+
+
+async def record(args: argparse.Namespace) -> None:
+    """Subscribe to taptap topics and append every message to the capture."""
+    import aiomqtt
+
+    count = 0
+    raw_bytes = 0
+    started = time.monotonic()
+
+    with gzip.open(args.capture, "wb", compresslevel=args.compresslevel) as f:
+        write_header(f, args.prefix, args.host)
+        try:
+            async with aiomqtt.Client(
+                hostname=args.host, port=args.port, username=args.user, password=args.password,
+            ) as client:
+                for kind in TOPICS:
+                    await client.subscribe(f"{args.prefix}/+/{kind}")
+                logger.info(f"Recording {args.prefix}/+/{{{','.join(TOPICS)}}} from {args.host}:{args.port}")
+
+                last_log = started
+                async with asyncio.timeout(args.duration):
+                    async for message in client.messages:
+                        now = time.monotonic()
+                        payload = message.payload
+                        if isinstance(payload, str):
+                            payload = payload.encode()
+                        write_record(f, Record(
+                            int((now - started) * 1000), str(message.topic), bytes(payload), bool(message.retain),
+                        ))
+                        count += 1
+                        raw_bytes += len(payload)
+                        if now - last_log >= 60:
+                            logger.info(f"Recorded {count} messages ({raw_bytes / 1e6:.1f} MB raw)")
+                            last_log = now
+        except TimeoutError:
+            pass
+        finally:
+            logger.info(f"Recorded {count} messages ({raw_bytes / 1e6:.1f} MB raw) to {args.capture}")
+
+
+async def replay(args: argparse.Namespace) -> None:
+    """Republish a capture, scaled in time and optionally multiplied."""
+    import aiomqtt
+
+    speed = None if args.speed == "max" else float(args.speed)
+    header, _ = read_capture(args.capture)
+    prefix = args.prefix or header["prefix"]
+    logger.info(
+        f"Replaying {args.capture} (recorded {header['started_at']}) to {args.host}:{args.port} "
+        f"at {'max' if speed is None else f'{speed:g}x'}, {args.ccas} CCA(s) per system, "
+        f"{args.panels}x panels"
+    )
+
+    published = 0
+    behind_ms = 0.0
+    async with aiomqtt.Client(
+        hostname=args.host, port=args.port, username=args.user, password=args.password,
+    ) as client:
+        started = time.monotonic()
+        for loop in range(args.loop):
+            _, records = read_capture(args.capture)
+            loop_start = time.monotonic()
+            for rec in records:
+                if speed is not None:
+                    due = loop_start + rec.offset_ms / 1000 / speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    else:
+                        behind_ms = max(behind_ms, -delay * 1000)
+
+                parts = rec.topic.split("/")
+                if len(parts) < 3 or parts[-1] not in TOPICS:
+                    continue
+                system, kind = parts[-2], parts[-1]
+                fresh_ts = datetime.now(timezone.utc).isoformat() if args.fresh_timestamps else None
+                for cca_index, name in enumerate(system_names(system, args.ccas)):
+                    payload = multiply_payload(kind, rec.payload, cca_index, args.panels, fresh_ts)
+                    await client.publish(f"{prefix}/{name}/{kind}", payload, retain=rec.retain and not args.no_retain)
+                    published += 1
+            logger.info(f"Loop {loop + 1}/{args.loop} done, {published} messages published")
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Published {published} messages in {elapsed:.1f}s ({published / max(elapsed, 1e-9):.0f} msg/s), "
+        f"max {behind_ms:.0f}ms behind schedule"
+    )
+
+
+def info(args: argparse.Namespace) -> None:
+    """Print a capture's header and per-topic message counts."""
+    header, records = read_capture(args.capture)
+    counts: dict[str, int] = {}
+    sizes: dict[str, int] = {}
+    last_ms = 0
+    for rec in records:
+        counts[rec.topic] = counts.get(rec.topic, 0) + 1
+        sizes[rec.topic] = sizes.get(rec.topic, 0) + len(rec.payload)
+        last_ms = rec.offset_ms
+    print(json.dumps(header, indent=2))
+    print(f"Duration: {last_ms / 1000:.1f}s")
+    for topic in sorted(counts):
+        print(f"  {topic:<40} {counts[topic]:>8} msgs  {sizes[topic] / counts[topic]:>10,.0f} B avg")
+
+
+def panels_config(args: argparse.Namespace) -> None:
+    """Write a panels.yaml listing every panel a multiplied replay publishes."""
+    _, records = read_capture(args.capture)
+    entries = synthetic_panels(capture_nodes(records), args.ccas, args.panels)
+    with open(args.output, "w") as f:
+        write_panels_yaml(f, entries)
+    logger.info(f"Wrote {len(entries)} panels to {args.output}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def broker_args(p: argparse.ArgumentParser) -> None:
+        p.add_argument("capture", help="Capture file path")
+        p.add_argument("--host", default="localhost", help="MQTT broker host (default: localhost)")
+        p.add_argument("--port", type=int, default=1883, help="MQTT broker port (default: 1883)")
+        p.add_argument("--user", help="MQTT username")
+        p.add_argument("--password", help="MQTT password")
+
+    rec = sub.add_parser("record", help="Record taptap traffic to a capture file")
+    broker_args(rec)
+    rec.add_argument("--prefix", default="taptap", help="Topic prefix (default: taptap)")
+    rec.add_argument("--duration", type=float, help="Stop after this many seconds (default: until Ctrl-C)")
+    rec.add_argument("--compresslevel", type=int, default=6, help="gzip level 1-9 (default: 6)")
+
+    rep = sub.add_parser("replay", help="Republish a capture file")
+    broker_args(rep)
+    rep.add_argument("--prefix", help="Topic prefix to publish under (default: the recorded one)")
+    rep.add_argument("--speed", default="1", help="Playback speed: 1, 10, 100, ... or max (default: 1)")
+    rep.add_argument("--ccas", type=int, default=1, help="CCAs to publish per recorded system (default: 1)")
+    rep.add_argument("--panels", type=int, default=1, help="Copies of every node per CCA (default: 1)")
+    rep.add_argument("--loop", type=int, default=1, help="Times to replay the capture (default: 1)")
+    rep.add_argument("--fresh-timestamps", action="store_true",
+                     help="Rewrite node timestamps to the replay time so readings are not repeats")
+    rep.add_argument("--no-retain", action="store_true", help="Publish without the retain flag")
+
+    pan = sub.add_parser("panels", help="Write a panels.yaml matching a multiplied replay")
+    pan.add_argument("capture", help="Capture file path")
+    pan.add_argument("output", help="panels.yaml path to write")
+    pan.add_argument("--ccas", type=int, default=1, help="CCAs per recorded system, as for replay (default: 1)")
+    pan.add_argument("--panels", type=int, default=1, help="Copies of every node per CCA, as for replay (default: 1)")
+
+    inf = sub.add_parser("info", help="Summarize a capture file")
+    inf.add_argument("capture", help="Capture file path")
+
+    args = parser.parse_args()
+    if args.command in ("replay", "panels") and (args.ccas < 1 or args.panels < 1):
+        parser.error("--ccas and --panels must be at least 1")
+    if args.command == "replay":
+        if args.speed != "max":
+            try:
+                if float(args.speed) <= 0:
+                    raise ValueError
+            except ValueError:
+                parser.error("--speed must be a positive number or 'max'")
+        if args.loop < 1:
+            parser.error("--loop must be at least 1")
+
+    try:
+        if args.command == "record":
+            asyncio.run(record(args))
+        elif args.command == "replay":
+            asyncio.run(replay(args))
+        elif args.command == "panels":
+            panels_config(args)
+        else:
+            info(args)
+    except KeyboardInterrupt:
+        logger.info("Interrupted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Tests for mqtt_replay.py capture files, replay and payload multiplication.
+
+Run from this directory with ``python -m pytest -q``.
+"""
+
+import argparse
+import asyncio
+import gzip
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+
+import mqtt_replay
+from mqtt_replay import Record, multiply_payload, read_capture, write_header, write_record
+
+STATE = {
+    "nodes": {
+        "A1": {"node_serial": "4-C3F23CR", "node_id": "12", "node_name": "A1", "power": 310.0,
+               "timestamp": "2026-01-01T12:00:00"},
+        "B2": {"node_serial": "4-C3F277H", "node_id": "13", "node_name": "B2", "power": 290.0,
+               "timestamp": "2026-01-01T12:00:00"},
+    }
+}
+
+
+def make_args(**kwargs) -> argparse.Namespace:
+    defaults = dict(host="broker", port=1883, user=None, password=None, prefix="taptap", duration=None,
+                    compresslevel=6, speed="max", ccas=1, panels=1, loop=1, fresh_timestamps=False,
+                    no_retain=False)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+class FakeMessage:
+    def __init__(self, topic: str, payload: bytes, retain: bool = False):
+        self.topic = topic
+        self.payload = payload
+        self.retain = retain
+
+
+class FakeClient:
+    """Stand-in for aiomqtt.Client that yields canned messages and records publishes."""
+
+    incoming: list[FakeMessage] = []
+    published: list[tuple[str, bytes, bool]] = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def subscribe(self, topic: str):
+        pass
+
+    async def publish(self, topic: str, payload: bytes, retain: bool = False):
+        FakeClient.published.append((topic, payload, retain))
+
+    @property
+    async def messages(self):
+        for message in FakeClient.incoming:
+            yield message
+        # Like a live broker, stay subscribed until the duration runs out
+        await asyncio.sleep(3600)
+
+
+@pytest.fixture
+def fake_mqtt():
+    aiomqtt = pytest.importorskip("aiomqtt")
+    FakeClient.incoming = []
+    FakeClient.published = []
+    with patch.object(aiomqtt, "Client", FakeClient):
+        yield FakeClient
+
+
+class TestCaptureFormat:
+    def test_record_then_replay_round_trip(self, tmp_path, fake_mqtt):
+        capture = str(tmp_path / "capture.ttcap")
+        fake_mqtt.incoming = [
+            FakeMessage("taptap/primary/state", json.dumps(STATE).encode()),
+            FakeMessage("taptap/primary/temp_nodes", b"[12]", retain=True),
+            FakeMessage("taptap/primary/node_mappings", b'{"12": "4-C3F23CR"}', retain=True),
+        ]
+        asyncio.run(mqtt_replay.record(make_args(capture=capture, duration=0.2)))
+
+        header, records = read_capture(capture)
+        assert header["prefix"] == "taptap"
+        assert [r.topic for r in records] == [m.topic for m in fake_mqtt.incoming]
+
+        asyncio.run(mqtt_replay.replay(make_args(capture=capture, prefix=None)))
+        assert fake_mqtt.published == [(m.topic, m.payload, m.retain) for m in fake_mqtt.incoming]
+
+    def test_truncated_final_record_ends_iteration(self, tmp_path):
+        path = tmp_path / "capture.ttcap"
+        with gzip.open(path, "wb") as f:
+            write_header(f, "taptap", "broker")
+            write_record(f, Record(0, "taptap/primary/state", b'{"nodes": {}}', False))
+            write_record(f, Record(10, "taptap/primary/temp_nodes", b"[1, 2, 3]", True))
+        data = gzip.decompress(path.read_bytes())
+        # Recorder killed after writing half of the last payload
+        path.write_bytes(gzip.compress(data[:-4]))
+
+        _, records = read_capture(str(path))
+        assert [r.topic for r in records] == ["taptap/primary/state"]
+
+    def test_rejects_files_without_magic(self, tmp_path):
+        path = tmp_path / "capture.ttcap"
+        path.write_bytes(gzip.compress(b"not a capture\n"))
+        with pytest.raises(ValueError):
+            read_capture(str(path))
+
+
+class TestMultiplyPayload:
+    def test_state_copies_get_distinct_labels_serials_and_node_ids(self):
+        data = json.loads(multiply_payload("state", json.dumps(STATE).encode(), 1, 2, None))
+
+        assert sorted(data["nodes"]) == ["A1~2", "A1~3", "B2~2", "B2~3"]
+        clone = data["nodes"]["A1~3"]
+        assert clone["node_serial"] == "4-C3F23CR-3"
+        assert clone["node_id"] == "3012"
+        assert clone["node_name"] == "A1~3"
+
+    def test_first_copy_of_first_cca_is_unchanged(self):
+        payload = json.dumps(STATE).encode()
+        assert multiply_payload("state", payload, 0, 1, None) is payload
+        data = json.loads(multiply_payload("state", payload, 0, 2, None))
+        assert data["nodes"]["A1"] == STATE["nodes"]["A1"]
+
+    def test_fresh_timestamps_rewrite_every_node(self):
+        data = json.loads(multiply_payload("state", json.dumps(STATE).encode(), 0, 1, "2026-06-01T00:00:00"))
+        assert {n["timestamp"] for n in data["nodes"].values()} == {"2026-06-01T00:00:00"}
+
+    def test_node_mappings_and_temp_nodes_follow_node_ids(self):
+        mappings = json.loads(multiply_payload("node_mappings", b'{"12": "4-C3F23CR"}', 0, 2, None))
+        assert mappings == {"12": "4-C3F23CR", "1012": "4-C3F23CR-1"}
+
+        temp = json.loads(multiply_payload("temp_nodes", b"[12, 13]", 0, 2, None))
+        assert temp == [12, 1012, 13, 1013]
+
+    def test_non_numeric_node_ids_pass_through(self):
+        temp = json.loads(multiply_payload("temp_nodes", b'[12, "gw"]', 0, 2, None))
+        assert temp == [12, 1012, "gw", "gw"]
+
+
+class TestPanelsConfig:
+    def test_config_lists_every_replayed_panel(self, tmp_path):
+        yaml = pytest.importorskip("yaml")
+        records = iter([
+            Record(0, "taptap/primary/state", json.dumps(STATE).encode(), False),
+            Record(5, "taptap/primary/temp_nodes", b"[12]", False),
+        ])
+        entries = mqtt_replay.synthetic_panels(mqtt_replay.capture_nodes(records), ccas=2, panels=2)
+        out = io.StringIO()
+        mqtt_replay.write_panels_yaml(out, entries)
+        config = yaml.safe_load(out.getvalue())
+
+        published = {}
+        for cca_index, name in enumerate(mqtt_replay.system_names("primary", 2)):
+            payload = multiply_payload("state", json.dumps(STATE).encode(), cca_index, 2, None)
+            for label, node in json.loads(payload)["nodes"].items():
+                published[node["node_serial"]] = (name, label)
+
+        panels = {p["serial"]: (p["cca"], p["tigo_label"]) for p in config["panels"]}
+        assert panels == published
+        assert {p["string"] for p in config["panels"]} == {"A", "B"}
+        assert config["translations"] == {}